@@ -1,10 +1,33 @@
 import requests
+from urllib3.util.retry import Retry
 
 from .rws_requests import RWSRequest, make_url
 from .rwsobjects import RWSException, RWSError, RWSErrorResponse, RWSPostErrorResponse
-
+from .cache import CACHE_BYPASS, CACHE_REFRESH, CachedResponse
+from .timing import (
+    RequestTiming,
+    TimedHTTPAdapter,
+    get_connect_time,
+    reset_connect_time,
+    time_decoding,
+    reset_decode_time,
+    get_decode_time,
+)
+
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import hashlib
+import io
+import os
+import tempfile
+import threading
 import time
 
+# Size of the chunks read from streamed responses
+DEFAULT_CHUNK_SIZE = 64 * 1024
+
+# Content encodings requested for responses
+ACCEPT_ENCODING = "gzip, deflate"
+
 # -------------------------------------------------------------------------------------------------------
 # Classes
 
@@ -15,6 +38,321 @@ class AuthorizationException(Exception):
     pass
 
 
+def resolve_domain(domain):
+    """
+    Expand a Rave URL Name to a URL, domains that do not start with http are assumed to be a mdsol.com sub-domain
+
+    :param str domain: Rave URL Name
+    :rtype: str
+    """
+    if domain.lower().startswith("http"):
+        return domain
+    return "https://%s.mdsol.com" % domain
+
+
+def check_response(request_object, r):
+    """
+    Raise the appropriate exception if the response from RWS is an error
+
+    :param rwslib.rws_requests.RWSRequest request_object: Request that was sent
+    :param requests.models.Response r: Response from RWS
+    :raises RWSException: if RWS returned an error
+    :raises AuthorizationException: if the request required an authorization header that was not provided
+    """
+    if r.status_code in [400, 404]:
+        # Is it a RWS response?
+        if r.text.startswith("<Response"):
+            error = RWSErrorResponse(r.text) if request_object.method == "GET" else RWSPostErrorResponse(r.text)
+            raise RWSException(error.errordescription, error)
+        elif "<html" in r.text:
+            raise RWSException("IIS Error", r.text)
+        else:
+            error = RWSError(r.text)
+        raise RWSException(error.errordescription, error)
+
+    elif r.status_code == 500:
+        raise RWSException("Server Error (500)", r.text)
+
+    elif r.status_code == 401:
+        # Either you didn't supply auth header and it was required OR your credentials were wrong
+        # RWS handles each differently
+
+        # You didn't supply auth (text response from RWS)
+        if r.text == "Authorization Header not provided":
+            raise AuthorizationException(r.text)
+
+        if "HTTP Error 401.0 - Unauthorized" in r.text:
+            raise RWSException("Unauthorized.", r.text)
+
+        # Check if the content_type is text/xml.  Use startswith
+        # in case the charset is also specified:
+        #  content-type: text/xml; charset=utf-8
+        if r.headers.get("content-type").startswith("text/xml"):
+            # XML response
+            if r.text.startswith("<Response"):
+                error = RWSErrorResponse(r.text) if request_object.method == "GET" else RWSPostErrorResponse(r.text)
+            elif "ODM" in r.text:
+                error = RWSError(r.text)
+        else:
+            # There was some problem with your credentials (XML response from RWS)
+            error = RWSErrorResponse(r.text)
+        raise RWSException(error.errordescription, error)
+
+    # Catch all.
+    if r.status_code != 200:
+        if "<" in r.text:
+            # XML like
+            if r.text.strip().startswith("<Response"):
+                error = RWSErrorResponse(r.text) if request_object.method == "GET" else RWSPostErrorResponse(r.text)
+            elif "ODM" in r.text:
+                error = RWSError(r.text)
+            else:
+                # IIS error page as an example
+                raise RWSException(
+                    "Unexpected Status Code ({0.status_code})".format(r), r.text
+                )
+        else:
+            # not XML like, better to be safe than blow up
+            # example response: 'HTTP 503 Service Temporarily Unavailable'
+            raise RWSException(
+                "Unexpected Status Code ({0.status_code})".format(r), r.text
+            )
+        raise RWSException(error.errordescription, error)
+
+
+class RWSCall(object):
+    """
+    The outcome of a single call to RWS.
+
+    Unlike the ``last_result`` and ``request_time`` attributes of :class:`RWSConnection` an RWSCall belongs to
+    one request, so it can be relied on when a connection is shared between threads.
+    """
+
+    def __init__(self, request_object, url):
+        """
+        :param rwslib.rws_requests.RWSRequest request_object: Request that was sent
+        :param str url: Full URL called
+        """
+        self.request = request_object
+        self.url = url
+        self.response = None  # type: requests.models.Response
+        self.request_time = None
+        self.result = None
+        # Set by send_requests when the call raised rather than returning a result
+        self.exception = None
+        # True if the response came from the connection's cache rather than RWS
+        self.from_cache = False
+        # True if the response was shared with an identical call already in flight
+        self.shared = False
+        # Number of times the request was retried by the connection's retry policy
+        self.retries = 0
+        # When the call was made (or queued by send_requests)
+        self.queued_at = time.time()
+        # Per-phase timings, recorded when the connection has observers
+        self.timing = None  # type: rwslib.timing.RequestTiming
+
+    @property
+    def status_code(self):
+        """HTTP status code of the response, if one was received"""
+        return self.response.status_code if self.response is not None else None
+
+    @property
+    def links(self):
+        """Parsed Link headers of the response (e.g. `next` for paginated datasets)"""
+        return self.response.links if self.response is not None else {}
+
+
+class RWSResponseStream(io.RawIOBase):
+    """
+    A read-only file-like view of a streamed response body, passed to ``RWSRequest.stream_result``.
+
+    Content encodings (gzip or deflate, see ``content_encoding``) are decoded incrementally as the body is read. Close
+    the stream once it has been consumed to release the connection back to the pool.
+    """
+
+    def __init__(self, response, chunk_size=DEFAULT_CHUNK_SIZE):
+        """
+        :param requests.models.Response response: Response opened with stream=True
+        :param int chunk_size: Default size of chunks for iter_chunks
+        """
+        io.RawIOBase.__init__(self)
+        self.response = response
+        self.chunk_size = chunk_size
+        # Count of decoded bytes read so far
+        self.bytes_read = 0
+        # Encoding of the body on the wire (e.g. gzip), None if it was not encoded
+        self.content_encoding = response.headers.get("Content-Encoding")
+
+    @property
+    def bytes_received(self):
+        """Count of bytes read from the network so far, before decoding"""
+        try:
+            return self.response.raw.tell()
+        except AttributeError:
+            return self.bytes_read
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        data = self.response.raw.read(len(b), decode_content=True)
+        n = len(data)
+        b[:n] = data
+        self.bytes_read += n
+        return n
+
+    def iter_chunks(self, chunk_size=None):
+        """
+        Iterate over the body in chunks of bytes
+
+        :param int chunk_size: Maximum size of each chunk, defaults to the stream's chunk_size
+        """
+        chunk_size = chunk_size or self.chunk_size
+        while True:
+            chunk = self.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+
+    def close(self):
+        if not self.closed:
+            self.response.close()
+        io.RawIOBase.close(self)
+
+
+class RWSDownload(object):
+    """Describes a response body written to a sink by ``send_request(..., sink=...)``"""
+
+    def __init__(self, path, bytes_written, elapsed, checksum):
+        """
+        :param str path: Path of the file written (None when the sink was a file-like object)
+        :param int bytes_written: Number of bytes written
+        :param float elapsed: Seconds from sending the request to writing the last byte
+        :param str checksum: Hex SHA-256 digest of the bytes written
+        """
+        self.path = path
+        self.bytes_written = bytes_written
+        self.elapsed = elapsed
+        self.checksum = checksum
+
+    def __repr__(self):
+        return "RWSDownload(path=%r, bytes_written=%d, elapsed=%.3f, checksum=%r)" % (
+            self.path,
+            self.bytes_written,
+            self.elapsed,
+            self.checksum,
+        )
+
+
+def write_to_sink(stream, sink, start_time):
+    """
+    Copy a response stream to a sink, computing a checksum as it goes.
+
+    When the sink is a path the body is written to a temporary file in the same directory which is renamed into
+    place once complete, so a partial download never replaces an existing file.
+
+    :param RWSResponseStream stream: Response body
+    :param sink: Path to write to, or a writable file-like object
+    :param float start_time: Time the request was started
+    :rtype: RWSDownload
+    """
+    digest = hashlib.sha256()
+
+    def copy(fileobj):
+        for chunk in stream.iter_chunks():
+            digest.update(chunk)
+            fileobj.write(chunk)
+        return stream.bytes_read
+
+    if hasattr(sink, "write"):
+        bytes_written = copy(sink)
+        path = None
+    else:
+        path = os.fspath(sink)
+        directory, filename = os.path.split(os.path.abspath(path))
+        fd, temp_path = tempfile.mkstemp(dir=directory, prefix=".%s." % filename, suffix=".part")
+        try:
+            with os.fdopen(fd, "wb") as fh:
+                bytes_written = copy(fh)
+            os.replace(temp_path, path)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+    return RWSDownload(path, bytes_written, time.time() - start_time, digest.hexdigest())
+
+
+def _freeze(value):
+    """A hashable equivalent of a value, e.g. of the keyword arguments of a call, for comparing calls"""
+    if isinstance(value, dict):
+        return tuple(sorted(((repr(k), _freeze(v)) for k, v in value.items()), key=lambda item: item[0]))
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(v) for v in value)
+    if isinstance(value, (set, frozenset)):
+        return tuple(sorted(repr(v) for v in value))
+    try:
+        hash(value)
+    except TypeError:
+        return repr(value)
+    return value
+
+
+class SingleFlight(object):
+    """
+    Lets concurrent calls with the same key share one execution.
+
+    The first caller for a key runs the function; callers arriving while it is running wait and are given its return
+    value (or its exception) rather than running the function again.
+    """
+
+    class _Flight(object):
+        def __init__(self):
+            self.done = threading.Event()
+            self.value = None
+            self.exception = None
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights = {}
+        # Number of callers that were given the result of another caller's execution
+        self.shared = 0
+
+    def __len__(self):
+        return len(self._flights)
+
+    def do(self, key, fn):
+        """
+        Run fn, unless a call with the same key is already running in which case wait for its result
+
+        :param key: Hashable key identifying the call
+        :param fn: Function of no arguments to run
+        :return: Return value of fn and whether it was shared from another caller
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = self._Flight()
+            else:
+                self.shared += 1
+
+        if leader:
+            try:
+                flight.value = fn()
+            except BaseException as exc:
+                flight.exception = exc
+                raise
+            finally:
+                with self._lock:
+                    del self._flights[key]
+                flight.done.set()
+            return flight.value, False
+
+        flight.done.wait()
+        if flight.exception is not None:
+            raise flight.exception
+        return flight.value, True
+
+
 class RWSConnection(object):
     """A connection to RWS"""
 
@@ -25,6 +363,14 @@ class RWSConnection(object):
         password=None,
         auth=None,
         virtual_dir="RaveWebServices",
+        pool_connections=10,
+        pool_maxsize=10,
+        cache=None,
+        single_flight=False,
+        retry_policy=None,
+        rate_limiter=None,
+        concurrency=None,
+        observers=None,
     ):
         """
         Create a connection to Rave
@@ -34,6 +380,16 @@ class RWSConnection(object):
         :param str password: Rave User password
         :param str auth: Authentication tuple (usually something like `(username, password)`
         :param str virtual_dir: Name of the Rave Web Services prefix (usually `RaveWebServices`, but can be customised)
+        :param int pool_connections: Number of host connection pools to cache
+        :param int pool_maxsize: Maximum number of connections to keep alive in each pool
+        :param rwslib.cache.ResponseCache cache: Cache for responses to slow-changing requests (e.g. study versions)
+        :param bool single_flight: Share one call to RWS between identical GET requests made concurrently from
+            several threads
+        :param rwslib.retry.RetryPolicy retry_policy: Policy for retrying responses that show Rave is temporarily
+            overloaded (e.g. 503 Service Temporarily Unavailable)
+        :param rwslib.throttle.TokenBucket rate_limiter: Limit on the rate requests are sent to Rave
+        :param rwslib.throttle.AIMDController concurrency: Adaptive limit on the number of requests in flight
+        :param list observers: rwslib.timing.RequestObserver instances to be given per-phase timings of every call
 
         .. note::
             If the `domain` does not start with http then it is assumed to be the name of the Medidata
@@ -44,10 +400,7 @@ class RWSConnection(object):
 
         """
 
-        if domain.lower().startswith("http"):
-            self.domain = domain
-        else:
-            self.domain = "https://%s.mdsol.com" % domain
+        self.domain = resolve_domain(domain)
 
         self.auth = None
         if auth is not None:
@@ -58,11 +411,122 @@ class RWSConnection(object):
 
         self.base_url = make_url(self.domain, virtual_dir)
 
-        # Keep track of results of last request so users can get if they need.
-        self.last_result = None
+        # Results of the last request and the time taken are kept per-thread so users can get them if they need.
+        # Use execute() to get these details for a specific call.
+        self._local = threading.local()
 
-        # Time taken to process last request
-        self.request_time = None
+        # HTTP sessions live as long as the connection so that TCP/TLS connections are kept alive
+        # between calls. Keyed by retry count since retries are a property of the mounted adapter.
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self._sessions = {}
+        self._sessions_lock = threading.Lock()
+
+        self.cache = cache
+
+        self.single_flight = SingleFlight() if single_flight else None
+
+        self.retry_policy = retry_policy
+
+        # Client-side throttling, applied to every attempt (including retries)
+        self.rate_limiter = rate_limiter
+        self.concurrency = concurrency
+
+        self.observers = list(observers or [])
+
+    @property
+    def last_result(self):
+        """Response of the last request made by the current thread"""
+        return getattr(self._local, "last_result", None)
+
+    @last_result.setter
+    def last_result(self, value):
+        self._local.last_result = value
+
+    @property
+    def request_time(self):
+        """Time taken to process the last request made by the current thread"""
+        return getattr(self._local, "request_time", None)
+
+    @request_time.setter
+    def request_time(self, value):
+        self._local.request_time = value
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        """Close the pooled HTTP sessions held by this connection"""
+        with self._sessions_lock:
+            sessions = list(self._sessions.values())
+            self._sessions.clear()
+        for session in sessions:
+            session.close()
+
+    def _get_session(self, retries):
+        """
+        Get the pooled session for a retry count, creating it on first use
+
+        :param int retries: Number of retries for failed connections
+        :rtype: requests.Session
+        """
+        with self._sessions_lock:
+            session = self._sessions.get(retries)
+            if session is None:
+                session = requests.Session()
+                # Only ask for the encodings that RWSResponseStream is known to decode incrementally, whatever
+                # optional decoders (e.g. brotli) happen to be installed
+                session.headers["Accept-Encoding"] = ACCEPT_ENCODING
+                max_retries = retries
+                if self.retry_policy is not None:
+                    # Responses asking us to wait (Retry-After) are left to the retry policy, failed connections and
+                    # reads are still retried as without one
+                    max_retries = Retry(
+                        retries, redirect=None, status=0, respect_retry_after_header=False
+                    )
+                # Mount a custom adapter that retries failed connections for HTTP and HTTPS requests.
+                for scheme in ["http://", "https://"]:
+                    session.mount(
+                        scheme,
+                        TimedHTTPAdapter(
+                            pool_connections=self.pool_connections,
+                            pool_maxsize=self.pool_maxsize,
+                            max_retries=max_retries,
+                        ),
+                    )
+                self._sessions[retries] = session
+            return session
+
+    def _auth_identity(self):
+        """
+        A stable fingerprint of the credentials of this connection, so that cached responses are only given to
+        connections with the same credentials, including those of other processes sharing a DiskCache.
+
+        Auth objects can provide their own as a ``cache_identity`` attribute. Otherwise the user name and password
+        (of a tuple or of objects such as requests.auth.HTTPBasicAuth) or the MAuth app UUID and private key are
+        hashed.
+
+        :return: The fingerprint, an empty string without auth or None if the credentials cannot be fingerprinted
+        :rtype: str
+        """
+        auth = self.auth
+        if auth is None:
+            return ""
+        if isinstance(auth, tuple):
+            parts = ("password",) + auth
+        elif getattr(auth, "cache_identity", None) is not None:
+            parts = ("identity", type(auth).__name__, auth.cache_identity)
+        elif getattr(auth, "username", None) is not None and getattr(auth, "password", None) is not None:
+            parts = ("password", auth.username, auth.password)
+        elif getattr(auth, "app_uuid", None) and getattr(auth, "private_key_data", None):
+            parts = ("mauth", auth.app_uuid, auth.private_key_data)
+        else:
+            return None
+        raw = "\n".join(p.decode("utf-8") if isinstance(p, bytes) else str(p) for p in parts)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
 
     def send_request(self, request_object, timeout=None, retries=1, **kwargs):
         """Send request to RWS endpoint. The request object passed provides the URL endpoint and the HTTP method.
@@ -70,109 +534,317 @@ class RWSConnection(object):
            object to return text, an XML document object, a CSV file or anything else that can be generated from the text
            response from RWS.
            A timeout, in seconds, can be optionally passed into send_request.
+
+        :param rwslib.rws_requests.RWSRequest request_object: Request to send
+        :param int timeout: Timeout in seconds
+        :param int retries: Number of retries for failed connections
+        :param bool stream: If True the body is not read into memory; the request object's ``stream_result`` is passed
+            an RWSResponseStream to consume instead of ``result`` being passed the response.
+        :param sink: A file path or writable file-like object to stream the body straight to; an RWSDownload
+            describing what was written is returned.
+        :param str cache_control: ``rwslib.cache.CACHE_BYPASS`` to neither use nor update the connection's cache,
+            ``rwslib.cache.CACHE_REFRESH`` to fetch from RWS and replace any cached response.
+        """
+        return self.execute(
+            request_object, timeout=timeout, retries=retries, **kwargs
+        ).result
+
+    def execute(self, request_object, timeout=None, retries=1, **kwargs):
+        """Send request to RWS endpoint as for send_request, returning an RWSCall that holds the result along with
+           the response and timing for this specific call.
+
+        :rtype: RWSCall
+        """
+        call = RWSCall(request_object, None)
+        self._send(call, timeout=timeout, retries=retries, **kwargs)
+        return call
+
+    def send_requests(
+        self, request_objects, max_workers=4, ordered=True, timeout=None, retries=1, **kwargs
+    ):
+        """Send many requests concurrently over the connection pool, yielding an RWSCall for each.
+
+           Exceptions raised by a request are captured in the ``exception`` attribute of its RWSCall rather than
+           stopping the batch.
+
+        :param request_objects: Iterable of RWSRequest instances
+        :param int max_workers: Maximum number of requests in flight at once
+        :param bool ordered: Yield calls in the order of `request_objects` (True) or as they complete (False)
+        :param int timeout: Timeout, in seconds, for each request
+        :param int retries: Number of retries for failed connections
+
+        .. note::
+            To reuse connections between calls ``pool_maxsize`` for the connection should be at least `max_workers`
+        """
+        executor = ThreadPoolExecutor(max_workers=max_workers)
+        futures = [
+            executor.submit(
+                self._execute_captured,
+                RWSCall(request_object, None),
+                timeout=timeout,
+                retries=retries,
+                **kwargs
+            )
+            for request_object in request_objects
+        ]
+        try:
+            for future in futures if ordered else as_completed(futures):
+                yield future.result()
+        finally:
+            # Don't start outstanding requests if the caller stops iterating early
+            for future in futures:
+                future.cancel()
+            executor.shutdown(wait=True)
+
+    def _execute_captured(self, call, **kwargs):
+        """Variant of execute that records exceptions on the returned RWSCall"""
+        try:
+            self._send(call, **kwargs)
+        except Exception as exc:
+            call.exception = exc
+        return call
+
+    def _send(self, call, **kwargs):
+        """
+        Send the request for a call, filling in the response, timing and result, and tell the observers about it
+
+        :param RWSCall call: Call to make
+        """
+        if not self.observers:
+            return self._send_call(call, **kwargs)
+
+        call.timing = RequestTiming(call.request, started=call.queued_at)
+        try:
+            self._send_call(call, **kwargs)
+        except Exception as exc:
+            call.timing.finish(exc)
+            self._notify(call.timing)
+            raise
+        call.timing.finish()
+        self._notify(call.timing)
+
+    def _notify(self, timing):
+        for observer in self.observers:
+            observer.on_request(timing)
+
+    def _send_call(
+        self,
+        call,
+        timeout=None,
+        retries=1,
+        stream=False,
+        sink=None,
+        cache_control=None,
+        **kwargs
+    ):
         """
+        Send the request for a call, filling in the response, timing and result
+
+        :param RWSCall call: Call to make
+        """
+        stream = stream or sink is not None
+        request_object = call.request
         if not isinstance(request_object, RWSRequest):
             raise ValueError("Request object must be a subclass of RWSRequest")
 
         # Construct a URL from the object and make a call
         full_url = make_url(self.base_url, request_object.url_path())
+        call.url = full_url
+        timing = call.timing
+        if timing is not None:
+            timing.url = full_url
+
+        cache_key = None
+        identity = self._auth_identity()
+        if (
+            self.cache is not None
+            and identity is not None
+            and not stream
+            and cache_control != CACHE_BYPASS
+            and self.cache.policy.is_cacheable(request_object)
+        ):
+            cache_key = self.cache.make_key(request_object.method, full_url, identity)
+            if cache_control != CACHE_REFRESH:
+                entry = self.cache.get(cache_key)
+                if entry is not None:
+                    r = entry.to_response()
+                    call.from_cache = True
+                    call.request_time = 0.0
+                    call.response = r
+                    self.request_time = call.request_time
+                    self.last_result = r
+                    if timing is not None:
+                        timing.from_cache = True
+                        timing.status_code = r.status_code
+                        timing.content_bytes = entry.size
+                    self._build_result(call, r)
+                    return
+
+        if (
+            self.single_flight is not None
+            and not stream
+            and request_object.method == "GET"
+        ):
+            # Identical GETs already in flight on other threads share one call to RWS
+            key = (
+                request_object.method,
+                full_url,
+                # Calls are only shared while both are in flight, so the auth object itself will do if need be
+                identity if identity is not None else id(self.auth),
+                type(request_object),
+                _freeze(kwargs),
+            )
+            leader, shared = self.single_flight.do(
+                key,
+                lambda: self._fetch(
+                    call, timeout, retries, stream, sink, cache_key, **kwargs
+                ),
+            )
+            if shared:
+                # Only the response is shared: each call builds its own result from it, as for a cached response,
+                # since results may be mutable or readable only once (e.g. a lazy RWSSubjectsStream)
+                call.shared = True
+                call.request_time = leader.request_time
+                call.response = leader.response
+                self.request_time = call.request_time
+                self.last_result = call.response
+                if timing is not None:
+                    timing.shared = True
+                    timing.status_code = call.status_code
+                self._build_result(call, call.response)
+        else:
+            self._fetch(call, timeout, retries, stream, sink, cache_key, **kwargs)
+
+    def _fetch(self, call, timeout, retries, stream, sink, cache_key, **kwargs):
+        """
+        Make the HTTP request for a call and process the response
+
+        :param RWSCall call: Call to make, with its URL filled in
+        :return: The call
+        """
+        request_object = call.request
+        full_url = call.url
         if request_object.requires_authorization:
             kwargs["auth"] = self.auth
             # TODO: Look at different connect and read timeouts?
             kwargs["timeout"] = timeout
             kwargs.update(request_object.args())
+        timing = call.timing
+        if timing is not None:
+            timing.compression = getattr(request_object, "compression", None)
 
         # Explicit use of requests library here. Could alter in future to inject library to use in case
         # requests not available.
 
-        # Get a session that allows us to customize HTTP requests
-        session = requests.Session()
-
-        # Mount a custom adapter that retries failed connections for HTTP and HTTPS requests.
-        for scheme in ["http://", "https://"]:
-            session.mount(scheme, requests.adapters.HTTPAdapter(max_retries=retries))
+        # Get the pooled session that allows us to customize HTTP requests
+        session = self._get_session(retries)
 
         action = {"GET": session.get, "POST": session.post}[request_object.method]
 
         start_time = time.time()
 
-        try:
-            r = action(full_url, **kwargs)  # type: requests.models.Response
-        except (
-            requests.exceptions.ConnectTimeout,
-            requests.exceptions.ReadTimeout,
-        ) as exc:
-            if isinstance(exc, (requests.exceptions.ConnectTimeout,)):
-                raise RWSException(
-                    "Server Connection Timeout",
-                    "Connection timeout for {}".format(full_url),
-                )
-            elif isinstance(exc, (requests.exceptions.ReadTimeout,)):
-                raise RWSException(
-                    "Server Read Timeout", "Read timeout for {}".format(full_url)
-                )
-
-        self.request_time = time.time() - start_time
-        self.last_result = r  # see also r.elapsed for timedelta object.
-
-        if r.status_code in [400, 404]:
-            # Is it a RWS response?
-            if r.text.startswith("<Response"):
-                error = RWSErrorResponse(r.text) if request_object.method == "GET" else RWSPostErrorResponse(r.text)
-                raise RWSException(error.errordescription, error)
-            elif "<html" in r.text:
-                raise RWSException("IIS Error", r.text)
-            else:
-                error = RWSError(r.text)
-            raise RWSException(error.errordescription, error)
-
-        elif r.status_code == 500:
-            raise RWSException("Server Error (500)", r.text)
-
-        elif r.status_code == 401:
-            # Either you didn't supply auth header and it was required OR your credentials were wrong
-            # RWS handles each differently
-
-            # You didn't supply auth (text response from RWS)
-            if r.text == "Authorization Header not provided":
-                raise AuthorizationException(r.text)
-
-            if "HTTP Error 401.0 - Unauthorized" in r.text:
-                raise RWSException("Unauthorized.", r.text)
-
-            # Check if the content_type is text/xml.  Use startswith
-            # in case the charset is also specified:
-            #  content-type: text/xml; charset=utf-8
-            if r.headers.get("content-type").startswith("text/xml"):
-                # XML response
-                if r.text.startswith("<Response"):
-                    error = RWSErrorResponse(r.text) if request_object.method == "GET" else RWSPostErrorResponse(r.text)
-                elif "ODM" in r.text:
-                    error = RWSError(r.text)
-            else:
-                # There was some problem with your credentials (XML response from RWS)
-                error = RWSErrorResponse(r.text)
-            raise RWSException(error.errordescription, error)
-
-        # Catch all.
-        if r.status_code != 200:
-            if "<" in r.text:
-                # XML like
-                if r.text.strip().startswith("<Response"):
-                    error = RWSErrorResponse(r.text) if request_object.method == "GET" else RWSPostErrorResponse(r.text)
-                elif "ODM" in r.text:
-                    error = RWSError(r.text)
-                else:
-                    # IIS error page as an example
+        while True:
+            if self.rate_limiter is not None:
+                self.rate_limiter.acquire()
+            if self.concurrency is not None:
+                token = self.concurrency.acquire()
+            attempt_start = time.time()
+            reset_connect_time()
+            failed = True
+            try:
+                r = action(full_url, stream=stream, **kwargs)  # type: requests.models.Response
+                failed = r.status_code >= 500 or r.status_code == 429
+            except (
+                requests.exceptions.ConnectTimeout,
+                requests.exceptions.ReadTimeout,
+            ) as exc:
+                if isinstance(exc, (requests.exceptions.ConnectTimeout,)):
                     raise RWSException(
-                        "Unexpected Status Code ({0.status_code})".format(r), r.text
+                        "Server Connection Timeout",
+                        "Connection timeout for {}".format(full_url),
                     )
-            else:
-                # not XML like, better to be safe than blow up
-                # example response: 'HTTP 503 Service Temporarily Unavailable'
-                raise RWSException(
-                    "Unexpected Status Code ({0.status_code})".format(r), r.text
+                elif isinstance(exc, (requests.exceptions.ReadTimeout,)):
+                    raise RWSException(
+                        "Server Read Timeout", "Read timeout for {}".format(full_url)
+                    )
+            finally:
+                if self.concurrency is not None:
+                    self.concurrency.release(
+                        time.time() - attempt_start, failed, token
+                    )
+            if timing is not None:
+                timing.add_attempt(attempt_start, time.time(), r, get_connect_time())
+
+            if self.retry_policy is None or not self.retry_policy.should_retry(
+                request_object, r, call.retries
+            ):
+                break
+            # Release the connection before waiting to try again
+            r.close()
+            wait_start = time.time()
+            self.retry_policy.wait(call.retries, r)
+            call.retries += 1
+            if timing is not None:
+                timing.retry_wait += time.time() - wait_start
+                timing.retries = call.retries
+
+        call.request_time = time.time() - start_time
+        call.response = r  # see also r.elapsed for timedelta object.
+        self.request_time = call.request_time
+        self.last_result = r
+
+        if stream and r.status_code != 200:
+            # Error responses are small, read them so they can be classified as normal
+            r.content
+            r.close()
+        if timing is not None and (not stream or r.status_code != 200):
+            timing.add_sizes(r)
+
+        check_response(request_object, r)
+
+        if sink is not None:
+            sink_start = time.time()
+            with RWSResponseStream(r) as response_stream:
+                call.result = write_to_sink(response_stream, sink, start_time)
+            if timing is not None:
+                timing.download += time.time() - sink_start
+                timing.content_bytes = call.result.bytes_written
+                timing.bytes_received = response_stream.bytes_received
+        elif stream:
+            result_start = time.time()
+            response_stream = RWSResponseStream(r)
+            try:
+                call.result = request_object.stream_result(response_stream)
+            finally:
+                # Release the connection unless the stream, or a result reading from it, was handed back to be consumed
+                if call.result is not response_stream and getattr(call.result, "source", None) is not response_stream:
+                    response_stream.close()
+            if timing is not None:
+                # Reading and parsing a stream are interleaved, so both count as building the result
+                timing.result += time.time() - result_start
+                timing.content_bytes = response_stream.bytes_read
+                timing.bytes_received = response_stream.bytes_received
+        else:
+            if cache_key is not None:
+                self.cache.set(
+                    cache_key,
+                    CachedResponse.from_response(r, self.cache.policy.ttl(request_object)),
                 )
-            raise RWSException(error.errordescription, error)
-
-        return request_object.result(r)
+            self._build_result(call, r)
+        return call
+
+    @staticmethod
+    def _build_result(call, r):
+        """Have the request object process the response, timing decoding and building the result"""
+        timing = call.timing
+        if timing is None:
+            call.result = call.request.result(r)
+            return
+        time_decoding(r)
+        reset_decode_time()
+        start = time.time()
+        call.result = call.request.result(r)
+        elapsed = time.time() - start
+        decode = get_decode_time()
+        timing.decode += decode
+        timing.result += max(0.0, elapsed - decode)
@@ -0,0 +1,411 @@
+"""
+An asyncio counterpart to RWSConnection.
+
+AsyncRWSConnection has the same contract as RWSConnection: request objects provide the URL endpoint and HTTP method
+and their ``result()`` method processes the response. Requests are prepared with the requests library, so the same
+auth objects can be used, and sent over asyncio streams which are kept alive between calls.
+
+An AsyncRWSConnection should be used from a single event loop.
+"""
+import asyncio
+import datetime
+import ssl
+import time
+import zlib
+
+import requests
+from requests.structures import CaseInsensitiveDict
+from six.moves.urllib_parse import urlsplit
+
+from rwslib import RWSCall, check_response, resolve_domain
+from rwslib.retry import is_idempotent
+from rwslib.rws_requests import RWSRequest, make_url
+from rwslib.rwsobjects import RWSException
+
+DEFAULT_PORTS = {"http": 80, "https": 443}
+
+
+class _ConnectionClosed(ConnectionError):
+    """Raised when the server closes a connection before sending a whole response, or sends one that can't be read"""
+
+    pass
+
+
+class _ConnectionPool(object):
+    """Idle keep-alive stream connections, keyed by scheme, host and port"""
+
+    def __init__(self, maxsize):
+        """
+        :param int maxsize: Maximum number of idle connections to keep per host
+        """
+        self.maxsize = maxsize
+        self._idle = {}
+        self._ssl_context = None
+
+    async def get(self, key, timeout=None):
+        """
+        Get a connection to a host, reusing an idle one if available
+
+        :param tuple key: (scheme, host, port)
+        :param float timeout: Connection timeout in seconds
+        :return: reader, writer and whether the connection was reused
+        """
+        idle = self._idle.get(key, [])
+        while idle:
+            reader, writer = idle.pop()
+            if not reader.at_eof() and not writer.is_closing():
+                return reader, writer, True
+            writer.close()
+
+        scheme, host, port = key
+        ssl_context = None
+        if scheme == "https":
+            if self._ssl_context is None:
+                self._ssl_context = ssl.create_default_context()
+            ssl_context = self._ssl_context
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_connection(host, port, ssl=ssl_context), timeout
+        )
+        return reader, writer, False
+
+    def put(self, key, reader, writer):
+        """Return a connection to the pool once a response has been read"""
+        idle = self._idle.setdefault(key, [])
+        if len(idle) < self.maxsize:
+            idle.append((reader, writer))
+        else:
+            writer.close()
+
+    def close(self):
+        """Close all idle connections"""
+        for idle in self._idle.values():
+            for _, writer in idle:
+                writer.close()
+        self._idle.clear()
+
+
+async def _read_body(reader, headers):
+    """
+    Read a response body framed by Transfer-Encoding or Content-Length
+
+    :return: body and whether the connection can be reused
+    """
+    if headers.get("transfer-encoding", "").lower() == "chunked":
+        chunks = []
+        while True:
+            size = int((await reader.readline()).split(b";")[0].strip(), 16)
+            if size == 0:
+                # Skip trailers
+                while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                    pass
+                break
+            chunks.append(await reader.readexactly(size))
+            await reader.readexactly(2)
+        return b"".join(chunks), True
+    if "content-length" in headers:
+        return await reader.readexactly(int(headers["content-length"])), True
+    # Delimited by the server closing the connection
+    return await reader.read(), False
+
+
+def _decode_content(content, headers):
+    """Undo any Content-Encoding applied by the server"""
+    encoding = headers.get("content-encoding", "").lower()
+    if encoding == "gzip":
+        return zlib.decompress(content, 16 + zlib.MAX_WBITS)
+    if encoding == "deflate":
+        try:
+            return zlib.decompress(content)
+        except zlib.error:
+            # Some servers send raw deflate streams without the zlib header
+            return zlib.decompress(content, -zlib.MAX_WBITS)
+    return content
+
+
+async def _exchange(reader, writer, prepared):
+    """
+    Write a prepared request and read the response
+
+    :param requests.PreparedRequest prepared: Request to send
+    :return: status, reason, headers, body, keep_alive
+    """
+    parts = urlsplit(prepared.url)
+    body = prepared.body
+    if isinstance(body, str):
+        body = body.encode("utf-8")
+
+    head = ["%s %s HTTP/1.1" % (prepared.method, prepared.path_url), "Host: %s" % parts.netloc]
+    for name, value in prepared.headers.items():
+        if name.lower() != "content-length":
+            head.append("%s: %s" % (name, value))
+    if body is None or isinstance(body, bytes):
+        if body is not None or prepared.method == "POST":
+            head.append("Content-Length: %d" % len(body or b""))
+        writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1"))
+        if body:
+            writer.write(body)
+    else:
+        # Iterable bodies are sent chunked
+        head.append("Transfer-Encoding: chunked")
+        writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1"))
+        for chunk in body:
+            if isinstance(chunk, str):
+                chunk = chunk.encode("utf-8")
+            if chunk:
+                writer.write(b"%x\r\n%s\r\n" % (len(chunk), chunk))
+                await writer.drain()
+        writer.write(b"0\r\n\r\n")
+    await writer.drain()
+
+    try:
+        return await _read_response(reader)
+    except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ValueError, zlib.error) as exc:
+        # Truncated (e.g. a connection reset part way through the body) or malformed
+        raise _ConnectionClosed("Incomplete or malformed response: %s" % exc)
+
+
+async def _read_response(reader):
+    """
+    Read a response
+
+    :return: status, reason, headers, body, keep_alive
+    """
+    status_line = await reader.readline()
+    if not status_line:
+        raise _ConnectionClosed("Connection closed before response")
+    version, status, reason = (status_line.decode("latin-1").rstrip("\r\n").split(" ", 2) + [""])[:3]
+
+    headers = CaseInsensitiveDict()
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        name, value = name.strip(), value.strip()
+        # Repeated headers (e.g. Link) are combined as requests does
+        headers[name] = "%s, %s" % (headers[name], value) if name in headers else value
+
+    status = int(status)
+    if 100 <= status < 200 or status in (204, 304):
+        content, keep_alive = b"", True
+    else:
+        content, keep_alive = await _read_body(reader, headers)
+    keep_alive = (
+        keep_alive
+        and version == "HTTP/1.1"
+        and headers.get("connection", "").lower() != "close"
+    )
+    return status, reason, headers, _decode_content(content, headers), keep_alive
+
+
+def _make_response(prepared, status, reason, headers, content, elapsed):
+    """Wrap the parts of an HTTP response in a requests Response so that RWSRequest.result() can process it"""
+    response = requests.models.Response()
+    response.status_code = status
+    response.reason = reason
+    response.headers = headers
+    response.url = prepared.url
+    response.request = prepared
+    response.encoding = requests.utils.get_encoding_from_headers(headers)
+    response.elapsed = datetime.timedelta(seconds=elapsed)
+    # The body has already been read, so set it as requests does once content is consumed
+    response._content = content
+    response._content_consumed = True
+    return response
+
+
+class AsyncRWSConnection(object):
+    """
+    An asyncio connection to RWS
+
+    Requests are sent by a minimal HTTP/1.1 client on asyncio streams rather than by requests, so unlike
+    RWSConnection:
+
+    * proxies are not used (``HTTP_PROXY``, ``HTTPS_PROXY`` and ``NO_PROXY`` are ignored)
+    * HTTPS certificates are always checked against the system's default CA certificates (``verify``,
+      ``REQUESTS_CA_BUNDLE`` and client certificates are not supported)
+    * a request is only sent again on a new connection if it is idempotent, when a kept-alive connection is dropped
+      before its whole response arrives; otherwise a dropped connection or a malformed response is raised as an
+      RWSException
+    """
+
+    def __init__(
+        self,
+        domain,
+        username=None,
+        password=None,
+        auth=None,
+        virtual_dir="RaveWebServices",
+        max_concurrency=10,
+        pool_maxsize=10,
+    ):
+        """
+        Create an asyncio connection to Rave
+
+        :param str domain: Rave URL Name
+        :param str username: Rave User Login
+        :param str password: Rave User password
+        :param str auth: Authentication tuple (usually something like `(username, password)`
+        :param str virtual_dir: Name of the Rave Web Services prefix (usually `RaveWebServices`, but can be customised)
+        :param int max_concurrency: Maximum number of requests in flight at once
+        :param int pool_maxsize: Maximum number of idle connections to keep alive per host
+        """
+        self.domain = resolve_domain(domain)
+
+        self.auth = None
+        if auth is not None:
+            self.auth = auth
+        elif username is not None and password is not None:
+            # Make a basic auth
+            self.auth = (username, password)
+
+        self.base_url = make_url(self.domain, virtual_dir)
+        self.max_concurrency = max_concurrency
+
+        self._pool = _ConnectionPool(pool_maxsize)
+        # Created on first use so that it belongs to the running event loop
+        self._semaphore = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+    async def close(self):
+        """Close the idle connections held by this connection"""
+        self._pool.close()
+
+    async def send_request(self, request_object, timeout=None, **kwargs):
+        """Send request to RWS endpoint, returning the output of the request object's ``result()``.
+           A timeout, in seconds, can be optionally passed into send_request.
+        """
+        call = await self.execute(request_object, timeout=timeout, **kwargs)
+        return call.result
+
+    async def execute(self, request_object, timeout=None, **kwargs):
+        """Send request to RWS endpoint as for send_request, returning an RWSCall that holds the result along with
+           the response and timing for this specific call.
+
+        :rtype: rwslib.RWSCall
+        """
+        call = RWSCall(request_object, None)
+        await self._send(call, timeout=timeout, **kwargs)
+        return call
+
+    async def send_requests(self, request_objects, ordered=True, timeout=None, **kwargs):
+        """Send many requests concurrently (up to `max_concurrency` at once), yielding an RWSCall for each.
+
+           Exceptions raised by a request are captured in the ``exception`` attribute of its RWSCall rather than
+           stopping the batch.
+
+        :param request_objects: Iterable of RWSRequest instances
+        :param bool ordered: Yield calls in the order of `request_objects` (True) or as they complete (False)
+        :param int timeout: Timeout, in seconds, for each request
+        """
+
+        async def captured(request_object):
+            call = RWSCall(request_object, None)
+            try:
+                await self._send(call, timeout=timeout, **kwargs)
+            except Exception as exc:
+                call.exception = exc
+            return call
+
+        tasks = [asyncio.ensure_future(captured(r)) for r in request_objects]
+        try:
+            for task in tasks if ordered else asyncio.as_completed(tasks):
+                yield await task
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def _send(self, call, timeout=None, **kwargs):
+        """
+        Send the request for a call, filling in the response, timing and result
+
+        :param rwslib.RWSCall call: Call to make
+        """
+        request_object = call.request
+        if not isinstance(request_object, RWSRequest):
+            raise ValueError("Request object must be a subclass of RWSRequest")
+
+        full_url = make_url(self.base_url, request_object.url_path())
+        call.url = full_url
+        if request_object.requires_authorization:
+            kwargs["auth"] = self.auth
+            kwargs.update(request_object.args())
+
+        # Only advertise the content encodings that are decoded here
+        headers = requests.utils.default_headers()
+        headers["Accept-Encoding"] = "gzip, deflate"
+        headers.update(kwargs.pop("headers", None) or {})
+        prepared = requests.Request(
+            request_object.method, full_url, headers=headers, **kwargs
+        ).prepare()
+
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async with self._semaphore:
+            start_time = time.time()
+            status, reason, r_headers, content = await self._request(
+                prepared, timeout, is_idempotent(request_object)
+            )
+            call.request_time = time.time() - start_time
+
+        r = _make_response(prepared, status, reason, r_headers, content, call.request_time)
+        call.response = r
+
+        check_response(request_object, r)
+
+        call.result = request_object.result(r)
+
+    async def _request(self, prepared, timeout, idempotent=True):
+        """
+        Send a prepared request over a pooled connection, trying again on a new connection if an idle connection had
+        gone stale
+
+        :param requests.PreparedRequest prepared: Request to send
+        :param float timeout: Timeout in seconds
+        :param bool idempotent: Can the request be sent again? If not (e.g. a POST of clinical data) a connection
+            dropped before the response is raised, as the server may have processed the request
+        """
+        parts = urlsplit(prepared.url)
+        scheme = parts.scheme.lower()
+        key = (scheme, parts.hostname, parts.port or DEFAULT_PORTS[scheme])
+
+        while True:
+            try:
+                reader, writer, reused = await self._pool.get(key, timeout)
+            except asyncio.TimeoutError:
+                raise RWSException(
+                    "Server Connection Timeout",
+                    "Connection timeout for {}".format(prepared.url),
+                )
+            try:
+                status, reason, headers, content, keep_alive = await asyncio.wait_for(
+                    _exchange(reader, writer, prepared), timeout
+                )
+            except asyncio.TimeoutError:
+                writer.close()
+                raise RWSException(
+                    "Server Read Timeout", "Read timeout for {}".format(prepared.url)
+                )
+            except ConnectionError as exc:
+                writer.close()
+                if reused and idempotent:
+                    # The server dropped an idle connection, try again on a new one
+                    continue
+                raise RWSException(
+                    "Server Connection Error", "Connection error for {}: {}".format(prepared.url, exc)
+                )
+            except BaseException:
+                writer.close()
+                raise
+
+            if keep_alive:
+                self._pool.put(key, reader, writer)
+            else:
+                writer.close()
+            return status, reason, headers, content
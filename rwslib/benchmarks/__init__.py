@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmarks of rwslib's hot paths, with JSON baselines to catch regressions.
+
+Run from the command line, saving a baseline and later comparing against it::
+
+    python -m rwslib.benchmarks --save baseline.json
+    python -m rwslib.benchmarks --compare baseline.json --threshold 0.2
+
+The comparison exits with status 1 if the throughput of any benchmark falls by more than the threshold.
+Baselines are specific to the machine they were recorded on.
+"""
+from rwslib.benchmarks.runner import (
+    BENCHMARKS,
+    Benchmark,
+    BenchmarkResult,
+    Regression,
+    Workload,
+    benchmark,
+    compare,
+    load_results,
+    main,
+    run_benchmarks,
+    save_results,
+)
+from rwslib.benchmarks import suite  # noqa: F401 registers the benchmarks
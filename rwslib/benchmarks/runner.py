@@ -0,0 +1,316 @@
+# -*- coding: utf-8 -*-
+"""
+Running benchmarks, recording their results and comparing them with a baseline.
+
+A benchmark is a function that takes a scale factor and returns a :class:`Workload`: a callable doing a fixed amount
+of work and the number of units (subjects, events, bytes...) it processes. The callable is run once to warm up and
+then timed ``repeat`` times; throughput is reported from the fastest run, which is the least disturbed by anything
+else happening on the machine.
+"""
+import collections
+import json
+import platform
+import statistics
+import sys
+import time
+
+# Benchmarks by name, in the order they were registered
+BENCHMARKS = collections.OrderedDict()
+
+# Version of the results file format
+RESULTS_VERSION = 1
+
+# Fall in throughput, as a fraction of the baseline, that counts as a regression
+DEFAULT_THRESHOLD = 0.2
+
+
+class Workload(object):
+    """Work to be timed"""
+
+    def __init__(self, run, items, close=None):
+        """
+        :param callable run: Does the work, called with no arguments
+        :param int items: Number of units processed by each call of run
+        :param callable close: Called with no arguments once timing is finished, to release resources
+        """
+        self.run = run
+        self.items = items
+        self.close = close
+
+
+class Benchmark(object):
+    """A named, registered benchmark"""
+
+    def __init__(self, name, setup, units, description=None):
+        """
+        :param str name: Name of the benchmark, used as its key in results
+        :param callable setup: Called with the scale factor, returns a :class:`Workload`
+        :param str units: What the items of a workload are, e.g. subjects
+        :param str description: What is measured
+        """
+        self.name = name
+        self.setup = setup
+        self.units = units
+        self.description = description
+
+    def __call__(self, scale=1.0, repeat=5):
+        """
+        Time the benchmark
+
+        :param float scale: Factor applied to the size of the workload
+        :param int repeat: Number of timed runs
+        :rtype: BenchmarkResult
+        """
+        workload = self.setup(scale)
+        try:
+            workload.run()
+            timings = []
+            for _ in range(max(1, repeat)):
+                start = time.perf_counter()
+                workload.run()
+                timings.append(time.perf_counter() - start)
+        finally:
+            if workload.close is not None:
+                workload.close()
+        return BenchmarkResult(self.name, self.units, workload.items, timings)
+
+
+def benchmark(name, units, description=None):
+    """
+    Decorator registering a setup function as a benchmark
+
+    :param str name: Name of the benchmark
+    :param str units: What the items of its workload are
+    :param str description: What is measured, defaults to the first line of the function's docstring
+    """
+
+    def register(setup):
+        doc = description or (setup.__doc__ or "").strip().split("\n")[0]
+        BENCHMARKS[name] = Benchmark(name, setup, units, doc)
+        return setup
+
+    return register
+
+
+class BenchmarkResult(object):
+    """Timings of a benchmark"""
+
+    def __init__(self, name, units, items, timings):
+        """
+        :param str name: Name of the benchmark
+        :param str units: What the items are
+        :param int items: Units processed by each run
+        :param list(float) timings: Seconds taken by each run
+        """
+        self.name = name
+        self.units = units
+        self.items = items
+        self.timings = list(timings)
+
+    @property
+    def best(self):
+        """Seconds taken by the fastest run"""
+        return min(self.timings)
+
+    @property
+    def median(self):
+        """Median seconds taken by a run"""
+        return statistics.median(self.timings)
+
+    @property
+    def throughput(self):
+        """Units processed per second by the fastest run"""
+        return self.items / self.best if self.best > 0 else float("inf")
+
+    def to_dict(self):
+        return dict(
+            units=self.units,
+            items=self.items,
+            best=self.best,
+            median=self.median,
+            throughput=self.throughput,
+            timings=self.timings,
+        )
+
+    @classmethod
+    def from_dict(cls, name, data):
+        return cls(name, data["units"], data["items"], data["timings"])
+
+    def __str__(self):
+        return "%-28s %14.1f %s/s  (best %.4fs, median %.4fs, %d runs)" % (
+            self.name,
+            self.throughput,
+            self.units,
+            self.best,
+            self.median,
+            len(self.timings),
+        )
+
+
+class Regression(object):
+    """A benchmark whose throughput fell too far below its baseline"""
+
+    def __init__(self, name, baseline, current):
+        """
+        :param str name: Name of the benchmark
+        :param float baseline: Throughput of the baseline
+        :param float current: Throughput measured
+        """
+        self.name = name
+        self.baseline = baseline
+        self.current = current
+
+    @property
+    def change(self):
+        """Change in throughput as a fraction of the baseline, negative for a slowdown"""
+        return self.current / self.baseline - 1.0
+
+    def __str__(self):
+        return "%s: %.1f/s against a baseline of %.1f/s (%+.1f%%)" % (
+            self.name,
+            self.current,
+            self.baseline,
+            self.change * 100,
+        )
+
+
+def run_benchmarks(names=None, scale=1.0, repeat=5, report=None):
+    """
+    Run registered benchmarks
+
+    :param list(str) names: Names of the benchmarks to run, all of them if None
+    :param float scale: Factor applied to the size of every workload
+    :param int repeat: Number of timed runs of each benchmark
+    :param callable report: Called with each BenchmarkResult as it is produced
+    :return: Results by benchmark name
+    :rtype: collections.OrderedDict
+    """
+    if names is None:
+        names = list(BENCHMARKS)
+    unknown = [name for name in names if name not in BENCHMARKS]
+    if unknown:
+        raise ValueError("Unknown benchmarks: %s" % ", ".join(unknown))
+    results = collections.OrderedDict()
+    for name in names:
+        result = BENCHMARKS[name](scale=scale, repeat=repeat)
+        results[name] = result
+        if report is not None:
+            report(result)
+    return results
+
+
+def scaled(count, scale):
+    """Size of a workload scaled by a factor, at least 1"""
+    return max(1, int(round(count * scale)))
+
+
+def save_results(path, results, scale=1.0):
+    """
+    Save results as JSON, e.g. as a baseline
+
+    :param str path: File to write
+    :param dict results: BenchmarkResults by name, as returned by run_benchmarks
+    :param float scale: Scale the benchmarks were run at
+    """
+    data = dict(
+        version=RESULTS_VERSION,
+        python=platform.python_version(),
+        platform=platform.platform(),
+        scale=scale,
+        results=collections.OrderedDict((name, result.to_dict()) for name, result in results.items()),
+    )
+    with open(path, "w") as f:
+        json.dump(data, f, indent=2)
+        f.write("\n")
+
+
+def load_results(path):
+    """
+    Load results saved by save_results
+
+    :param str path: File to read
+    :return: BenchmarkResults by name, and the scale they were run at
+    :rtype: (collections.OrderedDict, float)
+    """
+    with open(path) as f:
+        data = json.load(f, object_pairs_hook=collections.OrderedDict)
+    if data.get("version") != RESULTS_VERSION:
+        raise ValueError("%s is not a version %d benchmark results file" % (path, RESULTS_VERSION))
+    results = collections.OrderedDict(
+        (name, BenchmarkResult.from_dict(name, result)) for name, result in data["results"].items()
+    )
+    return results, data.get("scale", 1.0)
+
+
+def compare(results, baseline, threshold=DEFAULT_THRESHOLD):
+    """
+    Find the benchmarks whose throughput fell by more than a threshold
+
+    Benchmarks missing from either set of results are ignored.
+
+    :param dict results: BenchmarkResults by name
+    :param dict baseline: BenchmarkResults by name to compare against
+    :param float threshold: Fall in throughput, as a fraction of the baseline, that is a regression
+    :rtype: list(Regression)
+    """
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        expected = baseline[name].throughput
+        if result.throughput < expected * (1.0 - threshold):
+            regressions.append(Regression(name, expected, result.throughput))
+    return regressions
+
+
+def main(args=None):
+    """Run benchmarks from the command line, exiting with status 1 if any regressed against the baseline"""
+    import argparse
+
+    # Register the benchmarks of the suite
+    from rwslib.benchmarks import suite  # noqa: F401
+
+    parser = argparse.ArgumentParser(
+        prog="python -m rwslib.benchmarks", description="Benchmark rwslib and check for regressions"
+    )
+    parser.add_argument("names", nargs="*", help="Benchmarks to run, all of them by default")
+    parser.add_argument("--list", action="store_true", help="List the benchmarks and exit")
+    parser.add_argument("--scale", type=float, default=1.0, help="Factor applied to the size of every workload")
+    parser.add_argument("--repeat", type=int, default=5, help="Timed runs of each benchmark")
+    parser.add_argument("--save", metavar="PATH", help="Save the results as JSON, e.g. as a new baseline")
+    parser.add_argument("--compare", metavar="PATH", help="Baseline results to compare with")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=DEFAULT_THRESHOLD,
+        help="Fall in throughput, as a fraction of the baseline, that fails the run",
+    )
+    options = parser.parse_args(args)
+
+    if options.list:
+        for bench in BENCHMARKS.values():
+            print("%-28s %s" % (bench.name, bench.description))
+        return 0
+
+    baseline = None
+    if options.compare:
+        baseline, baseline_scale = load_results(options.compare)
+        # Throughput depends on the size of the workloads, so only results at the same scale can be compared
+        if baseline_scale != options.scale:
+            parser.error(
+                "%s was run at --scale %s, compare it with results at the same scale"
+                % (options.compare, baseline_scale)
+            )
+    try:
+        results = run_benchmarks(options.names or None, options.scale, options.repeat, report=print)
+    except ValueError as exc:
+        parser.error(str(exc))
+    if options.save:
+        save_results(options.save, results, options.scale)
+    if baseline is not None:
+        regressions = compare(results, baseline, options.threshold)
+        for regression in regressions:
+            print("REGRESSION %s" % regression, file=sys.stderr)
+        if regressions:
+            return 1
+    return 0
@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmarks of the hot paths of rwslib.
+
+Inputs are generated with :mod:`rwslib.extras.rws_simulator` and :mod:`rwslib.extras.odm_corpus`, so they are the
+same on every run and every machine. End to end benchmarks make requests to a local simulator.
+"""
+import io
+import sqlite3
+
+from lxml import etree
+
+from rwslib import RWSConnection
+from rwslib.benchmarks.runner import Workload, benchmark, scaled
+from rwslib.builders import ODM
+from rwslib.extras.audit_event import parser
+from rwslib.extras.local_cv import SQLLiteDBAdapter
+from rwslib.extras.odm_corpus import CorpusConfig, ODMCorpus
+from rwslib.extras.rws_simulator import RWSSimulator, SimulatorConfig, SyntheticData
+from rwslib.extras.rwscmd.data_scrambler import Scramble
+from rwslib.rws_requests import StudyDatasetRequest, VersionRequest
+from rwslib.rwsobjects import RWSSubjects, RWSSubjectsStream, parseXMLString
+
+STUDY_OID = "Mediflex(Prod)"
+
+
+def _subject_list(scale):
+    config = SimulatorConfig(subjects=scaled(5000, scale))
+    xml = SyntheticData(config).subject_list(STUDY_OID, status=True, subject_key_type="SubjectUUID")
+    # As received in response.content
+    return xml.encode("utf-8")
+
+
+@benchmark("parse_xml_string", "bytes")
+def parse_xml_string(scale):
+    """parseXMLString of a subject list"""
+    xml = _subject_list(scale)
+    return Workload(lambda: parseXMLString(xml), len(xml))
+
+
+@benchmark("rws_subjects", "subjects")
+def rws_subjects(scale):
+    """RWSSubjects built from a subject list with status flags"""
+    xml = _subject_list(scale)
+    return Workload(lambda: RWSSubjects(xml), scaled(5000, scale))
+
+
+@benchmark("rws_subjects_stream", "subjects")
+def rws_subjects_stream(scale):
+    """RWSSubjectsStream iterated over a subject list with status flags"""
+    xml = _subject_list(scale)
+
+    def run():
+        for _ in RWSSubjectsStream(xml):
+            pass
+
+    return Workload(run, scaled(5000, scale))
+
+
+@benchmark("subject_columns", "subjects")
+def subject_columns(scale):
+    """RWSSubjectsStream.to_columns of a subject list with status flags"""
+    xml = _subject_list(scale)
+    return Workload(lambda: RWSSubjectsStream(xml).to_columns(), scaled(5000, scale))
+
+
+@benchmark("audit_event_parser", "events")
+def audit_event_parser(scale):
+    """ODMTargetParser events fired for an audit trail"""
+
+    class Counter(object):
+        def __init__(self):
+            self.count = 0
+
+        def default(self, context):
+            self.count += 1
+
+    out = io.BytesIO()
+    ODMCorpus(CorpusConfig(subjects=scaled(40, scale), events=2, forms=3, items=10)).write_audit_trail(out)
+    data = out.getvalue()
+    counter = Counter()
+    parser.parse(data, counter)
+    return Workload(lambda: parser.parse(data, Counter()), counter.count)
+
+
+@benchmark("odm_build", "items")
+def odm_build(scale):
+    """str() of a large rwslib.builders ODM tree"""
+    corpus = ODMCorpus(CorpusConfig(subjects=scaled(100, scale), events=2, forms=3, items=10))
+    odm = ODM("rwslib", fileoid="benchmark", creationdatetime="2020-01-01T00:00:00")
+    for clinical_data in corpus.clinical_data():
+        odm << clinical_data
+    return Workload(lambda: str(odm), corpus.config.subjects * corpus.values_per_subject)
+
+
+@benchmark("scramble_fill_empty", "items")
+def scramble_fill_empty(scale):
+    """Scramble.fill_empty of a document of empty values"""
+    corpus = ODMCorpus(CorpusConfig(subjects=scaled(40, scale), events=2, forms=3, items=10, audit=False))
+    metadata = io.BytesIO()
+    corpus.write_metadata(metadata)
+    out = io.BytesIO()
+    corpus.write_clinical_data(out)
+    doc = etree.fromstring(out.getvalue())
+    for item in doc.iter("{http://www.cdisc.org/ns/odm/v1.3}ItemData"):
+        item.set("Value", "")
+    data = etree.tostring(doc)
+    scramble = Scramble(metadata.getvalue())
+    return Workload(lambda: scramble.fill_empty(None, data), corpus.config.subjects * corpus.values_per_subject)
+
+
+@benchmark("local_cv_form_data", "rows")
+def local_cv_form_data(scale):
+    """SQLLiteDBAdapter.processFormData of a Clinical View"""
+    config = SimulatorConfig(subjects=scaled(5000, scale), fields=20)
+    data = SyntheticData(config)
+    form_data = "".join(data.form_data(STUDY_OID, "VS"))
+    db = sqlite3.connect(":memory:")
+    adapter = SQLLiteDBAdapter(db)
+    adapter.processMetaData(data.view_metadata("Mediflex"))
+    return Workload(lambda: adapter.processFormData(form_data, "V_Mediflex_VS"), config.subjects, db.close)
+
+
+def _connection(config):
+    simulator = RWSSimulator(config).start()
+    rave = RWSConnection(simulator.url, "user", "pass")
+
+    def close():
+        rave.close()
+        simulator.stop()
+
+    return rave, close
+
+
+@benchmark("send_request", "requests")
+def send_request(scale):
+    """send_request round trips to a local server"""
+    rave, close = _connection(SimulatorConfig())
+    count = scaled(500, scale)
+
+    def run():
+        for _ in range(count):
+            rave.send_request(VersionRequest())
+
+    return Workload(run, count, close)
+
+
+@benchmark("send_request_dataset", "subjects")
+def send_request_dataset(scale):
+    """send_request of a compressed study dataset from a local server"""
+    config = SimulatorConfig(subjects=scaled(1000, scale), fields=10)
+    rave, close = _connection(config)
+    return Workload(lambda: rave.send_request(StudyDatasetRequest("Mediflex", "Prod")), config.subjects, close)
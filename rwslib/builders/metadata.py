@@ -462,7 +462,7 @@ class StudyEventRef(ODMElement):
         """Build XML by appending to builder"""
         params = dict(StudyEventOID=self.oid, Mandatory=bool_to_yes_no(self.mandatory))
         if self._order_number is not None:
-            params["OrderNumber"] = self._order_number
+            params["OrderNumber"] = str(self._order_number)
         builder.start("StudyEventRef", params)
         builder.end("StudyEventRef")
 
@@ -0,0 +1,381 @@
+"""
+Response caches for RWSConnection.
+
+Some RWS resources never change (a study or library version for a given version OID) and others change rarely (the
+list of studies or versions, Clinical View metadata). A cache passed to RWSConnection keeps the raw responses for these
+so that they are only fetched from Rave once, the request object's ``result()`` is run against the cached response
+as though it had just been received.
+
+Which requests are cached, and for how long, is decided by the cache's :class:`CachePolicy`.
+"""
+import collections
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+from rwslib.rws_requests import (
+    GlobalLibraryVersionRequest,
+    MetadataStudiesRequest,
+    StudyVersionRequest,
+    StudyVersionsRequest,
+)
+from rwslib.rws_requests.biostats_gateway import ProjectMetaDataRequest
+
+# Values for the cache_control argument of RWSConnection.send_request
+CACHE_BYPASS = "bypass"  # Neither read from nor write to the cache
+CACHE_REFRESH = "refresh"  # Fetch from RWS and replace any cached response
+
+# Time to live, in seconds, for each request class. None means the response never expires.
+DEFAULT_TTLS = {
+    StudyVersionRequest: None,
+    GlobalLibraryVersionRequest: None,
+    MetadataStudiesRequest: 60 * 60,
+    StudyVersionsRequest: 60 * 60,
+    ProjectMetaDataRequest: 60 * 60,
+}
+
+
+class CachePolicy(object):
+    """Decides which requests are cached and for how long, by request class"""
+
+    def __init__(self, ttls=None):
+        """
+        :param dict ttls: Map of RWSRequest class to time to live in seconds (None for no expiry). Subclasses of a
+            listed class share its time to live. Defaults to DEFAULT_TTLS
+        """
+        self.ttls = dict(DEFAULT_TTLS if ttls is None else ttls)
+
+    def is_cacheable(self, request_object):
+        """
+        Should responses for this request be cached?
+
+        :param rwslib.rws_requests.RWSRequest request_object: Request
+        :rtype: bool
+        """
+        if request_object.method != "GET":
+            return False
+        return any(klass in self.ttls for klass in type(request_object).__mro__)
+
+    def ttl(self, request_object):
+        """
+        Time to live, in seconds, for a cacheable request (None for no expiry)
+
+        :param rwslib.rws_requests.RWSRequest request_object: Request
+        """
+        for klass in type(request_object).__mro__:
+            if klass in self.ttls:
+                return self.ttls[klass]
+        raise KeyError("%s is not cacheable" % type(request_object).__name__)
+
+
+class CachedResponse(object):
+    """The parts of a response needed to rebuild it for RWSRequest.result()"""
+
+    def __init__(self, url, status_code, headers, content, encoding, expires=None):
+        """
+        :param str url: URL of the response
+        :param int status_code: HTTP status code
+        :param dict headers: Response headers
+        :param bytes content: Response body
+        :param str encoding: Encoding of the response (as detected by requests)
+        :param float expires: Time (as from time.time()) after which the entry is stale, None for never
+        """
+        self.url = url
+        self.status_code = status_code
+        self.headers = dict(headers)
+        self.content = content
+        self.encoding = encoding
+        self.expires = expires
+
+    @classmethod
+    def from_response(cls, response, ttl=None):
+        """
+        Make a cache entry from a response
+
+        :param requests.models.Response response: Response to keep
+        :param float ttl: Time to live in seconds, None for no expiry
+        """
+        return cls(
+            response.url,
+            response.status_code,
+            response.headers,
+            response.content,
+            response.encoding,
+            None if ttl is None else time.time() + ttl,
+        )
+
+    @property
+    def size(self):
+        """Size of the cached body in bytes"""
+        return len(self.content)
+
+    def is_expired(self, now=None):
+        """Has the entry passed its time to live?"""
+        return self.expires is not None and (now or time.time()) >= self.expires
+
+    def to_response(self):
+        """
+        Rebuild a response that can be passed to RWSRequest.result()
+
+        :rtype: requests.models.Response
+        """
+        response = requests.models.Response()
+        response.url = self.url
+        response.status_code = self.status_code
+        response.headers = CaseInsensitiveDict(self.headers)
+        response.encoding = self.encoding
+        # The body is already in memory, so set it as requests does once content is consumed
+        response._content = self.content
+        response._content_consumed = True
+        return response
+
+
+class ResponseCache(object):
+    """Base class for response caches, keeps hit and miss counts"""
+
+    def __init__(self, policy=None):
+        """
+        :param CachePolicy policy: Which requests to cache and for how long, defaults to CachePolicy()
+        """
+        self.policy = policy or CachePolicy()
+        self.hits = 0
+        self.misses = 0
+        self._stats_lock = threading.Lock()
+
+    @staticmethod
+    def make_key(method, url, identity=None):
+        """
+        Make a cache key for a request
+
+        :param str method: HTTP method
+        :param str url: Full URL of the request
+        :param str identity: Fingerprint of the credentials making the request, so responses are never given to
+            anyone without the same credentials
+        """
+        raw = "\n".join([method, url, identity or ""])
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        """
+        Get a cached response, None if there is no fresh response for the key
+
+        :param str key: Cache key
+        :rtype: CachedResponse
+        """
+        entry = self._get(key)
+        if entry is not None and entry.is_expired():
+            self.delete(key)
+            entry = None
+        with self._stats_lock:
+            if entry is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return entry
+
+    def set(self, key, entry):
+        """
+        Store a response
+
+        :param str key: Cache key
+        :param CachedResponse entry: Response to store
+        """
+        raise NotImplementedError("Override set in descendants of ResponseCache")
+
+    def delete(self, key):
+        """Remove a response from the cache"""
+        raise NotImplementedError("Override delete in descendants of ResponseCache")
+
+    def clear(self):
+        """Remove all responses from the cache"""
+        raise NotImplementedError("Override clear in descendants of ResponseCache")
+
+    def _get(self, key):
+        raise NotImplementedError("Override _get in descendants of ResponseCache")
+
+    def stats(self):
+        """
+        Hit and miss counts for the cache
+
+        :rtype: dict
+        """
+        with self._stats_lock:
+            return dict(hits=self.hits, misses=self.misses)
+
+
+class MemoryCache(ResponseCache):
+    """An in-memory least recently used cache"""
+
+    def __init__(self, max_entries=256, max_bytes=None, policy=None):
+        """
+        :param int max_entries: Maximum number of responses to keep
+        :param int max_bytes: Maximum total size of the response bodies kept, None for no limit
+        :param CachePolicy policy: Which requests to cache and for how long
+        """
+        ResponseCache.__init__(self, policy)
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = collections.OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key, entry):
+        if self.max_bytes is not None and entry.size > self.max_bytes:
+            # Would evict everything else and still not fit
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._size -= old.size
+            self._entries[key] = entry
+            self._size += entry.size
+            while len(self._entries) > self.max_entries or (
+                self.max_bytes is not None and self._size > self.max_bytes
+            ):
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= evicted.size
+
+    def delete(self, key):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self._size -= entry.size
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+
+class DiskCache(ResponseCache):
+    """
+    A cache of responses in a local directory, which can be shared between processes.
+
+    Each response is a file holding a JSON header line followed by the body. Files are written atomically and the
+    least recently used files are removed when the directory grows past `max_bytes`. The size of the directory is
+    counted when the cache is opened and kept up to date as files are written and removed, so the directory is only
+    listed when it may have grown past `max_bytes` (files written by other processes are counted then).
+    """
+
+    SUFFIX = ".rwscache"
+
+    def __init__(self, directory, max_bytes=512 * 1024 * 1024, policy=None):
+        """
+        :param str directory: Directory to keep responses in (created if it does not exist)
+        :param int max_bytes: Maximum total size of the cached files, None for no limit
+        :param CachePolicy policy: Which requests to cache and for how long
+        """
+        ResponseCache.__init__(self, policy)
+        self.directory = directory
+        self.max_bytes = max_bytes
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        self._lock = threading.Lock()
+        # Running total of the size of the cached files, only kept when there is a limit
+        self._bytes = sum(f[1] for f in self._files()) if max_bytes is not None else 0
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + self.SUFFIX)
+
+    def _files(self):
+        """(mtime, size, name) of each cached file"""
+        files = []
+        for name in os.listdir(self.directory):
+            if name.endswith(self.SUFFIX):
+                try:
+                    st = os.stat(os.path.join(self.directory, name))
+                except OSError:
+                    continue
+                files.append((st.st_mtime, st.st_size, name))
+        return files
+
+    def _unlink(self, path):
+        """Remove a file, returning its size (0 if it was not there)"""
+        try:
+            size = os.path.getsize(path)
+            os.unlink(path)
+        except OSError:
+            return 0
+        return size
+
+    def _get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, "rb") as fh:
+                header = json.loads(fh.readline().decode("utf-8"))
+                content = fh.read()
+        except (IOError, OSError, ValueError):
+            return None
+        # Touch the file so that eviction removes the least recently used entries first
+        try:
+            os.utime(path, None)
+        except OSError:
+            pass
+        return CachedResponse(content=content, **header)
+
+    def set(self, key, entry):
+        header = dict(
+            url=entry.url,
+            status_code=entry.status_code,
+            headers=entry.headers,
+            encoding=entry.encoding,
+            expires=entry.expires,
+        )
+        path = self._path(key)
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix=".part")
+        try:
+            with os.fdopen(fd, "wb") as fh:
+                fh.write(json.dumps(header).encode("utf-8") + b"\n")
+                fh.write(entry.content)
+                size = fh.tell()
+            with self._lock:
+                try:
+                    replaced = os.path.getsize(path)
+                except OSError:
+                    replaced = 0
+                os.replace(temp_path, path)
+                self._bytes += size - replaced
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+        if self.max_bytes is not None and self._bytes > self.max_bytes:
+            self._evict()
+
+    def _evict(self):
+        """Remove least recently used files until the cache fits in max_bytes"""
+        with self._lock:
+            files = self._files()
+            total = sum(f[1] for f in files)
+            for _, size, name in sorted(files):
+                if total <= self.max_bytes:
+                    break
+                self._unlink(os.path.join(self.directory, name))
+                total -= size
+            self._bytes = total
+
+    def delete(self, key):
+        with self._lock:
+            self._bytes -= self._unlink(self._path(key))
+
+    def clear(self):
+        with self._lock:
+            for name in os.listdir(self.directory):
+                if name.endswith(self.SUFFIX):
+                    self._unlink(os.path.join(self.directory, name))
+            self._bytes = 0
@@ -0,0 +1,97 @@
+"""
+Gzip compression of request bodies.
+
+ODM posted to Rave (clinical data transactions, metadata drafts) is highly compressible XML that can run to several
+megabytes. ``PostDataRequest`` and ``PostMetadataRequest`` take ``compress=True`` to gzip their bodies with
+:func:`compress_body`, which compresses builder output as it is serialised so the uncompressed document is never held
+as a single string.
+"""
+import zlib
+
+from xml.etree import cElementTree as ET
+
+from rwslib.builders.common import indent
+
+# Default gzip compression level, a good trade of speed for size on XML
+DEFAULT_LEVEL = 6
+
+XML_HEADER = b'<?xml version="1.0" encoding="utf-8" ?>\n'
+
+
+class CompressionStats(object):
+    """Sizes of a body before and after compression"""
+
+    def __init__(self, uncompressed_bytes=0, compressed_bytes=0):
+        """
+        :param int uncompressed_bytes: Size before compression
+        :param int compressed_bytes: Size after compression
+        """
+        self.uncompressed_bytes = uncompressed_bytes
+        self.compressed_bytes = compressed_bytes
+
+    def __repr__(self):
+        return "<CompressionStats %d -> %d bytes>" % (self.uncompressed_bytes, self.compressed_bytes)
+
+    @property
+    def bytes_saved(self):
+        """Bytes saved by compression"""
+        return self.uncompressed_bytes - self.compressed_bytes
+
+    @property
+    def ratio(self):
+        """Compressed size as a fraction of the uncompressed size"""
+        if not self.uncompressed_bytes:
+            return 1.0
+        return float(self.compressed_bytes) / self.uncompressed_bytes
+
+
+class GzipWriter(object):
+    """A write-only file-like object that gzips what is written to it, collecting the compressed output"""
+
+    def __init__(self, level=DEFAULT_LEVEL):
+        """
+        :param int level: Compression level, 1 (fastest) to 9 (smallest)
+        """
+        # wbits of 16 + MAX_WBITS gives a gzip header and trailer
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        self._chunks = []
+        self.stats = CompressionStats()
+
+    def write(self, data):
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        self.stats.uncompressed_bytes += len(data)
+        compressed = self._compressor.compress(data)
+        if compressed:
+            self._chunks.append(compressed)
+        return len(data)
+
+    def getvalue(self):
+        """Finish compressing and return the gzipped bytes"""
+        if self._compressor is not None:
+            self._chunks.append(self._compressor.flush())
+            self._compressor = None
+        value = b"".join(self._chunks)
+        self._chunks = [value]
+        self.stats.compressed_bytes = len(value)
+        return value
+
+
+def compress_body(data, level=DEFAULT_LEVEL):
+    """
+    Gzip a request body
+
+    :param data: Body to compress, bytes, str or a builder object (e.g. rwslib.builders.ODM)
+    :param int level: Compression level, 1 (fastest) to 9 (smallest)
+    :return: Compressed bytes and CompressionStats
+    """
+    writer = GzipWriter(level)
+    if hasattr(data, "getroot"):
+        # Serialise builder output straight into the compressor, laid out as str(odm) would be
+        root = data.getroot()
+        indent(root)
+        writer.write(XML_HEADER)
+        ET.ElementTree(root).write(writer, encoding="utf-8", xml_declaration=False)
+    else:
+        writer.write(data)
+    return writer.getvalue(), writer.stats
@@ -7,7 +7,7 @@ from typing import Optional
 from six.moves.urllib.parse import urlparse, parse_qs
 
 from rwslib.extras.audit_event.parser import parse
-from rwslib.rws_requests.odm_adapter import AuditRecordsRequest
+from rwslib.rws_requests.odm_adapter import AuditRecordPages
 
 
 class ODMAdapter(object):
@@ -19,10 +19,19 @@ class ODMAdapter(object):
         self.environment = environment
         self.mode = mode
         self.start_id = 0
+        # Call of the last page handed to the parser by run
+        self.last_call = None
 
-    def get_next_start_id(self):
-        """If link for next result set has been passed, extract it and get the next set start id"""
-        link = self.rws_connection.last_result.links.get("next", None)
+    def get_next_start_id(self, response=None):
+        """If link for next result set has been passed, extract it and get the next set start id
+
+        :param requests.models.Response response: Response to inspect, defaults to that of the last page parsed by
+            run (pages are fetched on a background thread, so the connection's last_result is not theirs) or the
+            connection's last_result if run has not parsed a page
+        """
+        if response is None:
+            response = self.last_call.response if self.last_call is not None else self.rws_connection.last_result
+        link = response.links.get("next", None)
         if link:
             link = link['url']
             p = urlparse(link)
@@ -31,24 +40,25 @@ class ODMAdapter(object):
 
         return None
 
-    def run(self, start_id=0, max_pages=-1, per_page=1000, **kwargs):
-        page = 0
-        self.start_id = start_id
-        while max_pages == -1 or (page < max_pages):
+    def run(self, start_id=0, max_pages=-1, per_page=1000, prefetch=1, **kwargs):
+        """Fetch the pages of audit records from start_id and send them for parsing. The next page is fetched in the
+        background while a page is parsed. On an error self.start_id is the start of the page to carry on from.
 
-            req = AuditRecordsRequest(self.study, self.environment, startid=self.start_id, per_page=per_page,
-                                      mode=self.mode)
+        :param int start_id: Audit id to start from
+        :param int max_pages: Maximum number of pages, -1 for all of them
+        :param int per_page: Page size
+        :param int prefetch: Number of pages to fetch ahead of the one being parsed, 0 to fetch each in turn
+        """
+        self.start_id = start_id
+        pages = AuditRecordPages(self.rws_connection, self.study, self.environment, startid=start_id,
+                                 per_page=per_page, mode=self.mode, prefetch=prefetch,
+                                 max_pages=None if max_pages == -1 else max_pages, **kwargs)
+        with pages:
             try:
-                # Get the ODM data
-                odm = self.rws_connection.send_request(req, **kwargs)
-                # Check if we were passed the next startid
-                # Need to do this immediately because subsequent parsing might include other calls to RWS
-                self.start_id = self.get_next_start_id()
-                # Send it for parsing
-                parse(odm, self.eventer)
-                page += 1
+                for call in pages.calls():
+                    self.last_call = call
+                    # Send it for parsing
+                    parse(call.result, self.eventer)
+                    self.start_id = pages.startid
             except Exception as e:
-                logging.error(e.message)
-
-            if not self.start_id:
-                break
+                logging.error(e)
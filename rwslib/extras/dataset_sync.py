@@ -0,0 +1,441 @@
+# -*- coding: utf-8 -*-
+"""
+Incremental pulls of clinical datasets into a local SQLite mirror.
+
+The study, version and subject datasets (and the Clinical Views of the Biostats Gateway) take a ``start`` date and
+return only the data changed since then. :class:`DatasetSync` remembers when each dataset was last pulled (its high
+water mark) and asks for the changes since that time, less a safety overlap, merging them into a mirror with one row
+per item value keyed on the subject, event, form and item group with their repeat keys::
+
+    db = sqlite3.connect('mediflex.db')
+    sync = DatasetSync(rave, db, overlap=datetime.timedelta(minutes=10))
+    sync.sync_study('Mediflex', 'Prod')  # A full pull the first time, the changes since the last pull after that
+    for item in sync.mirror.items(formoid='VS'):
+        print(item.subjectkey, item.itemoid, item.value)
+
+The mark is taken from the ``Date`` of the response, so it is on the server's clock, and is only moved on in the same
+transaction as the changes are merged: a pull that fails leaves both as they were. Data changed while a dataset is
+being generated may be missed by one pull; the overlap makes sure the next pull picks it up. Values pulled again by
+the overlap are simply written again.
+"""
+import collections
+import datetime
+import email.utils
+import sqlite3
+
+from lxml import etree
+
+from rwslib.rws_requests import StudyDatasetRequest, SubjectDatasetRequest, VersionDatasetRequest
+from rwslib.rws_requests.biostats_gateway import FormDataRequest
+from rwslib.rwsobjects import MEDI_NS, ODM_NS
+
+# Keys of a row of the mirror, from the ODM ClinicalData down to the ItemData
+MIRROR_KEYS = (
+    "studyoid",
+    "subjectkey",
+    "studyeventoid",
+    "studyeventrepeatkey",
+    "formoid",
+    "formrepeatkey",
+    "itemgroupoid",
+    "itemgrouprepeatkey",
+    "itemoid",
+)
+MIRROR_COLUMNS = MIRROR_KEYS + ("value", "subjectname", "locationoid", "updated")
+
+# Element and attribute of each key below the ClinicalData, by element tag
+_KEY_ATTRIBUTES = {
+    ODM_NS + "SubjectData": (("subjectkey", "SubjectKey"),),
+    ODM_NS + "StudyEventData": (("studyeventoid", "StudyEventOID"), ("studyeventrepeatkey", "StudyEventRepeatKey")),
+    ODM_NS + "FormData": (("formoid", "FormOID"), ("formrepeatkey", "FormRepeatKey")),
+    ODM_NS + "ItemGroupData": (("itemgroupoid", "ItemGroupOID"), ("itemgrouprepeatkey", "ItemGroupRepeatKey")),
+    ODM_NS + "ItemData": (("itemoid", "ItemOID"),),
+}
+# Number of keys that identify each element, for removing it and everything below it
+_KEY_DEPTH = {
+    ODM_NS + "ClinicalData": 1,
+    ODM_NS + "SubjectData": 2,
+    ODM_NS + "StudyEventData": 4,
+    ODM_NS + "FormData": 6,
+    ODM_NS + "ItemGroupData": 8,
+    ODM_NS + "ItemData": 9,
+}
+
+MirrorItem = collections.namedtuple("MirrorItem", MIRROR_COLUMNS)
+
+SyncResult = collections.namedtuple("SyncResult", "dataset formoid start mark upserted removed")
+SyncResult.__doc__ = """
+The outcome of a pull: the dataset and form pulled, the ``start`` asked for (None for a full pull), the new high water
+mark and the number of values written to and removed from the mirror
+"""
+
+
+def format_mark(mark):
+    """
+    A high water mark as passed in the ``start`` of a request, and kept
+
+    :param datetime.datetime mark: Mark, naive in UTC
+    :rtype: str
+    """
+    return mark.replace(microsecond=0).isoformat()
+
+
+def parse_mark(value):
+    """
+    A high water mark kept by :func:`format_mark`
+
+    :param str value: Kept value
+    :rtype: datetime.datetime
+    """
+    return datetime.datetime.strptime(value, "%Y-%m-%dT%H:%M:%S")
+
+
+def response_time(response):
+    """
+    When a response was generated, from its Date header, falling back to the local clock
+
+    :param requests.models.Response response: Response
+    :return: The time, naive in UTC
+    :rtype: datetime.datetime
+    """
+    date = response.headers.get("Date") if response is not None else None
+    if date:
+        try:
+            return email.utils.parsedate_to_datetime(date).astimezone(datetime.timezone.utc).replace(tzinfo=None)
+        except (TypeError, ValueError):
+            pass
+    return datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+
+
+class HighWaterMarks(object):
+    """
+    The time each dataset was last pulled, by study, environment, dataset and form, kept in a SQLite database.
+
+    Changes are not committed, so that a mark can be moved on in the same transaction as the data it covers.
+    """
+
+    def __init__(self, db):
+        """
+        :param sqlite3.Connection db: Database to keep the marks in, the table is created if needed
+        """
+        self.db = db
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS high_water_marks ("
+            "study TEXT NOT NULL, environment TEXT NOT NULL, dataset TEXT NOT NULL, formoid TEXT NOT NULL, "
+            "mark TEXT NOT NULL, PRIMARY KEY (study, environment, dataset, formoid))"
+        )
+
+    def get(self, study, environment, dataset, formoid=None):
+        """
+        The mark of a dataset
+
+        :param str study: Project name
+        :param str environment: Environment name
+        :param str dataset: Dataset, e.g. ``study/regular``
+        :param str formoid: Form the dataset is filtered to, None for all forms
+        :return: The mark, None if the dataset has not been pulled
+        :rtype: datetime.datetime
+        """
+        row = self.db.execute(
+            "SELECT mark FROM high_water_marks WHERE study = ? AND environment = ? AND dataset = ? AND formoid = ?",
+            (study, environment, dataset, formoid or ""),
+        ).fetchone()
+        return parse_mark(row[0]) if row else None
+
+    def set(self, study, environment, dataset, formoid, mark):
+        """
+        Set the mark of a dataset
+
+        :param datetime.datetime mark: Mark, naive in UTC
+        """
+        self.db.execute(
+            "INSERT OR REPLACE INTO high_water_marks (study, environment, dataset, formoid, mark) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (study, environment, dataset, formoid or "", format_mark(mark)),
+        )
+
+    def reset(self, study, environment, dataset=None, formoid=None):
+        """
+        Forget marks so that the next pulls are full pulls
+
+        :param str dataset: Only forget the marks of this dataset
+        :param str formoid: Only forget the mark for this form
+        """
+        sql = "DELETE FROM high_water_marks WHERE study = ? AND environment = ?"
+        args = [study, environment]
+        if dataset is not None:
+            sql += " AND dataset = ?"
+            args.append(dataset)
+        if formoid is not None:
+            sql += " AND formoid = ?"
+            args.append(formoid)
+        self.db.execute(sql, args)
+
+
+class DatasetMirror(object):
+    """
+    Item values of ODM clinical datasets, kept in a SQLite database with one row per value keyed on the study,
+    subject, event, form, item group and item, with their repeat keys.
+
+    Changes are not committed, as for :class:`HighWaterMarks`. Keep one mirror per dataset type (regular or raw).
+    """
+
+    def __init__(self, db, batch_size=1000):
+        """
+        :param sqlite3.Connection db: Database to keep the mirror in, the table is created if needed
+        :param int batch_size: Number of values written to the database at a time
+        """
+        self.db = db
+        self.batch_size = batch_size
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS mirror_items (%s, value TEXT, subjectname TEXT, locationoid TEXT, "
+            "updated TEXT, PRIMARY KEY (%s)) WITHOUT ROWID"
+            % (", ".join("%s TEXT NOT NULL" % key for key in MIRROR_KEYS), ", ".join(MIRROR_KEYS))
+        )
+        self._upsert = "INSERT OR REPLACE INTO mirror_items (%s) VALUES (%s)" % (
+            ", ".join(MIRROR_COLUMNS),
+            ", ".join("?" * len(MIRROR_COLUMNS)),
+        )
+
+    def _remove(self, keys):
+        """Remove the values below an element, identified by its leading keys"""
+        return self.db.execute(
+            "DELETE FROM mirror_items WHERE %s" % " AND ".join("%s = ?" % key for key in MIRROR_KEYS[: len(keys)]),
+            keys,
+        ).rowcount
+
+    def merge(self, source, updated=None):
+        """
+        Merge an ODM clinical dataset into the mirror. Values are written over those with the same keys, and elements
+        with a TransactionType of Remove are removed with everything below them.
+
+        The dataset is parsed incrementally, so responses of any size can be merged straight from the network.
+
+        :param source: The dataset as a file path or binary file-like object (e.g. rwslib.RWSResponseStream)
+        :param datetime.datetime updated: Recorded as the time the values were updated, defaults to now
+        :return: (values written, values removed)
+        :rtype: tuple(int, int)
+        """
+        updated = format_mark(updated or datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None))
+        keys = dict((key, "") for key in MIRROR_KEYS)
+        subject = {"subjectname": None, "locationoid": None}
+        rows = []
+        upserted = removed = 0
+        # Element being removed, everything below it is removed with it
+        removing = None
+        context = etree.iterparse(
+            source,
+            events=("start", "end"),
+            tag=tuple(_KEY_DEPTH) + (ODM_NS + "SiteRef",),
+            huge_tree=True,
+        )
+        for event, elem in context:
+            tag = elem.tag
+            if event == "end":
+                if elem is removing:
+                    removing = None
+                if tag == ODM_NS + "ClinicalData":
+                    # Discard the subject read and any before it
+                    elem.clear()
+                    while elem.getprevious() is not None:
+                        del elem.getparent()[0]
+                continue
+            if removing is not None:
+                continue
+            if tag == ODM_NS + "SiteRef":
+                subject["locationoid"] = elem.get("LocationOID")
+                continue
+            if tag == ODM_NS + "ClinicalData":
+                keys["studyoid"] = elem.get("StudyOID") or ""
+            else:
+                for key, attribute in _KEY_ATTRIBUTES[tag]:
+                    keys[key] = elem.get(attribute) or ""
+                if tag == ODM_NS + "SubjectData":
+                    subject["subjectname"] = elem.get(MEDI_NS + "SubjectName")
+                    subject["locationoid"] = None
+            # Clear the keys below this element
+            depth = _KEY_DEPTH[tag]
+            for key in MIRROR_KEYS[depth:]:
+                keys[key] = ""
+            if elem.get("TransactionType") == "Remove":
+                if rows:
+                    self.db.executemany(self._upsert, rows)
+                    rows = []
+                removed += self._remove([keys[key] for key in MIRROR_KEYS[:depth]])
+                removing = elem
+            elif tag == ODM_NS + "ItemData":
+                value = None if elem.get("IsNull") == "Yes" else elem.get("Value")
+                rows.append(
+                    tuple(keys[key] for key in MIRROR_KEYS)
+                    + (value, subject["subjectname"], subject["locationoid"], updated)
+                )
+                upserted += 1
+                if len(rows) >= self.batch_size:
+                    self.db.executemany(self._upsert, rows)
+                    rows = []
+        if rows:
+            self.db.executemany(self._upsert, rows)
+        return upserted, removed
+
+    def items(self, studyoid=None, subjectkey=None, formoid=None):
+        """
+        Values in the mirror, in key order
+
+        :param str studyoid: Only values of this study, e.g. ``Mediflex(Prod)``
+        :param str subjectkey: Only values of this subject
+        :param str formoid: Only values on this form
+        :rtype: list(MirrorItem)
+        """
+        sql = "SELECT %s FROM mirror_items" % ", ".join(MIRROR_COLUMNS)
+        filters = [(key, value) for key, value in (("studyoid", studyoid), ("subjectkey", subjectkey),
+                                                   ("formoid", formoid)) if value is not None]
+        if filters:
+            sql += " WHERE " + " AND ".join("%s = ?" % key for key, _ in filters)
+        sql += " ORDER BY %s" % ", ".join(MIRROR_KEYS)
+        return [MirrorItem(*row) for row in self.db.execute(sql, [value for _, value in filters])]
+
+
+class DatasetSync(object):
+    """
+    Pulls of clinical datasets that only ask for what changed since the last pull, merged into a
+    :class:`DatasetMirror` with :class:`HighWaterMarks` kept alongside in the same SQLite database.
+    """
+
+    def __init__(self, rws_connection, db, overlap=datetime.timedelta(minutes=5), dataset_type="regular",
+                 batch_size=1000):
+        """
+        :param rwslib.RWSConnection rws_connection: Connection to pull the datasets with
+        :param db: SQLite database (sqlite3.Connection or path) for the marks and the mirror
+        :param datetime.timedelta overlap: How far before the last mark to start each pull
+        :param str dataset_type: Dataset type, one of 'regular' or 'raw'
+        :param int batch_size: Number of values written to the database at a time
+        """
+        if not isinstance(db, sqlite3.Connection):
+            db = sqlite3.connect(db)
+        self.rws_connection = rws_connection
+        self.db = db
+        self.overlap = overlap
+        self.dataset_type = dataset_type.lower()
+        self.marks = HighWaterMarks(db)
+        self.mirror = DatasetMirror(db, batch_size)
+        db.commit()
+
+    def _start(self, project_name, environment_name, dataset, formoid, full):
+        """start for the next pull of a dataset, None for a full pull"""
+        if full:
+            return None
+        mark = self.marks.get(project_name, environment_name, dataset, formoid)
+        return format_mark(mark - self.overlap) if mark is not None else None
+
+    def _sync(self, project_name, environment_name, dataset, formoid, full, make_request):
+        start = self._start(project_name, environment_name, dataset, formoid, full)
+        call = self.rws_connection.execute(make_request(start), stream=True)
+        mark = response_time(call.response)
+        with call.result as stream:
+            with self.db:
+                upserted, removed = self.mirror.merge(stream, mark)
+                self.marks.set(project_name, environment_name, dataset, formoid, mark)
+        return SyncResult(dataset, formoid, start, mark, upserted, removed)
+
+    def sync_study(self, project_name, environment_name, formoid=None, full=False, **options):
+        """
+        Pull the changes to a study dataset since the last pull (StudyDatasetRequest)
+
+        :param str project_name: Name of the Rave Study
+        :param str environment_name: Name of the Rave Study Environment
+        :param str formoid: Only pull this form, which has its own mark
+        :param bool full: Pull the whole dataset whatever the mark
+        :param options: Other options of the request, e.g. ``rawsuffix``
+        :rtype: SyncResult
+        """
+        return self._sync(
+            project_name,
+            environment_name,
+            "study/%s" % self.dataset_type,
+            formoid,
+            full,
+            lambda start: StudyDatasetRequest(
+                project_name, environment_name, self.dataset_type, start=start, formoid=formoid, **options
+            ),
+        )
+
+    def sync_version(self, project_name, environment_name, version_oid, formoid=None, full=False, **options):
+        """
+        Pull the changes to the dataset of a study version since the last pull (VersionDatasetRequest)
+
+        :param str version_oid: Version to pull
+        :rtype: SyncResult
+        """
+        return self._sync(
+            project_name,
+            environment_name,
+            "version/%s/%s" % (version_oid, self.dataset_type),
+            formoid,
+            full,
+            lambda start: VersionDatasetRequest(
+                project_name, environment_name, version_oid, self.dataset_type, start=start, formoid=formoid,
+                **options
+            ),
+        )
+
+    def sync_subject(self, project_name, environment_name, subjectkey, formoid=None, full=False, **options):
+        """
+        Pull the changes to the dataset of a subject since the last pull (SubjectDatasetRequest)
+
+        :param str subjectkey: Subject Key of the subject to pull
+        :rtype: SyncResult
+        """
+        return self._sync(
+            project_name,
+            environment_name,
+            "subject/%s/%s" % (subjectkey, self.dataset_type),
+            formoid,
+            full,
+            lambda start: SubjectDatasetRequest(
+                project_name, environment_name, subjectkey, self.dataset_type, start=start, formoid=formoid,
+                **options
+            ),
+        )
+
+    def pull_form_data(self, project_name, environment_name, form_oid, full=False, dataset_format="csv", load=None):
+        """
+        Pull the changes to the Clinical View of a form since the last pull (FormDataRequest). Clinical Views are not
+        merged into the mirror, the changes are returned to be loaded elsewhere (e.g. with
+        :class:`rwslib.extras.local_cv.SQLLiteDBAdapter`).
+
+        The mark is only moved on once the changes have been loaded: by `load`, if given, or by calling
+        :meth:`commit_mark` with the result once they are loaded. A pull whose changes are not loaded is repeated by
+        the next pull.
+
+        :param str form_oid: Form of the Clinical View
+        :param str dataset_format: Format of the data, csv or xml
+        :param load: Function taking the changes to load them, the mark is moved on if it returns without raising
+        :return: The changes and the outcome of the pull
+        :rtype: tuple(str, SyncResult)
+        """
+        dataset = "views/%s/%s" % (self.dataset_type, dataset_format)
+        start = self._start(project_name, environment_name, dataset, form_oid, full)
+        call = self.rws_connection.execute(
+            FormDataRequest(project_name, environment_name, self.dataset_type, form_oid, start=start,
+                            dataset_format=dataset_format)
+        )
+        result = SyncResult(dataset, form_oid, start, response_time(call.response), 0, 0)
+        if load is not None:
+            load(call.result)
+            self.commit_mark(project_name, environment_name, result)
+        return call.result, result
+
+    def commit_mark(self, project_name, environment_name, result):
+        """
+        Move the mark of a dataset on to that of a pull, once the changes it returned have been loaded
+
+        :param str project_name: Name of the Rave Study
+        :param str environment_name: Name of the Rave Study Environment
+        :param SyncResult result: Outcome of the pull, as returned by :meth:`pull_form_data`
+        """
+        with self.db:
+            self.marks.set(project_name, environment_name, result.dataset, result.formoid, result.mark)
+
+    def close(self):
+        """Close the database"""
+        self.db.close()
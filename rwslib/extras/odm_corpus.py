@@ -0,0 +1,493 @@
+# -*- coding: utf-8 -*-
+"""
+Seeded synthetic ODM built with :mod:`rwslib.builders`, at any scale.
+
+:class:`ODMCorpus` generates the clinical data, audit trail and matching metadata of a synthetic study of
+subjects x events x forms x item group records x items, with queries and audit records. Everything is derived from
+the seed, so the same configuration always gives the same documents, and documents are written one ClinicalData at a
+time so that multi-gigabyte fixtures can be produced (and benchmarked against) without holding them in memory::
+
+    corpus = ODMCorpus(CorpusConfig(subjects=100000, events=10, forms=8, items=20, seed=42))
+    corpus.write_metadata('metadata.xml')
+    corpus.write_clinical_data('clinical.xml')
+    corpus.write_audit_trail('audit.xml')
+
+The audit trail has one ClinicalData per audit record, with an ``mdsol:AuditSubCategoryName`` of ``SubjectCreated``,
+``Entered`` or ``QueryOpen``, in the shape read by :class:`rwslib.extras.audit_event.parser.ODMTargetParser`.
+"""
+import datetime
+import random
+import uuid
+from xml.etree import cElementTree as ET
+
+from rwslib.builders import (
+    ODM,
+    AuditRecord,
+    ClinicalData,
+    DataType,
+    DateTimeStamp,
+    FormData,
+    FormDef,
+    FormRef,
+    GlobalVariables,
+    GranularityType,
+    ItemData,
+    ItemDef,
+    ItemGroupData,
+    ItemGroupDef,
+    ItemGroupRef,
+    ItemRef,
+    LocationRef,
+    MdsolQuery,
+    MetaDataVersion,
+    Protocol,
+    QueryStatusType,
+    SourceID,
+    Study,
+    StudyEventData,
+    StudyEventDef,
+    StudyEventRef,
+    SubjectData,
+    UserRef,
+)
+from rwslib.builders.common import indent
+
+XML_HEADER = b'<?xml version="1.0" encoding="utf-8" ?>\n'
+
+# Start of the synthetic study, subjects are created an hour apart from here
+EPOCH = datetime.datetime(2020, 1, 1)
+
+# Data types of the items on a form, in turn
+ITEM_TYPES = (DataType.Integer, DataType.Text, DataType.Date, DataType.Float)
+
+WORDS = ("alpha", "bravo", "charlie", "delta", "echo", "foxtrot", "golf", "hotel", "india", "juliet")
+
+QUERY_TEXT = "Data is required. Please complete."
+
+# Audit subcategories in the audit trail
+SUBJECT_CREATED = "SubjectCreated"
+ENTERED = "Entered"
+QUERY_OPEN = "QueryOpen"
+
+
+class CorpusConfig(object):
+    """Shape of a synthetic study"""
+
+    def __init__(
+        self,
+        project_name="Mediflex",
+        environment="Prod",
+        subjects=100,
+        sites=10,
+        events=3,
+        forms=4,
+        item_groups=1,
+        items=10,
+        query_rate=0.02,
+        audit=True,
+        seed=0,
+    ):
+        """
+        :param str project_name: Project Name
+        :param str environment: Environment Name
+        :param int subjects: Number of subjects
+        :param int sites: Number of sites the subjects are spread over
+        :param int events: Number of study events (folders) per subject
+        :param int forms: Number of forms per study event
+        :param int item_groups: Number of item group records per form (more than one makes the forms log forms)
+        :param int items: Number of items per item group record
+        :param float query_rate: Fraction of items with an open query
+        :param bool audit: Include an AuditRecord with each item of the clinical data
+        :param int seed: Seed for the generated keys and values
+        """
+        self.project_name = project_name
+        self.environment = environment
+        self.subjects = subjects
+        self.sites = sites
+        self.events = events
+        self.forms = forms
+        self.item_groups = item_groups
+        self.items = items
+        self.query_rate = query_rate
+        self.audit = audit
+        self.seed = seed
+
+    @property
+    def study_oid(self):
+        return "%s(%s)" % (self.project_name, self.environment)
+
+
+class CorpusSubject(object):
+    """A subject of a synthetic study"""
+
+    def __init__(self, number, key, name, site):
+        """
+        :param int number: Position of the subject in the study, from 1
+        :param str key: Subject UUID
+        :param str name: Subject name
+        :param str site: Site LocationOID
+        """
+        self.number = number
+        self.key = key
+        self.name = name
+        self.site = site
+
+    @property
+    def created(self):
+        """Time the subject was created"""
+        return EPOCH + datetime.timedelta(hours=self.number)
+
+
+class CorpusValue(object):
+    """A data point of a subject"""
+
+    def __init__(self, event_oid, form_oid, record, item_oid, value, query, entered, source_id):
+        """
+        :param str event_oid: StudyEvent OID
+        :param str form_oid: Form (and item group) OID
+        :param int record: ItemGroupRepeatKey, from 1
+        :param str item_oid: Item OID
+        :param str value: Value of the item
+        :param bool query: Does the item have an open query?
+        :param datetime.datetime entered: Time the value was entered
+        :param int source_id: Audit id of the value's entry, the id of its query (if any) follows
+        """
+        self.event_oid = event_oid
+        self.form_oid = form_oid
+        self.record = record
+        self.item_oid = item_oid
+        self.value = value
+        self.query = query
+        self.entered = entered
+        self.source_id = source_id
+
+
+class ODMCorpus(object):
+    """Generates seeded synthetic ODM documents with rwslib.builders"""
+
+    def __init__(self, config=None):
+        """
+        :param CorpusConfig config: Shape of the study, defaults to CorpusConfig()
+        """
+        self.config = config or CorpusConfig()
+
+    def _random(self, *parts):
+        """A generator seeded from the configured seed and parts, so the same parts always give the same values"""
+        return random.Random(":".join(str(part) for part in (self.config.seed,) + parts))
+
+    # Structure
+
+    def event_oids(self):
+        return ["VISIT%d" % (i + 1) for i in range(self.config.events)]
+
+    def form_oids(self):
+        return ["FORM%d" % (i + 1) for i in range(self.config.forms)]
+
+    def items(self, form_oid):
+        """
+        Items of a form
+
+        :return: (OID, DataType) of each item
+        """
+        return [
+            ("%s.ITEM%d" % (form_oid, i + 1), ITEM_TYPES[i % len(ITEM_TYPES)]) for i in range(self.config.items)
+        ]
+
+    @property
+    def values_per_subject(self):
+        """Number of data points each subject has"""
+        config = self.config
+        return config.events * config.forms * config.item_groups * config.items
+
+    @property
+    def audit_ids_per_subject(self):
+        """
+        Number of audit ids allocated to each subject, one for its creation and two per value (its entry and a query)
+
+        Ids of queries that are not raised are left unused, as happens in Rave where ids are shared by all studies.
+        """
+        return 1 + 2 * self.values_per_subject
+
+    def subject(self, number):
+        """
+        A subject, numbered from 1
+
+        :rtype: CorpusSubject
+        """
+        rnd = self._random("subject", number)
+        site = (number - 1) % self.config.sites + 1
+        return CorpusSubject(
+            number,
+            str(uuid.UUID(int=rnd.getrandbits(128), version=4)),
+            "%03d-%06d" % (site, number),
+            "SITE%03d" % site,
+        )
+
+    def subjects(self):
+        """All the subjects, generated as needed"""
+        for number in range(1, self.config.subjects + 1):
+            yield self.subject(number)
+
+    def _value(self, rnd, datatype):
+        if datatype == DataType.Integer:
+            return str(rnd.randint(1, 999))
+        if datatype == DataType.Float:
+            return "%.1f" % rnd.uniform(0, 100)
+        if datatype == DataType.Date:
+            return (EPOCH + datetime.timedelta(days=rnd.randint(0, 1000))).strftime("%d %b %Y")
+        return " ".join(rnd.choice(WORDS) for _ in range(rnd.randint(1, 5)))
+
+    def values(self, subject):
+        """
+        The data points of a subject, in the order they were entered
+
+        :param CorpusSubject subject: Subject
+        :rtype: list(CorpusValue)
+        """
+        rnd = self._random("values", subject.number)
+        # Audit ids are allocated to subjects in blocks, the first of each for the subject's creation
+        source_id = (subject.number - 1) * self.audit_ids_per_subject
+        values = []
+        for event_oid in self.event_oids():
+            for form_oid in self.form_oids():
+                for record in range(1, self.config.item_groups + 1):
+                    for item_oid, datatype in self.items(form_oid):
+                        source_id += 2
+                        values.append(
+                            CorpusValue(
+                                event_oid,
+                                form_oid,
+                                record,
+                                item_oid,
+                                self._value(rnd, datatype),
+                                rnd.random() < self.config.query_rate,
+                                subject.created + datetime.timedelta(seconds=len(values) + 1),
+                                source_id,
+                            )
+                        )
+        return values
+
+    # Documents
+
+    def metadata(self):
+        """
+        Metadata matching the clinical data
+
+        :rtype: rwslib.builders.ODM
+        """
+        config = self.config
+        mdv = MetaDataVersion("1", "Synthetic")
+        protocol = Protocol()
+        for order, event_oid in enumerate(self.event_oids(), 1):
+            protocol << StudyEventRef(event_oid, order, True)
+        mdv << protocol
+        for event_oid in self.event_oids():
+            event = StudyEventDef(event_oid, event_oid, False, StudyEventDef.SCHEDULED)
+            for order, form_oid in enumerate(self.form_oids(), 1):
+                event << FormRef(form_oid, order, True)
+            mdv << event
+        for order, form_oid in enumerate(self.form_oids(), 1):
+            mdv << FormDef(form_oid, form_oid, order_number=order)(ItemGroupRef(form_oid, 1))
+        for form_oid in self.form_oids():
+            group = ItemGroupDef(form_oid, form_oid, repeating=config.item_groups > 1)
+            for order, (item_oid, _) in enumerate(self.items(form_oid), 1):
+                group << ItemRef(item_oid, order)
+            mdv << group
+        for form_oid in self.form_oids():
+            for item_oid, datatype in self.items(form_oid):
+                name = item_oid.split(".")[1]
+                if datatype == DataType.Date:
+                    mdv << ItemDef(item_oid, name, datatype, date_time_format="dd MMM yyyy")
+                elif datatype == DataType.Float:
+                    mdv << ItemDef(item_oid, name, datatype, 5, significant_digits=1)
+                else:
+                    mdv << ItemDef(item_oid, name, datatype, 3 if datatype == DataType.Integer else 200)
+        odm = self._odm(granularity=GranularityType.Metadata)
+        odm << Study(config.project_name)(GlobalVariables(config.project_name), mdv)
+        return odm
+
+    def _audit_record(self, site, when, source_id):
+        audit = AuditRecord()
+        audit << UserRef("synthetic")
+        audit << LocationRef(site)
+        audit << DateTimeStamp(when)
+        audit << SourceID(str(source_id))
+        return audit
+
+    def _query(self, source_id):
+        return MdsolQuery(
+            value=QUERY_TEXT,
+            query_repeat_key=source_id,
+            recipient="Site from System",
+            status=QueryStatusType.Open,
+        )
+
+    def _clinical_data(self):
+        return ClinicalData(self.config.project_name, self.config.environment)
+
+    def subject_data(self, subject):
+        """
+        The clinical data of a subject
+
+        :param CorpusSubject subject: Subject
+        :rtype: rwslib.builders.ClinicalData
+        """
+        # Snapshots carry no transaction types
+        subject_data = SubjectData(subject.site, subject.key, "SubjectUUID", transaction_type=None)
+        subject_data.add_attribute("SubjectName", subject.name)
+        events = {}
+        forms = {}
+        groups = {}
+        for value in self.values(subject):
+            if value.event_oid not in events:
+                events[value.event_oid] = subject_data << StudyEventData(value.event_oid, transaction_type=None)
+            form_key = (value.event_oid, value.form_oid)
+            if form_key not in forms:
+                forms[form_key] = events[value.event_oid] << FormData(value.form_oid, form_repeat_key=1)
+            group_key = form_key + (value.record,)
+            if group_key not in groups:
+                groups[group_key] = forms[form_key] << ItemGroupData(
+                    item_group_repeat_key=value.record if self.config.item_groups > 1 else None
+                )
+            item = groups[group_key] << ItemData(value.item_oid, value.value)
+            if self.config.audit:
+                item << self._audit_record(subject.site, value.entered, value.source_id)
+            if value.query:
+                item << self._query(value.source_id + 1)
+        return self._clinical_data()(subject_data)
+
+    def clinical_data(self):
+        """The clinical data of each subject in turn, as rwslib.builders.ClinicalData"""
+        for subject in self.subjects():
+            yield self.subject_data(subject)
+
+    def subject_audit_trail(self, subject):
+        """
+        The audit trail of a subject, one ClinicalData per audit record
+
+        :param CorpusSubject subject: Subject
+        """
+        source_id = (subject.number - 1) * self.audit_ids_per_subject + 1
+        clinical_data = self._clinical_data()
+        clinical_data.add_attribute("AuditSubCategoryName", SUBJECT_CREATED)
+        subject_data = SubjectData(subject.site, subject.key, "SubjectUUID", transaction_type="Upsert")
+        subject_data.add_attribute("SubjectName", subject.name)
+        subject_data << self._audit_record(subject.site, subject.created, source_id)
+        yield clinical_data(subject_data)
+
+        for instance_id, value in enumerate(self.values(subject)):
+            subcategories = [ENTERED, QUERY_OPEN] if value.query else [ENTERED]
+            for subcategory in subcategories:
+                clinical_data = self._clinical_data()
+                clinical_data.add_attribute("AuditSubCategoryName", subcategory)
+                subject_data = SubjectData(subject.site, subject.key, "SubjectUUID", transaction_type=None)
+                subject_data.add_attribute("SubjectName", subject.name)
+                event = StudyEventData(
+                    value.event_oid, transaction_type=None, study_event_repeat_key="%s[1]" % value.event_oid
+                )
+                item = ItemData(value.item_oid, value.value, transaction_type="Upsert")
+                if subcategory == QUERY_OPEN:
+                    item << self._audit_record(subject.site, value.entered, value.source_id + 1)
+                    item << self._query(value.source_id + 1)
+                else:
+                    item << self._audit_record(subject.site, value.entered, value.source_id)
+                group = ItemGroupData(
+                    item_group_repeat_key=value.record if self.config.item_groups > 1 else None
+                )
+                yield clinical_data(
+                    subject_data(event(FormData(value.form_oid, form_repeat_key=1)(group(item))))
+                )
+
+    def audit_trail(self):
+        """The audit trail of each subject in turn, one rwslib.builders.ClinicalData per audit record"""
+        for subject in self.subjects():
+            for clinical_data in self.subject_audit_trail(subject):
+                yield clinical_data
+
+    # Output
+
+    def _odm(self, granularity=GranularityType.AllClinicalData, filetype=None):
+        # FileOID and CreationDateTime are fixed so that documents are reproducible
+        rnd = self._random("file", granularity.value)
+        return ODM(
+            "rwslib",
+            creationdatetime=EPOCH.strftime("%Y-%m-%dT%H:%M:%S"),
+            fileoid=str(uuid.UUID(int=rnd.getrandbits(128), version=4)),
+            filetype=filetype,
+            granularity=granularity,
+        )
+
+    def write_metadata(self, target):
+        """
+        Write the metadata
+
+        :param target: File path or binary file-like object
+        :return: Bytes written
+        """
+        return self._write(target, self._odm(granularity=GranularityType.Metadata), [self.metadata().study])
+
+    def write_clinical_data(self, target):
+        """
+        Write the clinical data of all the subjects, one subject at a time
+
+        :param target: File path or binary file-like object
+        :return: Bytes written
+        """
+        return self._write(target, self._odm(filetype=ODM.FILETYPE_SNAPSHOT), self.clinical_data())
+
+    def write_audit_trail(self, target):
+        """
+        Write the audit trail of all the subjects, one audit record at a time
+
+        :param target: File path or binary file-like object
+        :return: Bytes written
+        """
+        return self._write(target, self._odm(), self.audit_trail())
+
+    def _write(self, target, odm, children):
+        if isinstance(target, str):
+            with open(target, "wb") as f:
+                return self._write(f, odm, children)
+        return write_odm(target, odm, children)
+
+
+def _serialise(element, level):
+    builder = ET.TreeBuilder()
+    element.build(builder)
+    root = builder.close()
+    indent(root, level)
+    return ET.tostring(root, encoding="unicode").rstrip().encode("utf-8")
+
+
+def write_odm(out, odm, children):
+    """
+    Write an ODM document, serialising its children one at a time
+
+    :param out: Binary file-like object
+    :param rwslib.builders.ODM odm: ODM element, its own children are ignored
+    :param children: Iterable of children of the ODM element (e.g. rwslib.builders.ClinicalData)
+    :return: Bytes written
+    """
+    empty = ET.tostring(_empty_root(odm), encoding="unicode")
+    parts = [XML_HEADER, (empty[: -len("/>")].rstrip() + ">\n").encode("utf-8")]
+    written = 0
+    for part in parts:
+        out.write(part)
+        written += len(part)
+    for child in children:
+        part = b"  " + _serialise(child, 1) + b"\n"
+        out.write(part)
+        written += len(part)
+    out.write(b"</ODM>\n")
+    written += len(b"</ODM>\n")
+    return written
+
+
+def _empty_root(odm):
+    """The root element of an ODM builder object, without children"""
+    study, clinical_data, admindata = odm.study, odm.clinical_data, odm.admindata
+    odm.study, odm.clinical_data, odm.admindata = None, [], None
+    try:
+        return odm.getroot()
+    finally:
+        odm.study, odm.clinical_data, odm.admindata = study, clinical_data, admindata
@@ -0,0 +1,947 @@
+# -*- coding: utf-8 -*-
+"""
+A local stand-in for Rave Web Services.
+
+:class:`RWSSimulator` is a small HTTP server answering the URLs built by the request classes in
+:mod:`rwslib.rws_requests`, :mod:`rwslib.rws_requests.odm_adapter` and :mod:`rwslib.rws_requests.biostats_gateway`
+with synthetic, reproducible data. Latency, bandwidth, error rates and payload sizes are configurable, so retries,
+pagination, concurrency and streaming can be exercised (and benchmarked) without a Rave instance::
+
+    config = SimulatorConfig(subjects=500, latency=0.05, error_rate=0.01)
+    with RWSSimulator(config) as simulator:
+        rws = RWSConnection(simulator.url, 'username', 'password')
+        subjects = rws.send_request(StudySubjectsRequest('Mediflex', 'Prod'))
+
+Or from the command line::
+
+    python -m rwslib.extras.rws_simulator --port 8080 --subjects 1000 --latency 0.05
+
+The simulator serves:
+
+* version, build version, code name, diagnostics and twohundred
+* the study list, metadata versions and drafts and study metadata (with the forms of the synthetic study)
+* subject lists, with workflow status and SubjectUUID keys when asked for
+* clinical datasets for a study, study version or subject, optionally for a single form
+* clinical audit records, paged with a ``Link: <...>; rel="next"`` header as RWS does
+* clinical view metadata and form data as CSV
+* posts of clinical data and metadata, gzipped or not
+
+Everything is generated from the seed, so two simulators with the same configuration serve the same data.
+"""
+import argparse
+import csv
+import gzip
+import io
+import random
+import re
+import threading
+import time
+import uuid
+import zlib
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlencode
+from xml.sax.saxutils import escape, quoteattr
+
+from rwslib.compression import DEFAULT_LEVEL
+from rwslib.rwsobjects import RWSSubjectListItem
+
+ODM_NS = (
+    'xmlns="http://www.cdisc.org/ns/odm/v1.3" '
+    'xmlns:mdsol="http://www.mdsol.com/ns/odm/metadata" '
+    'xmlns:xlink="http://www.w3.org/1999/xlink"'
+)
+
+# Fixed timestamp for generated documents so that responses are reproducible
+CREATION_DATETIME = "2020-01-01T00:00:00"
+
+# Bodies of at least this size are sent with chunked transfer encoding as they are generated
+CHUNK_SIZE = 64 * 1024
+
+# Workflow status flags of a subject
+STATUS_FLAGS = RWSSubjectListItem.STATUS_FLAGS
+
+WORDS = ("alpha", "bravo", "charlie", "delta", "echo", "foxtrot", "golf", "hotel", "india", "juliet")
+
+
+class SimulatorConfig(object):
+    """Shape of the data served by an RWSSimulator and how the server behaves"""
+
+    def __init__(
+        self,
+        studies=(("Mediflex", "Prod"), ("Mediflex", "Dev")),
+        sites=5,
+        subjects=50,
+        forms=("DM", "VS", "AE"),
+        fields=5,
+        records=1,
+        audit_records=500,
+        latency=0.0,
+        latency_jitter=0.0,
+        bytes_per_second=None,
+        error_rate=0.0,
+        error_statuses=(503,),
+        retry_after=None,
+        compress=True,
+        require_auth=True,
+        seed=0,
+        virtual_dir="RaveWebServices",
+    ):
+        """
+        :param tuple studies: (project name, environment name) of each study
+        :param int sites: Number of sites in each study
+        :param int subjects: Number of subjects in each study
+        :param tuple forms: OIDs of the forms in each study
+        :param int fields: Number of fields on each form
+        :param int records: Number of records (item group repeats) per form per subject
+        :param int audit_records: Number of audit records in each study
+        :param float latency: Seconds to wait before responding
+        :param float latency_jitter: Up to this many seconds are randomly added to the latency
+        :param int bytes_per_second: Limit the rate response bodies are sent at, None for no limit
+        :param float error_rate: Fraction of requests answered with one of `error_statuses`
+        :param tuple error_statuses: Statuses of injected errors, chosen at random
+        :param int retry_after: Value of the Retry-After header sent with injected errors, None to leave it out
+        :param bool compress: Gzip responses for clients that accept it
+        :param bool require_auth: Refuse authorized requests that have no Authorization header, as RWS does
+        :param int seed: Seed for the generated data and injected errors
+        :param str virtual_dir: Path the simulated RWS is served under
+        """
+        self.studies = tuple(studies)
+        self.sites = sites
+        self.subjects = subjects
+        self.forms = tuple(forms)
+        self.fields = fields
+        self.records = records
+        self.audit_records = audit_records
+        self.latency = latency
+        self.latency_jitter = latency_jitter
+        self.bytes_per_second = bytes_per_second
+        self.error_rate = error_rate
+        self.error_statuses = tuple(error_statuses)
+        self.retry_after = retry_after
+        self.compress = compress
+        self.require_auth = require_auth
+        self.seed = seed
+        self.virtual_dir = virtual_dir
+
+
+class SimulatorError(Exception):
+    """An RWS error response, raised while handling a request"""
+
+    def __init__(self, status, message, reason_code="RWS00092"):
+        super(SimulatorError, self).__init__(message)
+        self.status = status
+        self.message = message
+        self.reason_code = reason_code
+
+
+def iter_gzip(chunks, level=DEFAULT_LEVEL):
+    """
+    Gzip an iterable of chunks, yielding compressed chunks as they become available
+
+    :param chunks: Iterable of bytes or str
+    :param int level: Compression level, 1 (fastest) to 9 (smallest)
+    """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        if isinstance(chunk, str):
+            chunk = chunk.encode("utf-8")
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def _study_oid(project_name, environment_name):
+    return "%s(%s)" % (project_name, environment_name)
+
+
+def _yes_no(value):
+    return "Yes" if value else "No"
+
+
+def _error_response(message, reason_code):
+    return (
+        '<Response ReferenceNumber="%s" InboundODMFileOID="" IsTransactionSuccessful="0" '
+        'ReasonCode="%s" ErrorClientResponseMessage=%s></Response>'
+        % (uuid.uuid4(), reason_code, quoteattr(message))
+    )
+
+
+def _success_response(subjects=0, folders=0, forms=0, fields=0):
+    return (
+        '<Response ReferenceNumber="%s" InboundODMFileOID="" IsTransactionSuccessful="1" '
+        'SuccessStatistics="Rave objects touched: Subjects=%d; Folders=%d; Forms=%d; Fields=%d; LogLines=0" '
+        'NewRecords=""></Response>' % (uuid.uuid4(), subjects, folders, forms, fields)
+    )
+
+
+class SyntheticSubject(object):
+    """A subject in a synthetic study"""
+
+    def __init__(self, number, key, name, site, status):
+        """
+        :param int number: Position of the subject in the study, from 1
+        :param str key: Subject UUID
+        :param str name: Subject name
+        :param str site: Site LocationOID
+        :param dict status: Workflow status flags, by name (see STATUS_FLAGS)
+        """
+        self.number = number
+        self.key = key
+        self.name = name
+        self.site = site
+        self.status = status
+
+
+class SyntheticData(object):
+    """
+    Generates the ODM and CSV served by the simulator
+
+    All of the data is derived from the configuration's seed. Subclass and override methods to serve other data.
+    """
+
+    def __init__(self, config):
+        """
+        :param SimulatorConfig config: Shape of the data
+        """
+        self.config = config
+        self._subjects = {}
+        self._lock = threading.Lock()
+
+    def _random(self, *parts):
+        """A generator seeded from the configured seed and parts, so the same parts always give the same values"""
+        return random.Random(":".join(str(part) for part in (self.config.seed,) + parts))
+
+    def study_oids(self):
+        """OIDs of the simulated studies"""
+        return [_study_oid(project, environment) for project, environment in self.config.studies]
+
+    def check_study(self, study_oid):
+        """Raise a 404 for an unknown study"""
+        if study_oid not in self.study_oids():
+            raise SimulatorError(404, "Study %s not found" % study_oid, "RWS00060")
+
+    def check_project(self, project_name):
+        """Raise a 404 for an unknown project"""
+        if project_name not in [project for project, _ in self.config.studies]:
+            raise SimulatorError(404, "Project %s not found" % project_name, "RWS00060")
+
+    def check_form(self, form_oid):
+        """Raise a 404 for an unknown form"""
+        if form_oid not in self.config.forms:
+            raise SimulatorError(404, "Form %s not found" % form_oid, "RWS00061")
+
+    def fields(self, form_oid):
+        """
+        Fields of a form
+
+        :return: (OID, data type) of each field, data type being one of integer, date or text
+        """
+        kinds = ("integer", "date", "text")
+        return [("%s.FIELD%d" % (form_oid, i + 1), kinds[i % 3]) for i in range(self.config.fields)]
+
+    def subjects(self, study_oid):
+        """
+        Subjects of a study
+
+        :rtype: list(SyntheticSubject)
+        """
+        with self._lock:
+            if study_oid not in self._subjects:
+                rnd = self._random(study_oid, "subjects")
+                subjects = []
+                for number in range(1, self.config.subjects + 1):
+                    site = (number - 1) % self.config.sites + 1
+                    status = dict(
+                        (prop, rnd.random() < 0.2) for prop in STATUS_FLAGS
+                    )
+                    subjects.append(
+                        SyntheticSubject(
+                            number,
+                            str(uuid.UUID(int=rnd.getrandbits(128), version=4)),
+                            "%02d-%04d" % (site, number),
+                            "SITE%02d" % site,
+                            status,
+                        )
+                    )
+                self._subjects[study_oid] = subjects
+            return self._subjects[study_oid]
+
+    def subject(self, study_oid, subject_key):
+        """Find a subject by UUID or name"""
+        for subject in self.subjects(study_oid):
+            if subject_key in (subject.key, subject.name):
+                return subject
+        raise SimulatorError(404, "Subject %s not found" % subject_key, "RWS00062")
+
+    def value(self, rnd, data_type):
+        """A random value of a data type"""
+        if data_type == "integer":
+            return str(rnd.randint(1, 999))
+        if data_type == "date":
+            return "2020-%02d-%02d" % (rnd.randint(1, 12), rnd.randint(1, 28))
+        return " ".join(rnd.choice(WORDS) for _ in range(3))
+
+    # ODM documents
+
+    def _odm_open(self, file_type="Snapshot", granularity=None):
+        return '<ODM %s FileType="%s"%s FileOID="%s" CreationDateTime="%s" ODMVersion="1.3">\n' % (
+            ODM_NS,
+            file_type,
+            ' Granularity="%s"' % granularity if granularity else "",
+            uuid.UUID(int=self._random(file_type, granularity).getrandbits(128), version=4),
+            CREATION_DATETIME,
+        )
+
+    def _global_variables(self, name):
+        return (
+            "<GlobalVariables><StudyName>%s</StudyName><StudyDescription/>"
+            "<ProtocolName>%s</ProtocolName></GlobalVariables>" % (escape(name), escape(name))
+        )
+
+    def study_list(self):
+        """The study list, as returned by ClinicalStudiesRequest and MetadataStudiesRequest"""
+        parts = [self._odm_open()]
+        for project, environment in self.config.studies:
+            parts.append(
+                '<Study OID=%s>%s</Study>\n'
+                % (quoteattr(_study_oid(project, environment)), self._global_variables(project))
+            )
+        parts.append("</ODM>")
+        return "".join(parts)
+
+    def metadata_versions(self, project_name):
+        """Versions of a project's metadata, as returned by StudyVersionsRequest and StudyDraftsRequest"""
+        self.check_project(project_name)
+        return "%s<Study OID=%s>%s<MetaDataVersion OID=\"1\" Name=\"Initial\" /></Study>\n</ODM>" % (
+            self._odm_open(granularity="Metadata"),
+            quoteattr(project_name),
+            self._global_variables(project_name),
+        )
+
+    def metadata(self, project_name, version_oid="1"):
+        """A metadata version, as returned by StudyVersionRequest"""
+        self.check_project(project_name)
+        data_types = dict(integer=("integer", 3), date=("date", 10), text=("text", 200))
+        parts = [
+            self._odm_open(granularity="Metadata"),
+            "<Study OID=%s>%s" % (quoteattr(project_name), self._global_variables(project_name)),
+            '<MetaDataVersion OID=%s Name="Initial">' % quoteattr(str(version_oid)),
+            '<Protocol><StudyEventRef StudyEventOID="SCREENING" Mandatory="Yes" /></Protocol>',
+            '<StudyEventDef OID="SCREENING" Name="Screening" Repeating="No" Type="Scheduled">',
+        ]
+        for form_oid in self.config.forms:
+            parts.append('<FormRef FormOID="%s" Mandatory="Yes" />' % form_oid)
+        parts.append("</StudyEventDef>")
+        for form_oid in self.config.forms:
+            parts.append(
+                '<FormDef OID="%s" Name="%s" Repeating="No"><ItemGroupRef ItemGroupOID="%s" Mandatory="Yes" /></FormDef>'
+                % (form_oid, form_oid, form_oid)
+            )
+            parts.append('<ItemGroupDef OID="%s" Name="%s" Repeating="Yes">' % (form_oid, form_oid))
+            for item_oid, _ in self.fields(form_oid):
+                parts.append('<ItemRef ItemOID="%s" Mandatory="No" />' % item_oid)
+            parts.append("</ItemGroupDef>")
+        for form_oid in self.config.forms:
+            for item_oid, data_type in self.fields(form_oid):
+                odm_type, length = data_types[data_type]
+                parts.append(
+                    '<ItemDef OID="%s" Name="%s" DataType="%s" Length="%d" />'
+                    % (item_oid, item_oid.split(".")[1], odm_type, length)
+                )
+        parts.append("</MetaDataVersion></Study>\n</ODM>")
+        return "".join(parts)
+
+    def subject_list(self, study_oid, status=False, subject_key_type="SubjectName"):
+        """The subjects of a study, as returned by StudySubjectsRequest"""
+        self.check_study(study_oid)
+        parts = [self._odm_open()]
+        for subject in self.subjects(study_oid):
+            if subject_key_type == "SubjectUUID":
+                attrs = 'SubjectKey="%s" mdsol:SubjectKeyType="SubjectUUID" mdsol:SubjectName="%s"' % (
+                    subject.key,
+                    subject.name,
+                )
+            else:
+                attrs = 'SubjectKey="%s"' % subject.name
+            if status:
+                attrs += "".join(
+                    ' mdsol:%s="%s"' % (prop, _yes_no(subject.status[prop]))
+                    for prop in STATUS_FLAGS
+                )
+            parts.append(
+                '<ClinicalData StudyOID=%s MetaDataVersionOID="1"><SubjectData %s>'
+                '<SiteRef LocationOID="%s"/></SubjectData></ClinicalData>\n'
+                % (quoteattr(study_oid), attrs, subject.site)
+            )
+        parts.append("</ODM>")
+        return "".join(parts)
+
+    def subject_data(self, study_oid, subject, form_oid=None):
+        """The ClinicalData of a subject, for all forms or one"""
+        rnd = self._random(study_oid, subject.key)
+        parts = [
+            '<ClinicalData StudyOID=%s MetaDataVersionOID="1">'
+            '<SubjectData SubjectKey="%s" mdsol:SubjectKeyType="SubjectUUID" mdsol:SubjectName="%s">'
+            '<SiteRef LocationOID="%s"/><StudyEventData StudyEventOID="SCREENING">'
+            % (quoteattr(study_oid), subject.key, subject.name, subject.site)
+        ]
+        for form in self.config.forms:
+            # Values are drawn for every form so that a form's data does not depend on which forms were asked for
+            values = [
+                [(item_oid, self.value(rnd, data_type)) for item_oid, data_type in self.fields(form)]
+                for _ in range(self.config.records)
+            ]
+            if form_oid is not None and form != form_oid:
+                continue
+            parts.append('<FormData FormOID="%s" FormRepeatKey="1">' % form)
+            for repeat_key, items in enumerate(values, 1):
+                parts.append('<ItemGroupData ItemGroupOID="%s" ItemGroupRepeatKey="%d">' % (form, repeat_key))
+                for item_oid, value in items:
+                    parts.append('<ItemData ItemOID="%s" Value=%s/>' % (item_oid, quoteattr(value)))
+                parts.append("</ItemGroupData>")
+            parts.append("</FormData>")
+        parts.append("</StudyEventData></SubjectData></ClinicalData>\n")
+        return "".join(parts)
+
+    def clinical_data(self, study_oid, form_oid=None, subject_key=None):
+        """
+        A clinical dataset, as returned by StudyDatasetRequest, VersionDatasetRequest and SubjectDatasetRequest
+
+        :return: Iterator over the parts of the document, one per subject
+        """
+        self.check_study(study_oid)
+        if form_oid is not None:
+            self.check_form(form_oid)
+        if subject_key is not None:
+            subjects = [self.subject(study_oid, subject_key)]
+        else:
+            subjects = self.subjects(study_oid)
+        yield self._odm_open()
+        for subject in subjects:
+            yield self.subject_data(study_oid, subject, form_oid)
+        yield "</ODM>"
+
+    def audit_record(self, study_oid, audit_id):
+        """The ClinicalData of an audit record, ids start from 1"""
+        subjects = self.subjects(study_oid)
+        subject = subjects[(audit_id - 1) % len(subjects)]
+        rnd = self._random(study_oid, "audit", audit_id)
+        timestamp = "2020-%02d-%02dT%02d:%02d:%02d" % (
+            1 + (audit_id // 100000) % 12,
+            1 + (audit_id // 3600) % 28,
+            (audit_id // 60) % 24,
+            audit_id % 60,
+            rnd.randint(0, 59),
+        )
+        audit = (
+            '<AuditRecord><UserRef UserOID="simulator"/><LocationRef LocationOID="%s"/>'
+            "<DateTimeStamp>%s</DateTimeStamp><ReasonForChange/><SourceID>%d</SourceID></AuditRecord>"
+            % (subject.site, timestamp, audit_id)
+        )
+        subject_attrs = 'SubjectKey="%s" mdsol:SubjectKeyType="SubjectUUID" mdsol:SubjectName="%s"' % (
+            subject.key,
+            subject.name,
+        )
+        if audit_id <= len(subjects):
+            return (
+                '<ClinicalData StudyOID=%s MetaDataVersionOID="1" mdsol:AuditSubCategoryName="SubjectCreated">'
+                '<SubjectData %s TransactionType="Upsert">%s<SiteRef LocationOID="%s"/></SubjectData>'
+                "</ClinicalData>\n" % (quoteattr(study_oid), subject_attrs, audit, subject.site)
+            )
+        form_oid = rnd.choice(self.config.forms)
+        item_oid, data_type = rnd.choice(self.fields(form_oid))
+        return (
+            '<ClinicalData StudyOID=%s MetaDataVersionOID="1" mdsol:AuditSubCategoryName="Entered">'
+            '<SubjectData %s><SiteRef LocationOID="%s"/>'
+            '<StudyEventData StudyEventOID="SCREENING" StudyEventRepeatKey="SCREENING[1]">'
+            '<FormData FormOID="%s" FormRepeatKey="1"><ItemGroupData ItemGroupOID="%s">'
+            '<ItemData ItemOID="%s" TransactionType="Upsert" Value=%s>%s</ItemData>'
+            "</ItemGroupData></FormData></StudyEventData></SubjectData></ClinicalData>\n"
+            % (
+                quoteattr(study_oid),
+                subject_attrs,
+                subject.site,
+                form_oid,
+                form_oid,
+                item_oid,
+                quoteattr(self.value(rnd, data_type)),
+                audit,
+            )
+        )
+
+    def audit_records(self, study_oid, start_id, per_page):
+        """
+        A page of audit records, as returned by AuditRecordsRequest
+
+        :return: The page and the start id of the next page, None for the last page
+        """
+        self.check_study(study_oid)
+        start_id = max(1, start_id)
+        end_id = min(start_id + per_page, self.config.audit_records + 1)
+        parts = [self._odm_open(file_type="Transactional")]
+        for audit_id in range(start_id, end_id):
+            parts.append(self.audit_record(study_oid, audit_id))
+        parts.append("</ODM>")
+        return "".join(parts), end_id if end_id <= self.config.audit_records else None
+
+    # Clinical views
+
+    def view_columns(self, form_oid, raw=False):
+        """
+        Columns of the clinical view for a form
+
+        :return: (variable name, variable type) of each column, variable type being num or char
+        """
+        columns = [
+            ("subjectId", "num"),
+            ("Subject", "char"),
+            ("siteid", "num"),
+            ("SiteNumber", "char"),
+            ("RecordPosition", "num"),
+        ]
+        for item_oid, data_type in self.fields(form_oid):
+            columns.append(
+                (item_oid.split(".")[1], "num" if data_type == "integer" and not raw else "char")
+            )
+        return columns
+
+    def view_metadata(self, project_name):
+        """Clinical view metadata for a project as CSV, as returned by ProjectMetaDataRequest"""
+        self.check_project(project_name)
+        out = io.StringIO()
+        writer = csv.writer(out, quoting=csv.QUOTE_ALL, lineterminator="\n")
+        writer.writerow(["projectname", "viewname", "ordinal", "varname", "vartype", "varlength", "varformat", "varlabel"])
+        for form_oid in self.config.forms:
+            for raw in (False, True):
+                viewname = "V_%s_%s%s" % (project_name, form_oid, "_RAW" if raw else "")
+                for ordinal, (varname, vartype) in enumerate(self.view_columns(form_oid, raw), 1):
+                    length = 8 if vartype == "num" else 200
+                    varformat = "10." if vartype == "num" else "$200."
+                    writer.writerow([project_name, viewname, ordinal, varname, vartype, length, varformat, varname])
+        out.write("EOF")
+        return out.getvalue()
+
+    def form_data(self, study_oid, form_oid, raw=False):
+        """
+        Clinical view data for a form as CSV, as returned by FormDataRequest
+
+        :return: Iterator over the parts of the CSV, one per subject
+        """
+        self.check_study(study_oid)
+        self.check_form(form_oid)
+        out = io.StringIO()
+        writer = csv.writer(out, lineterminator="\n")
+        writer.writerow([name for name, _ in self.view_columns(form_oid, raw)])
+        yield out.getvalue()
+        for subject in self.subjects(study_oid):
+            out = io.StringIO()
+            writer = csv.writer(out, lineterminator="\n")
+            rnd = self._random(study_oid, subject.key)
+            for form in self.config.forms:
+                for position in range(1, self.config.records + 1):
+                    values = [self.value(rnd, data_type) for _, data_type in self.fields(form)]
+                    if form == form_oid:
+                        writer.writerow(
+                            [subject.number, subject.name, subject.site[4:], subject.site, position] + values
+                        )
+            yield out.getvalue()
+        yield "EOF"
+
+
+class SimulatorHandler(BaseHTTPRequestHandler):
+    """Handles requests to an RWSSimulator"""
+
+    protocol_version = "HTTP/1.1"
+    server_version = "RWSSimulator"
+    # Headers and body are written separately, Nagle's algorithm would hold the body back on kept-alive connections
+    disable_nagle_algorithm = True
+
+    # (pattern, method name, requires authorization) for GET requests, matched against the path under the virtual dir
+    GET_ROUTES = [
+        (r"version", "get_version", False),
+        (r"version/build", "get_build_version", False),
+        (r"version/codename", "get_codename", False),
+        (r"diagnostics", "get_diagnostics", False),
+        (r"twohundred", "get_twohundred", False),
+        (r"webservice\.aspx", "get_cache_flush", True),
+        (r"(?:metadata/)?studies", "get_study_list", True),
+        (r"metadata/studies/(?P<project>[^/]+)/(?:versions|drafts)", "get_metadata_versions", True),
+        (r"metadata/studies/(?P<project>[^/]+)/versions/(?P<version>[^/]+)", "get_metadata", True),
+        (r"studies/(?P<study>[^/]+)/subjects", "get_subjects", True),
+        (r"studies/(?P<study>[^/]+)/datasets/metadata/regular", "get_cv_metadata", True),
+        (r"studies/(?P<study>[^/]+)/datasets/(?P<type>\w+)(?:/(?P<form>[^/]+))?", "get_dataset", True),
+        (
+            r"studies/(?P<study>[^/]+)/versions/(?P<version>[^/]+)/datasets/(?P<type>\w+)(?:/(?P<form>[^/]+))?",
+            "get_dataset",
+            True,
+        ),
+        (
+            r"studies/(?P<study>[^/]+)/subjects/(?P<subject>[^/]+)/datasets/(?P<type>\w+)(?:/(?P<form>[^/]+))?",
+            "get_dataset",
+            True,
+        ),
+        (r"datasets/ClinicalAuditRecords\.odm", "get_audit_records", True),
+        (r"datasets/ClinicalViewMetadata\.csv", "get_view_metadata", True),
+    ]
+
+    POST_ROUTES = [
+        (r"webservice\.aspx", "post_clinical_data", True),
+        (r"metadata/studies/(?P<project>[^/]+)/drafts", "post_metadata", True),
+    ]
+
+    def log_message(self, format, *args):
+        pass
+
+    @property
+    def simulator(self):
+        return self.server.simulator
+
+    @property
+    def data(self):
+        return self.server.simulator.data
+
+    def do_GET(self):
+        self._handle(self.GET_ROUTES)
+
+    def do_POST(self):
+        self._handle(self.POST_ROUTES)
+
+    def _route(self, routes):
+        path, _, query = self.path.partition("?")
+        prefix = "/%s/" % self.simulator.config.virtual_dir
+        if path.startswith(prefix):
+            path = unquote(path[len(prefix):])
+            for pattern, name, authorized in routes:
+                match = re.match(pattern + "$", path)
+                if match:
+                    return name, authorized, match.groupdict(), parse_qs(query, keep_blank_values=True)
+        raise SimulatorError(404, "Unknown resource %s" % self.path)
+
+    def _handle(self, routes):
+        config = self.simulator.config
+        try:
+            body = self._read_body()
+            name, authorized, params, query = self._route(routes)
+            self.simulator._count(name)
+            delay = config.latency
+            if config.latency_jitter:
+                delay += self.simulator._random() * config.latency_jitter
+            if delay:
+                time.sleep(delay)
+            status = self.simulator._injected_error()
+            if status is not None:
+                headers = {}
+                if config.retry_after is not None:
+                    headers["Retry-After"] = str(config.retry_after)
+                self._send(status, "HTTP %d Service Temporarily Unavailable" % status, "text/plain", headers)
+                return
+            if authorized and config.require_auth and "Authorization" not in self.headers:
+                self._send(401, "Authorization Header not provided", "text/plain")
+                return
+            getattr(self, name)(body=body, query=query, **params)
+        except SimulatorError as error:
+            self._send(error.status, _error_response(error.message, error.reason_code))
+
+    def _read_body(self):
+        if "chunked" in self.headers.get("Transfer-Encoding", "").lower():
+            body = self._read_chunks()
+        else:
+            length = int(self.headers.get("Content-Length") or 0)
+            body = self.rfile.read(length) if length else b""
+        if body and self.headers.get("Content-Encoding") == "gzip":
+            body = gzip.decompress(body)
+        return body
+
+    def _read_chunks(self):
+        """Read a body sent with Transfer-Encoding: chunked (e.g. posted from a generator)"""
+        chunks = []
+        while True:
+            line = self.rfile.readline(1024)
+            try:
+                size = int(line.split(b";")[0], 16)
+            except ValueError:
+                self.close_connection = True
+                raise SimulatorError(400, "Malformed chunk size %r" % line)
+            if not size:
+                break
+            chunks.append(self.rfile.read(size))
+            self.rfile.readline(1024)
+        # Skip any trailers up to the blank line ending the body
+        while self.rfile.readline(1024) not in (b"\r\n", b"\n", b""):
+            pass
+        return b"".join(chunks)
+
+    def _send(self, status, body, content_type="text/xml; charset=utf-8", headers=None):
+        """Send a response, body being a str or an iterable of str sent as it is generated"""
+        config = self.simulator.config
+        compress = config.compress and "gzip" in self.headers.get("Accept-Encoding", "")
+        chunks = [body] if isinstance(body, str) else body
+        chunks = (chunk.encode("utf-8") for chunk in chunks)
+        if compress:
+            chunks = iter_gzip(chunks)
+        # Generate the start of the body before sending the status, so that errors in generating it are reported.
+        # Small bodies are sent with a Content-Length, larger ones chunked as they are generated
+        buffered = []
+        size = 0
+        for chunk in chunks:
+            buffered.append(chunk)
+            size += len(chunk)
+            if size >= CHUNK_SIZE:
+                break
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        if compress:
+            self.send_header("Content-Encoding", "gzip")
+        for header, value in (headers or {}).items():
+            self.send_header(header, value)
+        if size < CHUNK_SIZE:
+            data = b"".join(buffered)
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self._write(data)
+            return
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for chunk in self._rechunk(buffered, chunks):
+            self._write(b"%X\r\n%s\r\n" % (len(chunk), chunk))
+        self._write(b"0\r\n\r\n")
+
+    @staticmethod
+    def _rechunk(buffered, chunks):
+        """Join chunks into pieces of about CHUNK_SIZE"""
+        pending = list(buffered)
+        size = sum(len(chunk) for chunk in pending)
+        for chunk in chunks:
+            pending.append(chunk)
+            size += len(chunk)
+            if size >= CHUNK_SIZE:
+                yield b"".join(pending)
+                pending = []
+                size = 0
+        if size:
+            yield b"".join(pending)
+
+    def _write(self, data):
+        bytes_per_second = self.simulator.config.bytes_per_second
+        if not bytes_per_second:
+            self.wfile.write(data)
+            return
+        # Send in slices so that the rate is held within a response
+        step = max(1, bytes_per_second // 20)
+        for start in range(0, len(data), step):
+            piece = data[start:start + step]
+            time.sleep(float(len(piece)) / bytes_per_second)
+            self.wfile.write(piece)
+            self.wfile.flush()
+
+    # Handlers
+
+    def get_version(self, **kwargs):
+        self._send(200, "1.15.0", "text/plain")
+
+    def get_build_version(self, **kwargs):
+        self._send(200, "5.6.5.187", "text/plain")
+
+    def get_codename(self, **kwargs):
+        self._send(200, "Uranium", "text/plain")
+
+    def get_diagnostics(self, **kwargs):
+        self._send(200, "OK", "text/plain")
+
+    def get_twohundred(self, **kwargs):
+        self._send(200, "<html><body><h1>200 OK</h1></body></html>", "text/html")
+
+    def get_cache_flush(self, query, **kwargs):
+        if "CacheFlush" not in query:
+            raise SimulatorError(404, "Unknown resource %s" % self.path)
+        self._send(200, _success_response())
+
+    def get_study_list(self, **kwargs):
+        self._send(200, self.data.study_list())
+
+    def get_metadata_versions(self, project, **kwargs):
+        self._send(200, self.data.metadata_versions(project))
+
+    def get_metadata(self, project, version, **kwargs):
+        self._send(200, self.data.metadata(project, version))
+
+    def get_cv_metadata(self, study, **kwargs):
+        project = study.split("(")[0]
+        self.data.check_study(study)
+        self._send(200, self.data.metadata(project))
+
+    def get_subjects(self, study, query, **kwargs):
+        status = query.get("status", [""])[0] == "all"
+        subject_key_type = query.get("subjectKeyType", ["SubjectName"])[0]
+        self._send(200, self.data.subject_list(study, status, subject_key_type))
+
+    def get_dataset(self, study, type, form=None, subject=None, **kwargs):
+        dataset_type = type.lower()
+        if dataset_type not in ("regular", "raw"):
+            raise SimulatorError(404, "Dataset type %s not found" % type)
+        if form is not None and form.endswith(".csv"):
+            self._send(200, self.data.form_data(study, form[:-4], dataset_type == "raw"), "text/csv")
+        else:
+            self._send(200, self.data.clinical_data(study, form, subject))
+
+    def get_audit_records(self, query, **kwargs):
+        study = query.get("studyoid", [""])[0]
+        start_id = int(query.get("startid", ["1"])[0])
+        per_page = int(query.get("per_page", ["100"])[0])
+        page, next_id = self.data.audit_records(study, start_id, per_page)
+        headers = {}
+        if next_id is not None:
+            next_query = dict((key, values[0]) for key, values in query.items())
+            next_query["startid"] = next_id
+            headers["Link"] = '<http://%s/%s/datasets/ClinicalAuditRecords.odm?%s>; rel="next"' % (
+                self.headers.get("Host"),
+                self.simulator.config.virtual_dir,
+                urlencode(next_query),
+            )
+        self._send(200, page, headers=headers)
+
+    def get_view_metadata(self, query, **kwargs):
+        project = query.get("ProjectName", [""])[0]
+        self._send(200, self.data.view_metadata(project), "text/csv")
+
+    def post_clinical_data(self, body, query, **kwargs):
+        if "PostODMClinicalData" not in query:
+            raise SimulatorError(404, "Unknown resource %s" % self.path)
+        subjects = len(re.findall(rb"<SubjectData\b", body))
+        self.simulator._record_post(body)
+        self._send(200, _success_response(subjects=subjects))
+
+    def post_metadata(self, body, project, **kwargs):
+        self.data.check_project(project)
+        self.simulator._record_post(body)
+        self._send(200, _success_response())
+
+
+class RWSSimulator(object):
+    """A local HTTP server that imitates RWS, serving synthetic data"""
+
+    def __init__(self, config=None, data=None, host="127.0.0.1", port=0):
+        """
+        :param SimulatorConfig config: Data and behaviour of the simulator, defaults to SimulatorConfig()
+        :param SyntheticData data: Generator of the served data, defaults to a SyntheticData for the config
+        :param str host: Address to listen on
+        :param int port: Port to listen on, 0 to pick a free port
+        """
+        self.config = config or SimulatorConfig()
+        self.data = data or SyntheticData(self.config)
+        self.host = host
+        self.port = port
+        # Requests received by handler name, and errors injected
+        self.requests = Counter()
+        self.errors_injected = 0
+        # Bodies posted, decompressed
+        self.posts = []
+        self._lock = threading.Lock()
+        self._rnd = random.Random(self.config.seed)
+        self._server = None
+        self._thread = None
+
+    @property
+    def url(self):
+        """URL to pass as the domain of an RWSConnection"""
+        return "http://%s:%d" % (self.host, self.port)
+
+    def start(self):
+        """Start serving in a background thread"""
+        self._server = ThreadingHTTPServer((self.host, self.port), SimulatorHandler)
+        self._server.daemon_threads = True
+        self._server.simulator = self
+        self.port = self._server.server_address[1]
+        # A short poll interval keeps stop() quick
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, kwargs=dict(poll_interval=0.05), name="RWSSimulator"
+        )
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stop serving"""
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._thread.join()
+            self._server = None
+            self._thread = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def _random(self):
+        with self._lock:
+            return self._rnd.random()
+
+    def _count(self, name):
+        with self._lock:
+            self.requests[name] += 1
+
+    def _injected_error(self):
+        """Status of an error to inject, None to answer normally"""
+        if not self.config.error_rate:
+            return None
+        with self._lock:
+            if self._rnd.random() >= self.config.error_rate:
+                return None
+            self.errors_injected += 1
+            return self._rnd.choice(self.config.error_statuses)
+
+    def _record_post(self, body):
+        with self._lock:
+            self.posts.append(body)
+
+
+def main(args=None):
+    """Run a simulator from the command line until interrupted"""
+    parser = argparse.ArgumentParser(description="Serve a local imitation of Rave Web Services")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--subjects", type=int, default=50, help="Subjects per study")
+    parser.add_argument("--sites", type=int, default=5, help="Sites per study")
+    parser.add_argument("--forms", default="DM,VS,AE", help="Comma separated form OIDs")
+    parser.add_argument("--fields", type=int, default=5, help="Fields per form")
+    parser.add_argument("--records", type=int, default=1, help="Records per form per subject")
+    parser.add_argument("--audit-records", type=int, default=500, help="Audit records per study")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds to wait before responding")
+    parser.add_argument("--latency-jitter", type=float, default=0.0, help="Random extra latency, in seconds")
+    parser.add_argument("--bytes-per-second", type=int, default=None, help="Bandwidth limit for responses")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests that fail")
+    parser.add_argument("--retry-after", type=int, default=None, help="Retry-After sent with failures")
+    parser.add_argument("--seed", type=int, default=0)
+    options = parser.parse_args(args)
+    config = SimulatorConfig(
+        subjects=options.subjects,
+        sites=options.sites,
+        forms=options.forms.split(","),
+        fields=options.fields,
+        records=options.records,
+        audit_records=options.audit_records,
+        latency=options.latency,
+        latency_jitter=options.latency_jitter,
+        bytes_per_second=options.bytes_per_second,
+        error_rate=options.error_rate,
+        retry_after=options.retry_after,
+        seed=options.seed,
+    )
+    simulator = RWSSimulator(config, host=options.host, port=options.port).start()
+    print("Serving RWS at %s/%s" % (simulator.url, config.virtual_dir))
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        simulator.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -82,28 +82,28 @@ def get_data(ctx, study, environment, subject):
     # Get the client instance
     client = ctx.obj['RWS']  #: type: RWSConnection
     # Client rolls in the base_url
-    resp = client.send_request(cfg)
+    call = client.execute(cfg)
     # resp = requests.get(url, auth=HTTPBasicAuth(ctx.obj['USERNAME'], ctx.obj['PASSWORD']))
 
-    if client.last_result.status_code != 200:
-        click.echo(client.last_result.text)
+    if call.status_code != 200:
+        click.echo(call.response.text)
 
-    return xml_pretty_print(resp)
+    return xml_pretty_print(call.result)
 
 
 def rws_call(ctx, method, default_attr=None):
     """Make request to RWS"""
     try:
-        response = ctx.obj['RWS'].send_request(method)
+        call = ctx.obj['RWS'].execute(method)
 
         if ctx.obj['RAW']:  # use response from RWS
-            result = ctx.obj['RWS'].last_result.text
+            result = call.response.text
         elif default_attr is not None:  # human-readable summary
             result = ""
-            for item in response:
-                result = result + item.__dict__[default_attr] + "\n"
+            for item in call.result:
+                result = result + getattr(item, default_attr) + "\n"
         else:  # use response from RWS
-            result = ctx.obj['RWS'].last_result.text
+            result = call.response.text
 
         if ctx.obj['OUTPUT']:  # write to file
             ctx.obj['OUTPUT'].write(result.encode('utf-8'))
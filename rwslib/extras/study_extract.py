@@ -0,0 +1,275 @@
+# -*- coding: utf-8 -*-
+"""
+Study datasets extracted one form at a time, concurrently.
+
+A ``StudyDatasetRequest`` without a ``formoid`` returns a whole study in one response, which can take long enough to
+hit read timeouts and cannot be spread over connections. :class:`StudyExtraction` instead reads the forms of the study
+from its metadata (``StudyVersionRequest``) and requests the dataset of each form separately, a few at a time::
+
+    extraction = StudyExtraction(rave, 'Mediflex', 'Prod', max_workers=4)
+    extracts = extraction.write_forms('mediflex')  # mediflex/DM.xml, mediflex/VS.xml, ...
+    failed = [form_oid for form_oid, extract in extracts.items() if not extract.ok]
+
+    for clinical_data in extraction.clinical_data():  # or as one stream of ClinicalData
+        process(clinical_data)
+
+Each form is downloaded to a file, so a form that fails is tried again on its own (up to `attempts` times, waiting as
+a :class:`rwslib.retry.RetryPolicy` decides in between) without repeating the others, and forms already downloaded
+are handed on while the rest are still being fetched.
+"""
+import collections
+import concurrent.futures
+import datetime
+import os
+import re
+import shutil
+import tempfile
+import uuid
+
+from lxml import etree
+
+from rwslib.retry import RetryPolicy
+from rwslib.rws_requests import StudyDatasetRequest, StudyVersionRequest, StudyVersionsRequest
+from rwslib.rwsobjects import ODM_NS, parseXMLString
+
+XML_HEADER = b'<?xml version="1.0" encoding="utf-8" ?>\n'
+
+
+def metadata_form_oids(metadata):
+    """
+    OIDs of the forms defined in study metadata, in the order they are defined
+
+    :param metadata: ODM metadata, e.g. the result of StudyVersionRequest
+    :rtype: list(str)
+    """
+    return [form_def.get("OID") for form_def in parseXMLString(metadata).iter(ODM_NS + "FormDef")]
+
+
+def form_filename(form_oid):
+    """Name of the file a form's dataset is written to"""
+    return "%s.xml" % re.sub(r"[^\w.-]", "_", form_oid)
+
+
+class FormExtract(object):
+    """The outcome of extracting the dataset of one form"""
+
+    def __init__(self, form_oid, path):
+        """
+        :param str form_oid: OID of the form
+        :param str path: File the dataset is written to
+        """
+        self.form_oid = form_oid
+        self.path = path
+        # RWSDownload of the dataset, once downloaded
+        self.download = None  # type: rwslib.RWSDownload
+        # Number of times the form was requested
+        self.attempts = 0
+        # Exception raised by the last attempt, if it failed
+        self.exception = None
+
+    @property
+    def ok(self):
+        """Was the dataset downloaded?"""
+        return self.download is not None
+
+    def __repr__(self):
+        return "FormExtract(form_oid=%r, path=%r, attempts=%d, ok=%r)" % (
+            self.form_oid,
+            self.path,
+            self.attempts,
+            self.ok,
+        )
+
+
+class StudyExtraction(object):
+    """
+    The clinical dataset of a study, requested as one ``StudyDatasetRequest`` per form on a bounded pool of threads.
+    """
+
+    def __init__(
+        self,
+        rws_connection,
+        project_name,
+        environment_name,
+        dataset_type="regular",
+        forms=None,
+        version_oids=None,
+        max_workers=4,
+        attempts=2,
+        timeout=None,
+        retry_policy=None,
+        **options
+    ):
+        """
+        :param rwslib.RWSConnection rws_connection: Connection to make the requests with
+        :param str project_name: Name of the Rave Study
+        :param str environment_name: Name of the Rave Study Environment
+        :param str dataset_type: Dataset type, one of 'regular' or 'raw'
+        :param list forms: OIDs of the forms to extract, read from the metadata when not given
+        :param list version_oids: Study versions to read the forms from, all versions when not given
+        :param int max_workers: Maximum number of forms requested at once
+        :param int attempts: Number of times a form is requested before giving up on it
+        :param int timeout: Timeout, in seconds, for each request
+        :param rwslib.retry.RetryPolicy retry_policy: Decides how long to wait before trying a form again, with
+            exponential backoff and jitter so that workers do not all try again at once. Defaults to RetryPolicy()
+        :param options: Other options of each StudyDatasetRequest, e.g. ``start`` or ``rawsuffix``
+
+        .. note::
+            To reuse connections between requests ``pool_maxsize`` for the connection should be at least
+            `max_workers`
+        """
+        self.rws_connection = rws_connection
+        self.project_name = project_name
+        self.environment_name = environment_name
+        self.dataset_type = dataset_type
+        self.forms = list(forms) if forms is not None else None
+        self.version_oids = version_oids
+        self.max_workers = max_workers
+        self.attempts = attempts
+        self.timeout = timeout
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.options = options
+
+    def form_oids(self):
+        """
+        OIDs of the forms to extract: those given, or those of all the study versions asked for (once each, in the
+        order they are first defined)
+
+        :rtype: list(str)
+        """
+        if self.forms is None:
+            version_oids = self.version_oids
+            if version_oids is None:
+                versions = self.rws_connection.send_request(StudyVersionsRequest(self.project_name))
+                version_oids = [version.oid for version in versions]
+            requests = [StudyVersionRequest(self.project_name, oid) for oid in version_oids]
+            forms = collections.OrderedDict()
+            for call in self.rws_connection.send_requests(
+                requests, max_workers=self.max_workers, timeout=self.timeout
+            ):
+                if call.exception is not None:
+                    raise call.exception
+                for form_oid in metadata_form_oids(call.result):
+                    forms[form_oid] = True
+            self.forms = list(forms)
+        return self.forms
+
+    def plan(self):
+        """
+        The request for each form
+
+        :rtype: list(rwslib.rws_requests.StudyDatasetRequest)
+        """
+        return [
+            StudyDatasetRequest(
+                self.project_name, self.environment_name, self.dataset_type, formoid=form_oid, **self.options
+            )
+            for form_oid in self.form_oids()
+        ]
+
+    def _extract(self, request, extract):
+        """Download the dataset of a form, trying again on failure after a backoff. Run on the pool"""
+        while True:
+            extract.attempts += 1
+            try:
+                extract.download = self.rws_connection.execute(
+                    request, timeout=self.timeout, sink=extract.path
+                ).result
+                extract.exception = None
+                return extract
+            except Exception as exc:
+                extract.exception = exc
+            if extract.attempts >= self.attempts:
+                return extract
+            # This thread's last response, so a Retry-After of a throttled form is respected
+            response = self.rws_connection.last_result
+            if response is not None and response.status_code not in self.retry_policy.statuses:
+                response = None
+            self.retry_policy.wait(extract.attempts - 1, response)
+
+    def _submit(self, executor, directory, forms):
+        requests = self.plan()
+        if forms is not None:
+            requests = [request for request in requests if request.formoid in forms]
+        return [
+            executor.submit(
+                self._extract,
+                request,
+                FormExtract(request.formoid, os.path.join(directory, form_filename(request.formoid))),
+            )
+            for request in requests
+        ]
+
+    def write_forms(self, directory, forms=None):
+        """
+        Write the dataset of each form to a file in a directory, named by :func:`form_filename`
+
+        :param str directory: Directory to write to, created if needed
+        :param list forms: Only these forms, e.g. those that failed before
+        :return: The outcome for each form, in the order of the forms
+        :rtype: collections.OrderedDict(str, FormExtract)
+        """
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = self._submit(executor, directory, forms)
+            extracts = [future.result() for future in futures]
+        return collections.OrderedDict((extract.form_oid, extract) for extract in extracts)
+
+    def clinical_data(self):
+        """
+        The ClinicalData elements of every form, form by form. A form's elements are handed on as soon as it and the
+        forms before it have been downloaded, while the forms after it are still being fetched. Each element is
+        discarded once the next has been read.
+
+        Raises the exception of the first form that could not be downloaded, when it is reached.
+
+        :rtype: iterator(lxml.etree._Element)
+        """
+        directory = tempfile.mkdtemp(prefix="rwslib-extract-")
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers)
+        futures = []
+        try:
+            futures = self._submit(executor, directory, None)
+            for future in futures:
+                extract = future.result()
+                if not extract.ok:
+                    raise extract.exception
+                for _, elem in etree.iterparse(extract.path, tag=ODM_NS + "ClinicalData", huge_tree=True):
+                    yield elem
+                    elem.clear()
+                    while elem.getprevious() is not None:
+                        del elem.getparent()[0]
+                os.unlink(extract.path)
+        finally:
+            # Don't start outstanding forms if the caller stops iterating early
+            for future in futures:
+                future.cancel()
+            executor.shutdown(wait=True)
+            shutil.rmtree(directory, ignore_errors=True)
+
+    def write_clinical_data(self, out):
+        """
+        Write the ClinicalData of every form as one ODM document (a subject has a ClinicalData for each form)
+
+        :param out: File path or binary file-like object
+        :return: Number of ClinicalData elements written
+        :rtype: int
+        """
+        if not hasattr(out, "write"):
+            with open(out, "wb") as fh:
+                return self.write_clinical_data(fh)
+        file_oid = str(uuid.uuid4()).encode("ascii")
+        created = datetime.datetime.now(datetime.timezone.utc).strftime("%Y-%m-%dT%H:%M:%S").encode("ascii")
+        out.write(XML_HEADER)
+        out.write(
+            b'<ODM xmlns="http://www.cdisc.org/ns/odm/v1.3" xmlns:mdsol="http://www.mdsol.com/ns/odm/metadata" '
+            b'FileType="Snapshot" FileOID="%s" CreationDateTime="%s" ODMVersion="1.3">\n' % (file_oid, created)
+        )
+        count = 0
+        for clinical_data in self.clinical_data():
+            out.write(etree.tostring(clinical_data, encoding="utf-8", with_tail=False))
+            out.write(b"\n")
+            count += 1
+        out.write(b"</ODM>\n")
+        return count
@@ -0,0 +1,323 @@
+"""
+An in-process metrics registry for RWSConnection.
+
+:class:`MetricsRegistry` is a request observer (see :mod:`rwslib.timing`) that keeps call counts, byte counts, time
+spent in each phase and a fixed-bucket latency histogram for each request class and outcome. Add it to the observers
+of one or more connections and take a snapshot, as a dict or in the Prometheus text format, whenever needed::
+
+    registry = MetricsRegistry()
+    rws = RWSConnection('innovate', 'username', 'password', observers=[registry])
+    ...
+    registry.snapshot()['StudyDatasetRequest']['success']['latency']['p95']
+
+Each thread records into its own series so recording takes no locks; a snapshot merges the series of all threads.
+The series of a thread that has ended are folded into one shared set, so threads of short-lived pools (e.g. those of
+``send_requests``) do not accumulate.
+"""
+import bisect
+import threading
+import weakref
+
+from rwslib.timing import RequestObserver, RequestTiming
+
+# Upper bounds, in seconds, of the latency histogram buckets
+DEFAULT_BUCKETS = (
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+    60.0,
+    120.0,
+    300.0,
+    float("inf"),
+)
+
+# Outcomes of a call
+SUCCESS = "success"
+CACHED = "cached"
+ERROR = "error"
+
+
+class Histogram(object):
+    """A fixed-bucket histogram"""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        """
+        :param tuple buckets: Sorted upper bounds of the buckets, the last should be infinity
+        """
+        self.buckets = tuple(buckets)
+        self.counts = [0] * len(self.buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        """Record a value"""
+        self.counts[min(bisect.bisect_left(self.buckets, value), len(self.buckets) - 1)] += 1
+        self.count += 1
+        self.sum += value
+
+    def merge(self, other):
+        """Add the values recorded by another histogram with the same buckets"""
+        for i, count in enumerate(other.counts):
+            self.counts[i] += count
+        self.count += other.count
+        self.sum += other.sum
+
+    def quantile(self, q):
+        """
+        Estimate a quantile, interpolating within the bucket it falls in
+
+        :param float q: Quantile, between 0 and 1
+        :return: Estimated value, None if nothing has been recorded
+        """
+        if self.count == 0:
+            return None
+        rank = q * self.count
+        cumulative = 0
+        for i, count in enumerate(self.counts):
+            if count and cumulative + count >= rank:
+                lower = self.buckets[i - 1] if i > 0 else 0.0
+                upper = self.buckets[i]
+                if upper == float("inf"):
+                    # No upper bound to interpolate to
+                    return lower
+                return lower + (upper - lower) * (rank - cumulative) / count
+            cumulative += count
+
+    def cumulative_counts(self):
+        """Counts of values less than or equal to each bucket bound, as in Prometheus"""
+        total = 0
+        result = []
+        for count in self.counts:
+            total += count
+            result.append(total)
+        return result
+
+
+class _Series(object):
+    """Counters and histogram for one request class and outcome"""
+
+    def __init__(self, buckets):
+        self.calls = 0
+        self.retries = 0
+        self.bytes_sent = 0
+        self.bytes_sent_uncompressed = 0
+        self.bytes_received = 0
+        self.content_bytes = 0
+        self.phases = dict((phase, 0.0) for phase in RequestTiming.PHASES)
+        self.latency = Histogram(buckets)
+
+    def record(self, timing):
+        self.calls += 1
+        self.retries += timing.retries
+        self.bytes_sent += timing.bytes_sent
+        self.bytes_sent_uncompressed += timing.bytes_sent_uncompressed
+        self.bytes_received += timing.bytes_received
+        self.content_bytes += timing.content_bytes
+        for phase in RequestTiming.PHASES:
+            self.phases[phase] += getattr(timing, phase)
+        self.latency.observe(timing.total or 0.0)
+
+    def merge(self, other):
+        self.calls += other.calls
+        self.retries += other.retries
+        self.bytes_sent += other.bytes_sent
+        self.bytes_sent_uncompressed += other.bytes_sent_uncompressed
+        self.bytes_received += other.bytes_received
+        self.content_bytes += other.content_bytes
+        for phase, seconds in other.phases.items():
+            self.phases[phase] += seconds
+        self.latency.merge(other.latency)
+
+
+def _outcome(timing):
+    if timing.exception is not None:
+        return ERROR
+    if timing.from_cache:
+        return CACHED
+    return SUCCESS
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_bound(bound):
+    return "+Inf" if bound == float("inf") else repr(float(bound))
+
+
+def _merge_into(merged, store, buckets):
+    """Add the series of a store to those of another"""
+    for key, series in list(store.items()):
+        if key not in merged:
+            merged[key] = _Series(buckets)
+        merged[key].merge(series)
+
+
+class _StoreOwner(object):
+    """Kept in a thread's locals to find out when the thread has ended"""
+
+
+def _retire_store(registry_ref, store):
+    registry = registry_ref()
+    if registry is not None:
+        registry._retire(store)
+
+
+class MetricsRegistry(RequestObserver):
+    """Keeps counters and latency histograms by request class and outcome"""
+
+    QUANTILES = (0.5, 0.95, 0.99)
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        """
+        :param tuple buckets: Upper bounds, in seconds, of the latency histogram buckets
+        """
+        self.buckets = tuple(buckets)
+        if self.buckets[-1] != float("inf"):
+            self.buckets += (float("inf"),)
+        self._local = threading.local()
+        # Series of every live thread that has recorded, by id of the store
+        self._stores = {}
+        # Series of threads that have ended
+        self._base = {}
+        self._stores_lock = threading.Lock()
+
+    def _store(self):
+        store = getattr(self._local, "store", None)
+        if store is None:
+            store = self._local.store = {}
+            # Dropped with the rest of the thread's locals when the thread ends
+            self._local.owner = owner = _StoreOwner()
+            weakref.finalize(owner, _retire_store, weakref.ref(self), store)
+            with self._stores_lock:
+                self._stores[id(store)] = store
+        return store
+
+    def _retire(self, store):
+        """Fold the series of a thread that has ended into the base series"""
+        with self._stores_lock:
+            self._stores.pop(id(store), None)
+            _merge_into(self._base, store, self.buckets)
+
+    def on_request(self, timing):
+        """Record a call"""
+        store = self._store()
+        key = (timing.request_name, _outcome(timing))
+        series = store.get(key)
+        if series is None:
+            series = store[key] = _Series(self.buckets)
+        series.record(timing)
+
+    def reset(self):
+        """Forget everything recorded"""
+        with self._stores_lock:
+            self._base.clear()
+            for store in self._stores.values():
+                store.clear()
+
+    def _merged(self):
+        """Merge the series of all threads"""
+        merged = {}
+        with self._stores_lock:
+            _merge_into(merged, self._base, self.buckets)
+            stores = list(self._stores.values())
+        for store in stores:
+            _merge_into(merged, store, self.buckets)
+        return merged
+
+    def snapshot(self):
+        """
+        Everything recorded so far, by request class then outcome (success, cached or error)
+
+        :rtype: dict
+        """
+        result = {}
+        for (request_name, outcome), series in sorted(self._merged().items()):
+            latency = dict(
+                count=series.latency.count,
+                sum=series.latency.sum,
+                buckets=dict(
+                    (_format_bound(bound), count)
+                    for bound, count in zip(series.latency.buckets, series.latency.cumulative_counts())
+                ),
+            )
+            for q in self.QUANTILES:
+                latency["p%d" % round(q * 100)] = series.latency.quantile(q)
+            result.setdefault(request_name, {})[outcome] = dict(
+                calls=series.calls,
+                retries=series.retries,
+                bytes_sent=series.bytes_sent,
+                bytes_sent_uncompressed=series.bytes_sent_uncompressed,
+                bytes_received=series.bytes_received,
+                content_bytes=series.content_bytes,
+                phases=dict(series.phases),
+                latency=latency,
+            )
+        return result
+
+    def to_prometheus(self, prefix="rwslib"):
+        """
+        Everything recorded so far in the Prometheus text exposition format
+
+        :param str prefix: Prefix for the metric names
+        :rtype: str
+        """
+        merged = sorted(self._merged().items())
+        lines = []
+
+        def family(name, kind, help_text):
+            lines.append("# HELP %s_%s %s" % (prefix, name, help_text))
+            lines.append("# TYPE %s_%s %s" % (prefix, name, kind))
+
+        def sample(name, labels, value):
+            label_text = ",".join('%s="%s"' % (k, _escape(v)) for k, v in labels)
+            lines.append("%s_%s{%s} %s" % (prefix, name, label_text, repr(value)))
+
+        counters = (
+            ("requests_total", "calls", "Calls made to RWS"),
+            ("retries_total", "retries", "Retries made by the retry policy"),
+            ("request_bytes_total", "bytes_sent", "Bytes of request bodies sent"),
+            (
+                "request_uncompressed_bytes_total",
+                "bytes_sent_uncompressed",
+                "Bytes of request bodies before compression",
+            ),
+            ("response_bytes_total", "bytes_received", "Bytes of response bodies received"),
+            (
+                "response_content_bytes_total",
+                "content_bytes",
+                "Bytes of response bodies after decompression",
+            ),
+        )
+        for name, attr, help_text in counters:
+            family(name, "counter", help_text)
+            for (request_name, outcome), series in merged:
+                sample(name, [("request", request_name), ("outcome", outcome)], getattr(series, attr))
+
+        family("request_phase_seconds_total", "counter", "Time spent in each phase of calls")
+        for (request_name, outcome), series in merged:
+            for phase in RequestTiming.PHASES:
+                sample(
+                    "request_phase_seconds_total",
+                    [("request", request_name), ("outcome", outcome), ("phase", phase)],
+                    series.phases[phase],
+                )
+
+        family("request_duration_seconds", "histogram", "Total time taken by calls")
+        for (request_name, outcome), series in merged:
+            labels = [("request", request_name), ("outcome", outcome)]
+            for bound, count in zip(series.latency.buckets, series.latency.cumulative_counts()):
+                sample("request_duration_seconds_bucket", labels + [("le", _format_bound(bound))], count)
+            sample("request_duration_seconds_sum", labels, series.latency.sum)
+            sample("request_duration_seconds_count", labels, series.latency.count)
+
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,168 @@
+"""
+Retry policies for RWSConnection.
+
+The `retries` argument of RWSConnection.send_request only covers failures to connect. A RetryPolicy passed to
+RWSConnection also retries responses that show Rave or its load balancers are temporarily overloaded (by default 429,
+502, 503 and 504), waiting between attempts with exponential backoff and jitter, or for as long as the server asks in
+a ``Retry-After`` header.
+
+Requests that are not idempotent (POSTs, unless the request class says otherwise) are only retried for statuses that
+show the request was refused before being processed, so that data is not posted to Rave twice.
+"""
+import email.utils
+import random
+import threading
+import time
+
+# HTTP methods that can be repeated without changing the result
+IDEMPOTENT_METHODS = frozenset(["GET", "HEAD", "PUT", "DELETE", "OPTIONS"])
+
+
+def is_idempotent(request_object):
+    """
+    Can the request be safely repeated?
+
+    Uses the request's ``idempotent`` attribute if set, otherwise decides by HTTP method.
+
+    :param rwslib.rws_requests.RWSRequest request_object: Request
+    :rtype: bool
+    """
+    idempotent = getattr(request_object, "idempotent", None)
+    if idempotent is None:
+        return request_object.method in IDEMPOTENT_METHODS
+    return idempotent
+
+
+def parse_retry_after(value, now=None):
+    """
+    Parse a Retry-After header, given as either seconds or an HTTP date
+
+    :param str value: Header value
+    :param float now: Current time (as from time.time())
+    :return: Seconds to wait, None if the header could not be parsed
+    """
+    if value is None:
+        return None
+    value = value.strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    parsed = email.utils.parsedate_tz(value)
+    if parsed is None:
+        return None
+    return max(0.0, email.utils.mktime_tz(parsed) - (now or time.time()))
+
+
+class RetryPolicy(object):
+    """Decides whether a response should be retried and how long to wait first, and counts what it did"""
+
+    def __init__(
+        self,
+        max_retries=3,
+        statuses=(429, 502, 503, 504),
+        non_idempotent_statuses=(429,),
+        backoff_factor=0.5,
+        max_backoff=60.0,
+        jitter=True,
+        respect_retry_after=True,
+        sleep=time.sleep,
+    ):
+        """
+        :param int max_retries: Maximum number of retries for a request
+        :param tuple statuses: HTTP status codes to retry
+        :param tuple non_idempotent_statuses: Status codes for which requests that are not idempotent may be retried,
+            those where the server refused the request without processing it
+        :param float backoff_factor: Wait before the first retry in seconds, doubled for each retry after that
+        :param float max_backoff: Longest wait between attempts in seconds, whatever the backoff or Retry-After
+        :param bool jitter: Wait a random time between zero and the backoff ("full jitter") so that clients retrying
+            at the same time spread out
+        :param bool respect_retry_after: Wait as long as a Retry-After header asks, if that is longer than the backoff
+        :param sleep: Function used to wait, takes a number of seconds
+        """
+        self.max_retries = max_retries
+        self.statuses = frozenset(statuses)
+        self.non_idempotent_statuses = frozenset(non_idempotent_statuses)
+        self.backoff_factor = backoff_factor
+        self.max_backoff = max_backoff
+        self.jitter = jitter
+        self.respect_retry_after = respect_retry_after
+        self.sleep = sleep
+        self._random = random.Random()
+
+        self._lock = threading.Lock()
+        self.retries = 0
+        self.retries_by_status = {}
+        self.gave_up = 0
+        self.refused_non_idempotent = 0
+        self.time_waited = 0.0
+
+    def should_retry(self, request_object, response, attempt):
+        """
+        Should the request be sent again?
+
+        :param rwslib.rws_requests.RWSRequest request_object: Request that was sent
+        :param requests.models.Response response: Response received
+        :param int attempt: Number of retries already made for the request
+        :rtype: bool
+        """
+        status = response.status_code
+        if status not in self.statuses:
+            return False
+        if not is_idempotent(request_object) and status not in self.non_idempotent_statuses:
+            with self._lock:
+                self.refused_non_idempotent += 1
+            return False
+        if attempt >= self.max_retries:
+            with self._lock:
+                self.gave_up += 1
+            return False
+        return True
+
+    def backoff(self, attempt, response=None):
+        """
+        Time to wait, in seconds, before the next attempt
+
+        :param int attempt: Number of retries already made for the request
+        :param requests.models.Response response: Response being retried
+        :rtype: float
+        """
+        delay = min(self.max_backoff, self.backoff_factor * (2 ** attempt))
+        if self.jitter:
+            delay = self._random.uniform(0, delay)
+        if self.respect_retry_after and response is not None:
+            retry_after = parse_retry_after(response.headers.get("Retry-After"))
+            if retry_after is not None:
+                delay = max(delay, min(self.max_backoff, retry_after))
+        return delay
+
+    def wait(self, attempt, response=None):
+        """
+        Wait before retrying a response, counting the retry
+
+        :param int attempt: Number of retries already made for the request
+        :param requests.models.Response response: Response being retried
+        """
+        delay = self.backoff(attempt, response)
+        with self._lock:
+            self.retries += 1
+            if response is not None:
+                status = response.status_code
+                self.retries_by_status[status] = self.retries_by_status.get(status, 0) + 1
+            self.time_waited += delay
+        self.sleep(delay)
+
+    def stats(self):
+        """
+        Counts of the retries made
+
+        :rtype: dict
+        """
+        with self._lock:
+            return dict(
+                retries=self.retries,
+                retries_by_status=dict(self.retries_by_status),
+                gave_up=self.gave_up,
+                refused_non_idempotent=self.refused_non_idempotent,
+                time_waited=self.time_waited,
+            )
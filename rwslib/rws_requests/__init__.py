@@ -14,8 +14,10 @@ from rwslib.rwsobjects import (
     RWSStudies,
     RWSStudyMetadataVersions,
     RWSSubjects,
+    RWSSubjectsStream,
     RWSPostResponse,
 )
+from rwslib.compression import DEFAULT_LEVEL, compress_body
 from six.moves.urllib_parse import urlencode
 
 
@@ -23,6 +25,29 @@ from six.moves.urllib_parse import urlencode
 # Function utilities I don't want to muddy class heirarchy with
 
 
+def _post_args(request):
+    """
+    Body and headers for a request that posts ODM, compressing the body if the request asks for it. The body is
+    compressed the first time and reused, with its stats, while the request's data and compression level are unchanged
+
+    :param RWSRequest request: Request with data, headers and compress attributes
+    """
+    if not request.compress:
+        data = request.data
+        if hasattr(data, "getroot"):
+            # Builder object
+            data = str(data)
+        return {"data": data, "headers": request.headers}
+    compressed = getattr(request, "_compressed", None)
+    if compressed is None or compressed[0] is not request.data or compressed[1] != request.compress_level:
+        body, stats = compress_body(request.data, request.compress_level)
+        compressed = request._compressed = (request.data, request.compress_level, body, stats)
+    data, request.compression = compressed[2], compressed[3]
+    headers = dict(request.headers)
+    headers["Content-Encoding"] = "gzip"
+    return {"data": data, "headers": headers}
+
+
 def check_dataset_type(dataset_type):
     """
     Datasets may only be regular or raw
@@ -67,6 +92,13 @@ class RWSRequest(object):
 
     requires_authorization = False
     method = "GET"  # Default
+    # Can the request be repeated safely? None to decide by method (see rwslib.retry.is_idempotent)
+    idempotent = None
+    # Keep the lxml tree of XML results in their root attribute? Set False (on a request or a subclass) for results
+    # that are kept a long time, their trees are released once built (see rwslib.rwsobjects.XMLRepr.release_tree)
+    retain_tree = True
+    # XMLRepr class (e.g. rwslib.rwsobjects.RWSStudies) results are parsed into, None for the text of the response
+    result_class = None
 
     def __eq__(self, other):
         if type(other) is type(self):
@@ -82,8 +114,21 @@ class RWSRequest(object):
         :param requests.models.Response response: returned response
         :return:
         """
-        # By default return text
-        return response.text
+        if self.result_class is None:
+            # By default return text
+            return response.text
+        return self.result_class(response.content, retain_tree=self.retain_tree)
+
+    def stream_result(self, stream):
+        """
+        Process a streamed result (see the `stream` argument of RWSConnection.send_request) to create a custom output
+        :param rwslib.RWSResponseStream stream: file-like stream of the response body
+        :return:
+        """
+        if self.result_class is None:
+            # By default hand back the stream for the caller to consume
+            return stream
+        return self.result_class(stream, retain_tree=self.retain_tree)
 
     def url_path(self):
         """Return url path list"""
@@ -181,32 +226,22 @@ class TwoHundredRequest(RWSGetRequest):
 class CacheFlushRequest(RWSAuthorizedGetRequest):
     """Calls RWS cache-flush"""
 
+    result_class = RWSResponse
+
     def url_path(self):
         return make_url("webservice.aspx?CacheFlush")
 
-    def result(self, response):
-        """
-        Return RWSResponse object for success
-        :param requests.models.Response response: request respnse
-        """
-        return RWSResponse(response.text)
-
 
 class ClinicalStudiesRequest(RWSAuthorizedGetRequest):
     """Return the list of clinical studies as a RWSStudies object.
        Clinical studies are the studies that you have access to as an EDC user.
     """
 
+    result_class = RWSStudies
+
     def url_path(self):
         return make_url("studies")
 
-    def result(self, response):
-        """
-        Return RWSResponse object for success
-        :param requests.models.Response response: request respnse
-        """
-        return RWSStudies(response.text)
-
 
 # ----------------------------------------------------------------------------------------------------------------------
 # Base request classes for study versions (could also be used for drafts if ever implemented by RWS)
@@ -256,20 +291,17 @@ class MetadataStudiesRequest(RWSAuthorizedGetRequest):
        Architect user.
     """
 
+    result_class = RWSStudies
+
     def url_path(self):
         return make_url("metadata", "studies")
 
-    def result(self, response):
-        """
-        Return RWSResponse object for success
-        :param requests.models.Response response: request respnse
-        """
-        return RWSStudies(response.text)
-
 
 class StudyDraftsRequest(RWSAuthorizedGetRequest):
     """Return the list of study drafts"""
 
+    result_class = RWSStudyMetadataVersions
+
     def __init__(self, project_name):
         """
         :param str project_name: Project Name
@@ -279,17 +311,12 @@ class StudyDraftsRequest(RWSAuthorizedGetRequest):
     def url_path(self):
         return make_url("metadata", "studies", self.project_name, "drafts")
 
-    def result(self, response):
-        """
-        Return RWSResponse object for success
-        :param requests.models.Response response: request respnse
-        """
-        return RWSStudyMetadataVersions(response.text)
-
 
 class StudyVersionsRequest(RWSAuthorizedGetRequest):
     """Return the list of study versions"""
 
+    result_class = RWSStudyMetadataVersions
+
     def __init__(self, project_name):
         """
         :param str project_name: Project Name
@@ -299,13 +326,6 @@ class StudyVersionsRequest(RWSAuthorizedGetRequest):
     def url_path(self):
         return make_url("metadata", "studies", self.project_name, "versions")
 
-    def result(self, response):
-        """
-        Return RWSResponse object for success
-        :param requests.models.Response response: request respnse
-        """
-        return RWSStudyMetadataVersions(response.text)
-
 
 class StudyVersionRequest(VersionRequestBase):
     """Return a study version as a string"""
@@ -330,20 +350,17 @@ class GlobalLibrariesRequest(RWSAuthorizedGetRequest):
        Architect Global Library Volume user
     """
 
+    result_class = RWSStudies
+
     def url_path(self):
         return make_url("metadata", "libraries")
 
-    def result(self, response):
-        """
-        Return RWSResponse object for success
-        :param requests.models.Response response: request respnse
-        """
-        return RWSStudies(response.text)
-
 
 class GlobalLibraryDraftsRequest(RWSAuthorizedGetRequest):
     """Return the list of global library drafts"""
 
+    result_class = RWSStudyMetadataVersions
+
     def __init__(self, project_name):
         """
         :param str project_name: Project Name
@@ -353,17 +370,12 @@ class GlobalLibraryDraftsRequest(RWSAuthorizedGetRequest):
     def url_path(self):
         return make_url("metadata", "libraries", self.project_name, "drafts")
 
-    def result(self, response):
-        """
-        Return RWSResponse object for success
-        :param requests.models.Response response: request respnse
-        """
-        return RWSStudyMetadataVersions(response.text)
-
 
 class GlobalLibraryVersionsRequest(RWSAuthorizedGetRequest):
     """Return the list of global library versions"""
 
+    result_class = RWSStudyMetadataVersions
+
     def __init__(self, project_name):
         """
         :param str project_name: Project Name
@@ -373,13 +385,6 @@ class GlobalLibraryVersionsRequest(RWSAuthorizedGetRequest):
     def url_path(self):
         return make_url("metadata", "libraries", self.project_name, "versions")
 
-    def result(self, response):
-        """
-        Return RWSResponse object for success
-        :param requests.models.Response response: request respnse
-        """
-        return RWSStudyMetadataVersions(response.text)
-
 
 class GlobalLibraryVersionRequest(VersionRequestBase):
     """Return a global library version as a string"""
@@ -393,31 +398,38 @@ class GlobalLibraryVersionRequest(VersionRequestBase):
 class PostMetadataRequest(RWSAuthorizedPostRequest):
     """Post an ODM data transaction to Rave, get back an RWSResponse object"""
 
-    def __init__(self, project_name, data, headers={"Content-type": "text/xml"}):
+    result_class = RWSPostResponse
+
+    def __init__(
+        self,
+        project_name,
+        data,
+        headers={"Content-type": "text/xml"},
+        compress=False,
+        compress_level=DEFAULT_LEVEL,
+    ):
         """
         :param str project_name: Project Name
-        :param str data: Data to dispatch
+        :param str data: Data to dispatch (or a builder object, e.g. rwslib.builders.ODM)
         :param dict headers: Headers to pass to client
+        :param bool compress: Gzip the data (sent with Content-Encoding: gzip)
+        :param int compress_level: Gzip compression level, 1 (fastest) to 9 (smallest)
         """
         self.project_name = project_name
         self.data = data
         self.headers = headers
+        self.compress = compress
+        self.compress_level = compress_level
+        # Sizes before and after compression, set when the request is sent compressed
+        self.compression = None
 
     def args(self):
         """Return additional args here as dict (only for post data requests)"""
-        kw = {"data": self.data, "headers": self.headers}
-        return kw
+        return _post_args(self)
 
     def url_path(self):
         return make_url("metadata", "studies", self.project_name, "drafts")
 
-    def result(self, response):
-        """
-        Return RWSPostResponse object for success
-        :param requests.models.Response response: request respnse
-        """
-        return RWSPostResponse(response.text)
-
 
 # -------------------------------------------------------------------------------------------------
 # Subject related
@@ -429,6 +441,8 @@ class StudySubjectsRequest(RWSAuthorizedGetRequest):
     Return the list of study subjects, defaults to the PROD environment
     """
 
+    result_class = RWSSubjects
+
     SUBJECT_KEY_TYPES = ["SubjectName", "SubjectUUID"]
     INCLUDE_OPTIONS = ["inactive", "deleted", "inactiveAndDeleted"]
 
@@ -440,6 +454,7 @@ class StudySubjectsRequest(RWSAuthorizedGetRequest):
         include=None,
         subject_key_type="SubjectName",
         links=False,
+        lazy=False,
     ):
         """
         :param str project_name: Project/Study Name
@@ -448,6 +463,8 @@ class StudySubjectsRequest(RWSAuthorizedGetRequest):
         :param str include: Query option to add to `include` parameter (see INCLUDE_OPTIONS for allowed values)
         :param str subject_key_type: Type of SubjectKey to have in the response (one of `SubjectName` or `SubjectUUID`)
         :param bool links: Add Deep Links to Output ODM
+        :param bool lazy: Return a RWSSubjectsStream, read as it is iterated over (with `stream=True`, straight from
+            the connection)
 
         .. note::
             If status == True then ?status=all
@@ -459,6 +476,7 @@ class StudySubjectsRequest(RWSAuthorizedGetRequest):
         self.environment_name = environment_name
         self.status = status
         self.links = links
+        self.lazy = lazy
         self.include = None
         self.subject_key_type = subject_key_type
         # make sure the value for SubjectKeyType makes sense.
@@ -500,29 +518,53 @@ class StudySubjectsRequest(RWSAuthorizedGetRequest):
 
     def result(self, response):
         """
-        Return RWSSubjects object for success
+        Return RWSSubjects object for success (RWSSubjectsStream if lazy)
         :param requests.models.Response response: request response
         """
-        response.encoding = "utf-8-sig"
-        return RWSSubjects(response.text)
+        if self.lazy:
+            return RWSSubjectsStream(response.content)
+        return RWSAuthorizedGetRequest.result(self, response)
+
+    def stream_result(self, stream):
+        """
+        Return RWSSubjects object parsed from the streamed response (RWSSubjectsStream reading from it if lazy, close
+        it to release the connection if it is not read to the end)
+        :param rwslib.RWSResponseStream stream: response body
+        """
+        if self.lazy:
+            return RWSSubjectsStream(stream)
+        return RWSAuthorizedGetRequest.stream_result(self, stream)
 
 
 class PostDataRequest(RWSAuthorizedPostRequest):
     """Post an ODM data transaction to Rave, get back an RWSResponse object"""
 
-    def __init__(self, data, headers={"Content-type": "text/xml"}):
+    result_class = RWSPostResponse
+
+    def __init__(
+        self,
+        data,
+        headers={"Content-type": "text/xml"},
+        compress=False,
+        compress_level=DEFAULT_LEVEL,
+    ):
         """
         Post an ODM to a RWS endpoint
-        :param bytes data: Data to POST
+        :param bytes data: Data to POST (or a builder object, e.g. rwslib.builders.ODM)
         :param dict headers: Headers to add to request
+        :param bool compress: Gzip the data (sent with Content-Encoding: gzip)
+        :param int compress_level: Gzip compression level, 1 (fastest) to 9 (smallest)
         """
         self.data = data
         self.headers = headers
+        self.compress = compress
+        self.compress_level = compress_level
+        # Sizes before and after compression, set when the request is sent compressed
+        self.compression = None
 
     def args(self):
         """Return additional args here as dict (only for post data requests)"""
-        kw = {"data": self.data, "headers": self.headers}
-        return kw
+        return _post_args(self)
 
     def url_path(self):
         """
@@ -531,13 +573,6 @@ class PostDataRequest(RWSAuthorizedPostRequest):
         """
         return make_url("webservice.aspx?PostODMClinicalData")
 
-    def result(self, response):
-        """
-        Return RWSPostResponse object for success
-        :param requests.models.Response response: request response
-        """
-        return RWSPostResponse(response.text)
-
 
 # -------------------------------------------------------------------------------------------------
 # ODM Clinical Data Datasets
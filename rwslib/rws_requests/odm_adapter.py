@@ -5,8 +5,13 @@ See the following for more information (from the Knowledge Hub - requires login)
 https://learn.medidata.com/en-US/bundle/rave-web-services/page/odm_operational_data_model_adapter.html
 
 """
+import queue
+import threading
 from typing import Optional
 
+from six.moves.urllib.parse import urlparse, parse_qs
+
+from rwslib.rwsobjects import ODM_NS, parseXMLString
 from . import RWSAuthorizedGetRequest, QueryOptionGetRequest
 
 
@@ -56,6 +61,197 @@ class AuditRecordsRequest(QueryOptionGetRequest):
         )
 
 
+def next_startid(call):
+    """
+    The startid of the page after an AuditRecordsRequest, from the ``next`` Link header of its response
+
+    :param rwslib.RWSCall call: The call of the request
+    :return: The startid, None on the last page
+    :rtype: int
+    """
+    link = call.links.get("next")
+    if not link:
+        return None
+    return int(parse_qs(urlparse(link["url"]).query)["startid"][0])
+
+
+class AuditRecordPages(object):
+    """
+    The pages of the Clinical Audit Records Dataset, following the ``next`` links of the responses to the last page.
+
+    While a page is being handled the pages after it are fetched by a background thread, up to `prefetch` pages
+    ahead, so the time taken to fetch them overlaps with the time taken to process them. Pages are still requested one
+    after another as each one gives the startid of the next. Iterating over the pages yields the ODM of each page:
+
+    .. code-block:: python
+
+        for page in AuditRecordPages(rave, "Mediflex", "Prod", per_page=1000):
+            process(page)
+
+    The pages can only be iterated over once. Stop early with :meth:`close` (or use the pages as a context manager),
+    after which ``startid`` is where to carry on from.
+    """
+
+    def __init__(
+        self,
+        rws_connection,
+        project_name: str,
+        environment_name: str,
+        startid: Optional[int] = 1,
+        per_page: Optional[int] = 100,
+        mode: Optional[str] = None,
+        unicode: Optional[bool] = False,
+        prefetch: int = 1,
+        max_pages: Optional[int] = None,
+        **kwargs
+    ):
+        """
+        :param rwslib.RWSConnection rws_connection: Connection to fetch the pages with
+        :param str project_name: Project Name
+        :param str environment_name: Environment Name
+        :param int startid: Starting Audit
+        :param int per_page: Page Size
+        :param str mode: extract more Audit Subcategories (allowed values: default, all, enhanced)
+        :param bool unicode: specify Unicode characters are required in the response.
+        :param int prefetch: Number of pages fetched ahead of the page being handled, 0 to fetch each page on demand
+        :param int max_pages: Maximum number of pages to fetch, None for all of them
+        :param kwargs: Passed to ``RWSConnection.execute`` for each page (e.g. timeout)
+        """
+        self.rws_connection = rws_connection
+        self.project_name = project_name
+        self.environment_name = environment_name
+        self.per_page = per_page
+        self.mode = mode
+        self.unicode = unicode
+        self.prefetch = prefetch
+        self.max_pages = max_pages
+        self.kwargs = kwargs
+        # Raises ValueError for an unknown mode before anything is fetched
+        self._request(startid)
+        # startid of the page after the last one handed out, None when there are no more
+        self.startid = startid
+        # Number of pages handed out
+        self.pages = 0
+        self._started = False
+        self._stop = threading.Event()
+        self._queue = None
+        self._thread = None
+
+    def _request(self, startid):
+        return AuditRecordsRequest(
+            self.project_name,
+            self.environment_name,
+            startid=startid,
+            per_page=self.per_page,
+            mode=self.mode,
+            unicode=self.unicode,
+        )
+
+    def _fetch(self, startid):
+        """Fetch the page at startid, returning its call and the startid of the page after it"""
+        call = self.rws_connection.execute(self._request(startid), **self.kwargs)
+        return call, next_startid(call)
+
+    def _put(self, item):
+        """Queue an item for the consumer, waiting for room unless stopped. False if stopped"""
+        while not self._stop.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _prefetch(self, startid):
+        """Fetch pages into the queue, run by the background thread"""
+        fetched = 0
+        try:
+            while startid is not None and (self.max_pages is None or fetched < self.max_pages):
+                if self._stop.is_set():
+                    return
+                call, startid = self._fetch(startid)
+                fetched += 1
+                if not self._put((call, startid, None)):
+                    return
+        except Exception as exc:
+            self._put((None, None, exc))
+            return
+        self._put(None)
+
+    def calls(self):
+        """
+        The call of each page, with the response (e.g. for its headers) and the page as ``result``
+
+        :rtype: iterator(rwslib.RWSCall)
+        """
+        if self._started:
+            raise ValueError("The pages can only be iterated over once")
+        self._started = True
+        if self.prefetch < 1:
+            return self._calls_on_demand()
+        self._queue = queue.Queue(maxsize=self.prefetch)
+        self._thread = threading.Thread(target=self._prefetch, args=(self.startid,), name="AuditRecordPages")
+        self._thread.daemon = True
+        self._thread.start()
+        return self._calls_prefetched()
+
+    def _calls_on_demand(self):
+        while self.startid is not None and (self.max_pages is None or self.pages < self.max_pages):
+            if self._stop.is_set():
+                return
+            call, startid = self._fetch(self.startid)
+            self.startid = startid
+            self.pages += 1
+            yield call
+
+    def _calls_prefetched(self):
+        try:
+            while True:
+                item = self._queue.get()
+                if item is None:
+                    break
+                call, startid, exc = item
+                if exc is not None:
+                    raise exc
+                self.startid = startid
+                self.pages += 1
+                yield call
+        finally:
+            self.close()
+
+    def __iter__(self):
+        for call in self.calls():
+            yield call.result
+
+    def records(self):
+        """
+        The ClinicalData element of each audit record, from each page in turn
+
+        :rtype: iterator(lxml.etree._Element)
+        """
+        for page in self:
+            for record in parseXMLString(page).iterfind(ODM_NS + "ClinicalData"):
+                yield record
+
+    def close(self, timeout=1.0):
+        """
+        Stop fetching pages. A page being fetched in the background is waited for up to `timeout` seconds, after that
+        it is left to finish (and be discarded) on its own; the thread is a daemon so it does not keep a process alive
+
+        :param float timeout: Seconds to wait for a page being fetched in the background
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
 class VersionFoldersRequest(QueryOptionGetRequest):
     """Identify all folders in use in study"""
 
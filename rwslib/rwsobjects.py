@@ -1,7 +1,13 @@
 __author__ = "isparks"
 
+import array
+import io
+import threading
+
 from lxml import etree
 
+from rwslib.timing import timed_decode
+
 MEDI_NS = "{http://www.mdsol.com/ns/odm/metadata}"
 ODM_NS = "{http://www.cdisc.org/ns/odm/v1.3}"
 XLINK_NS = "{http://www.w3.org/1999/xlink}"
@@ -27,24 +33,66 @@ def getEnvironmentFromNameAndProtocol(studyname, protocolname):
         return raw_env
 
 
+def parseXMLStream(stream, chunk_size=64 * 1024):
+    """
+    Parse XML incrementally from a file-like object, return root
+    :param stream: file-like object with a read method returning bytes
+    :param int chunk_size: Number of bytes to pass to the parser at a time
+    """
+    parser = etree.XMLParser(ns_clean=True, collect_ids=False, huge_tree=True)
+    started = False
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            break
+        if not started:
+            # Remove BOM or anything else before the first element (as for parseXMLString)
+            start = chunk.find(b"<")
+            if start == -1:
+                continue
+            chunk = chunk[start:]
+            started = True
+        parser.feed(chunk)
+    if not started:
+        return u""
+    return parser.close()
+
+
+_local = threading.local()
+
+
+def _xml_parser():
+    """An XMLParser for this thread, lxml parsers can be reused but not shared between threads"""
+    parser = getattr(_local, "parser", None)
+    if parser is None:
+        parser = _local.parser = etree.XMLParser(ns_clean=True, collect_ids=False, huge_tree=True)
+    return parser
+
+
 def parseXMLString(xml):
     """
     Parse XML string, return root
-    :param str: Passed in XML
+    :param xml: Passed in XML as bytes (e.g. ``response.content``) or str, or a file-like object (see parseXMLStream)
     """
+    if hasattr(xml, "read"):
+        return parseXMLStream(xml)
 
-    # Remove BOM if it exists (different requests seem to have different BOMs)
-    unichr_captured = ""
-
-    if not xml.strip():
+    # Remove BOM if it exists (different requests seem to have different BOMs), or anything else before the first
+    # element. Bytes are passed to lxml from that offset without copying and lxml decodes them.
+    if isinstance(xml, str):
+        start = xml.find(u"<")
+    else:
+        start = xml.find(b"<")
+    if start == -1:
         return u""
 
-    while xml[0] != u"<":
-        unichr_captured += xml[0]
-        xml = xml[1:]
-    parser = etree.XMLParser(ns_clean=True, collect_ids=False, huge_tree=True)
+    if isinstance(xml, str):
+        data = (xml[start:] if start else xml).encode("utf-8")
+    else:
+        data = memoryview(xml)[start:] if start else xml
     try:
-        return etree.fromstring(xml.encode("utf-8"), parser=parser)
+        with timed_decode():
+            return etree.fromstring(data, parser=_xml_parser())
     except etree.XMLSyntaxError:
         raise Exception(xml)
 
@@ -61,15 +109,61 @@ class RWSException(Exception):
         self.rws_error = rws_error
 
 
-class XMLRepr(object):
-    """Classes that represent objects passed back from RWS as XML"""
+class _XMLReprType(type):
+    """Releases the parsed tree of an XMLRepr once it is built, when asked to"""
+
+    def __call__(cls, xml, retain_tree=True):
+        """
+        :param xml: XML returned from RWS, as bytes (e.g. ``response.content``), a string or a file-like object
+        :param bool retain_tree: Keep the parsed tree in ``root``, if False it is released once the object is built
+            (see release_tree)
+        """
+        obj = type.__call__(cls, xml)
+        if not retain_tree:
+            obj.release_tree(xml)
+        return obj
+
+
+class XMLRepr(object, metaclass=_XMLReprType):
+    """
+    Classes that represent objects passed back from RWS as XML
+
+    Built with ``retain_tree=False`` the parsed tree is released once the object is built, see release_tree
+    """
 
     def __init__(self, xml):
         """
-        :param str xml: XML returned from RWS
+        :param xml: XML returned from RWS, as bytes (e.g. ``response.content``), a string or a file-like object
         """
+        self._xml = None
         self.root = parseXMLString(xml)
 
+    @property
+    def root(self):
+        """The root element of the XML, parsed again each time it is used if the tree has been released"""
+        if self._root is None and self._xml is not None:
+            return parseXMLString(self._xml)
+        return self._root
+
+    @root.setter
+    def root(self, root):
+        self._root = root
+
+    def release_tree(self, xml=None):
+        """
+        Release the parsed tree, keeping only the XML it was parsed from, so that objects kept for a long time do not
+        hold the whole document in memory. ``root`` and ``str()`` still work, parsing the XML again.
+
+        :param xml: The XML the object was built from as bytes or a string, if not given (or it was read from a
+            file-like object) the tree is serialised to keep instead
+        """
+        if self._root is None or isinstance(self._root, str):
+            return
+        if xml is None or hasattr(xml, "read"):
+            xml = etree.tostring(self._root, encoding="utf-8")
+        self._xml = xml
+        self._root = None
+
     def __unicode__(self):
         """String representation of same"""
         return etree.tostring(self.root, encoding="utf-8")
@@ -373,6 +467,22 @@ class RWSStudies(list, ODMDoc):
         for estudy in self.root.findall(ODM_NS + "Study"):
             self.append(RWSStudyListItem.fromElement(estudy))
 
+    def to_columns(self):
+        """
+        The studies as columns of strings, one per attribute (see STUDY_COLUMNS)
+
+        :rtype: dict
+        """
+        return _object_columns(self, STUDY_COLUMNS)
+
+    def to_numpy(self):
+        """
+        The studies as a NumPy structured array, see :func:`columns_to_numpy`
+
+        :rtype: numpy.ndarray
+        """
+        return columns_to_numpy(self.to_columns())
+
 
 class MetaDataVersion(object):
     """
@@ -436,6 +546,22 @@ class RWSStudyMetadataVersions(list, ODMDoc, RWSStudyListItem):
         for e_version in e_study.findall(ODM_NS + "MetaDataVersion"):
             self.append(MetaDataVersion.fromElement(e_version))
 
+    def to_columns(self):
+        """
+        The metadata versions as columns of strings, one per attribute (see METADATA_VERSION_COLUMNS)
+
+        :rtype: dict
+        """
+        return _object_columns(self, METADATA_VERSION_COLUMNS)
+
+    def to_numpy(self):
+        """
+        The metadata versions as a NumPy structured array, see :func:`columns_to_numpy`
+
+        :rtype: numpy.ndarray
+        """
+        return columns_to_numpy(self.to_columns())
+
 
 class RWSSubjectListItem(object):
     """
@@ -534,6 +660,25 @@ class RWSSubjectListItem(object):
         "SubjectName",
     ]
 
+    # The Yes/No status properties, each kept as a bit of _status_known (reported) and _status_on (Yes)
+    STATUS_FLAGS = STATUS_PROPERTIES[:-2]
+
+    __slots__ = (
+        "studyoid",
+        "metadataversionoid",
+        "subjectkey",
+        "subjectkeytype",
+        "subjectname",
+        "locationoid",
+        "study_environment_site_number",
+        "active",
+        "deleted",
+        "links",
+        "_status_known",
+        "_status_on",
+        "_status_other",
+    )
+
     def __init__(self):
         """The ODM message has a ClinicalData element with a single SubjectData and SiteRef elements
            nested within. I collapse into a single object
@@ -550,8 +695,11 @@ class RWSSubjectListItem(object):
         self.links = []  # Link if requested
 
         # Optional properties, only if status included
-        for prop in RWSSubjectListItem.STATUS_PROPERTIES:
-            setattr(self, prop.lower(), None)
+        self.subjectname = None
+        self._status_known = 0
+        self._status_on = 0
+        # Status values other than Yes or No, by bit (not expected from RWS)
+        self._status_other = None
 
     @property
     def subject_name(self):
@@ -570,6 +718,60 @@ class RWSSubjectListItem(object):
         else:
             return self.subjectkey
 
+    def _get_flag(self, bit):
+        if self._status_known & bit:
+            return bool(self._status_on & bit)
+        if self._status_other is not None:
+            return self._status_other.get(bit)
+        return None
+
+    def _set_flag(self, bit, value):
+        if self._status_other is not None:
+            self._status_other.pop(bit, None)
+        if value is True or value is False:
+            self._status_known |= bit
+            if value:
+                self._status_on |= bit
+            else:
+                self._status_on &= ~bit
+            return
+        self._status_known &= ~bit
+        self._status_on &= ~bit
+        if value is not None:
+            if self._status_other is None:
+                self._status_other = {}
+            self._status_other[bit] = value
+
+    @classmethod
+    def status_mask(cls, **flags):
+        """
+        Bit masks matching subjects with the given status flags
+
+        :param flags: Status flags by attribute name (e.g. ``locked=False``), True for Yes and False for No
+        :return: (bits that must be reported, bits that must be Yes)
+        :rtype: tuple(int, int)
+        """
+        known = on = 0
+        for name, value in flags.items():
+            bit = _STATUS_BITS.get(name)
+            if bit is None:
+                raise ValueError("%s is not a status flag of a subject" % name)
+            known |= bit
+            if value:
+                on |= bit
+        return known, on
+
+    def has_status(self, **flags):
+        """
+        Does the subject have the given status flags? Flags that were not reported (e.g. status was not requested)
+        never match.
+
+        :param flags: Status flags by attribute name (e.g. ``requiressignature=True, locked=False``)
+        :rtype: bool
+        """
+        known, on = self.status_mask(**flags)
+        return self._status_known & known == known and self._status_on & known == on
+
     @classmethod
     def fromElement(cls, elem):
         """
@@ -588,12 +790,29 @@ class RWSSubjectListItem(object):
         for e_link in e_links:
             self.links.append(e_link.get(XLINK_NS + "href"))
 
-        decodes = {"yes": True, "no": False, "": None}
-        for prop in RWSSubjectListItem.STATUS_PROPERTIES:
-            val = e_subjectdata.get(MEDI_NS + prop, "").lower()
-            setattr(self, prop.lower(), decodes.get(val, val))
+        known = on = 0
+        attrib = e_subjectdata.attrib
+        for attr, bit in _STATUS_ATTRIBUTE_BITS:
+            val = attrib.get(attr)
+            if val is None:
+                continue
+            val = val.lower()
+            if val == "yes":
+                known |= bit
+                on |= bit
+            elif val == "no":
+                known |= bit
+            elif val:
+                self._set_flag(bit, val)
+        self._status_known = known
+        self._status_on = on
+        val = attrib.get(MEDI_NS + "SubjectKeyType", "").lower()
+        self.subjectkeytype = val or None
+        val = attrib.get(MEDI_NS + "SubjectName", "").lower()
+        self.subjectname = val or None
 
         # By default we only get back active and non-deleted subjects
+        decodes = {"yes": True, "no": False, "": None}
         self.active = decodes[
             e_subjectdata.get(MEDI_NS + "SubjectActive", "yes").lower()
         ]
@@ -602,6 +821,150 @@ class RWSSubjectListItem(object):
         return self
 
 
+# Bit of each status flag by attribute name, and by ODM attribute
+_STATUS_BITS = dict((prop.lower(), 1 << i) for i, prop in enumerate(RWSSubjectListItem.STATUS_FLAGS))
+_STATUS_ATTRIBUTE_BITS = [(MEDI_NS + prop, 1 << i) for i, prop in enumerate(RWSSubjectListItem.STATUS_FLAGS)]
+
+
+def _status_property(prop, bit):
+    return property(
+        lambda self: self._get_flag(bit),
+        lambda self, value: self._set_flag(bit, value),
+        doc="%s status: True (Yes), False (No) or None if not reported" % prop,
+    )
+
+
+for _i, _prop in enumerate(RWSSubjectListItem.STATUS_FLAGS):
+    setattr(RWSSubjectListItem, _prop.lower(), _status_property(_prop, 1 << _i))
+
+
+def subjects_with_status(subjects, **flags):
+    """
+    Subjects with the given status flags, e.g. ``subjects_with_status(subjects, requiressignature=True, locked=False)``
+
+    The flags are turned into bit masks once and each subject is checked with two integer operations, so large lists
+    are filtered quickly. Flags that were not reported for a subject never match.
+
+    :param subjects: Iterable of RWSSubjectListItem (e.g. RWSSubjects or RWSSubjectsStream)
+    :param flags: Status flags by attribute name, True for Yes and False for No
+    :rtype: list(RWSSubjectListItem)
+    """
+    known, on = RWSSubjectListItem.status_mask(**flags)
+    return [
+        subject for subject in subjects if subject._status_known & known == known and subject._status_on & known == on
+    ]
+
+
+# Columns of the subject, study and metadata version lists: string columns are lists, Yes/No columns are
+# array("b") of 1 (Yes), 0 (No) and -1 (not reported)
+SUBJECT_COLUMNS = (
+    "studyoid",
+    "metadataversionoid",
+    "subjectkey",
+    "subjectkeytype",
+    "subjectname",
+    "locationoid",
+    "study_environment_site_number",
+    "active",
+    "deleted",
+) + tuple(prop.lower() for prop in RWSSubjectListItem.STATUS_FLAGS)
+SUBJECT_FLAG_COLUMNS = SUBJECT_COLUMNS[7:]
+STUDY_COLUMNS = ("oid", "studyname", "protocolname", "environment", "projecttype")
+METADATA_VERSION_COLUMNS = ("oid", "name")
+
+_FLAG_CODES = {True: 1, False: 0}
+_YES_NO_CODES = {"yes": 1, "no": 0}
+
+
+def _empty_columns(names, flags=()):
+    return dict((name, array.array("b") if name in flags else []) for name in names)
+
+
+def _object_columns(items, names):
+    return dict((name, [getattr(item, name) for item in items]) for name in names)
+
+
+def subject_columns(subjects):
+    """
+    The subjects as columns, one per attribute and status flag (see SUBJECT_COLUMNS)
+
+    String attributes are lists. active, deleted and the status flags are ``array.array("b")`` of 1 for Yes, 0 for
+    No and -1 if not reported. Links are not included.
+
+    :param subjects: Iterable of RWSSubjectListItem
+    :rtype: dict
+    """
+    subjects = list(subjects)
+    columns = _object_columns(subjects, SUBJECT_COLUMNS[:7])
+    codes = _FLAG_CODES
+    for name in SUBJECT_FLAG_COLUMNS:
+        columns[name] = array.array("b", [codes.get(getattr(subject, name), -1) for subject in subjects])
+    return columns
+
+
+def _subject_row_reader(columns):
+    """A function appending the columns of a subject read from a ClinicalData element, as fromElement reads it"""
+    append = dict((name, column.append) for name, column in columns.items())
+    flags = dict((MEDI_NS + prop, columns[prop.lower()]) for prop in RWSSubjectListItem.STATUS_FLAGS)
+    flag_appends = [columns[name].append for name in SUBJECT_FLAG_COLUMNS[2:]]
+    codes = _YES_NO_CODES
+
+    def read(elem):
+        e_subjectdata = elem.find(ODM_NS + "SubjectData")
+        e_siteref = e_subjectdata.find(ODM_NS + "SiteRef")
+        attrib = e_subjectdata.attrib
+        append["studyoid"](elem.get("StudyOID"))
+        append["metadataversionoid"](elem.get("MetaDataVersionOID"))
+        append["subjectkey"](attrib.get("SubjectKey"))
+        append["subjectkeytype"](attrib.get(MEDI_NS + "SubjectKeyType", "").lower() or None)
+        append["subjectname"](attrib.get(MEDI_NS + "SubjectName", "").lower() or None)
+        append["locationoid"](e_siteref.get("LocationOID"))
+        append["study_environment_site_number"](e_siteref.get(MEDI_NS + "StudyEnvSiteNumber"))
+        append["active"](codes.get(attrib.get(MEDI_NS + "SubjectActive", "yes").lower(), -1))
+        append["deleted"](codes.get(attrib.get(MEDI_NS + "Deleted", "no").lower(), -1))
+        # Flags default to not reported, then the attributes present are read in a single pass
+        for flag_append in flag_appends:
+            flag_append(-1)
+        for attr, value in attrib.items():
+            column = flags.get(attr)
+            if column is not None:
+                column[-1] = codes.get(value.lower(), -1)
+
+    return read
+
+
+def columns_to_numpy(columns):
+    """
+    Columns as a NumPy structured array, one field per column. Requires NumPy.
+
+    Lists of strings become unicode fields as wide as the longest value, with None as an empty string. Typed arrays
+    keep their type (``array("b")`` becomes int8).
+
+    :param dict columns: Columns of equal length, e.g. from ``RWSSubjects.to_columns()``
+    :rtype: numpy.ndarray
+    """
+    try:
+        import numpy
+    except ImportError:
+        raise ImportError("NumPy is required for structured arrays, use to_columns() without it")
+
+    fields = []
+    values = []
+    for name, column in columns.items():
+        if isinstance(column, array.array):
+            fields.append((name, numpy.dtype(column.typecode)))
+            values.append(column)
+        else:
+            column = [u"" if value is None else value for value in column]
+            fields.append((name, "U%d" % max([1] + [len(value) for value in column])))
+            values.append(column)
+    length = len(values[0]) if values else 0
+    result = numpy.zeros(length, dtype=fields)
+    for (name, _), column in zip(fields, values):
+        result[name] = column
+    return result
+
+
 class RWSSubjects(list, ODMDoc):
     """
     Represents a list of subjects:
@@ -628,6 +991,8 @@ class RWSSubjects(list, ODMDoc):
              </ClinicalData>
         </ODM>
 
+    Subjects can be looked up by key, name or site through indexes built on first use. The indexes are dropped
+    whenever the list is changed, but not when the attributes of a subject are changed.
     """
 
     def __init__(self, xml):
@@ -638,3 +1003,286 @@ class RWSSubjects(list, ODMDoc):
 
         for e_clindata in root.findall(ODM_NS + "ClinicalData"):
             self.append(RWSSubjectListItem.fromElement(e_clindata))
+
+    def with_status(self, **flags):
+        """
+        Subjects with the given status flags, see :func:`subjects_with_status`
+
+        :param flags: Status flags by attribute name (e.g. ``requiressignature=True, locked=False``)
+        :rtype: list(RWSSubjectListItem)
+        """
+        return subjects_with_status(self, **flags)
+
+    def to_columns(self):
+        """
+        The subjects as columns, see :func:`subject_columns`
+
+        :rtype: dict
+        """
+        return subject_columns(self)
+
+    def to_numpy(self):
+        """
+        The subjects as a NumPy structured array, see :func:`columns_to_numpy`
+
+        :rtype: numpy.ndarray
+        """
+        return columns_to_numpy(self.to_columns())
+
+    def _index(self, attr):
+        """Subjects by the value of an attribute, built when first needed and dropped when the list changes"""
+        indexes = getattr(self, "_indexes", None)
+        if indexes is None:
+            indexes = self._indexes = {}
+        index = indexes.get(attr)
+        if index is None:
+            index = indexes[attr] = {}
+            for subject in self:
+                value = getattr(subject, attr)
+                if value in index:
+                    index[value].append(subject)
+                else:
+                    index[value] = [subject]
+        return index
+
+    def subject_by_key(self, subjectkey):
+        """
+        The subject with a SubjectKey (a name or UUID, depending on the SubjectKeyType requested)
+
+        :param str subjectkey: SubjectKey
+        :return: The first subject with the key, None if there is none
+        :rtype: RWSSubjectListItem
+        """
+        subjects = self._index("subjectkey").get(subjectkey)
+        return subjects[0] if subjects else None
+
+    def subject_by_name(self, subject_name):
+        """
+        The subject with a name, whatever the SubjectKeyType
+
+        :param str subject_name: Subject name
+        :return: The first subject with the name, None if there is none
+        :rtype: RWSSubjectListItem
+        """
+        subjects = self._index("subject_name").get(subject_name)
+        return subjects[0] if subjects else None
+
+    def subjects_at_site(self, locationoid):
+        """
+        The subjects at a site
+
+        :param str locationoid: Site LocationOID
+        :rtype: list(RWSSubjectListItem)
+        """
+        return list(self._index("locationoid").get(locationoid, ()))
+
+    def subjects_at_site_number(self, study_environment_site_number):
+        """
+        The subjects at a study environment site
+
+        :param str study_environment_site_number: StudyEnvSiteNumber of the site
+        :rtype: list(RWSSubjectListItem)
+        """
+        return list(self._index("study_environment_site_number").get(study_environment_site_number, ()))
+
+    def group_by_site(self):
+        """
+        The subjects grouped by site
+
+        :return: Lists of subjects by site LocationOID, in the order of the list
+        :rtype: dict
+        """
+        return dict((locationoid, list(subjects)) for locationoid, subjects in self._index("locationoid").items())
+
+
+def _invalidating(name):
+    """A list method of RWSSubjects that drops the indexes, as it changes the list"""
+    method = getattr(list, name)
+
+    def mutate(self, *args, **kwargs):
+        self._indexes = None
+        return method(self, *args, **kwargs)
+
+    mutate.__name__ = name
+    mutate.__doc__ = method.__doc__
+    return mutate
+
+
+for _name in (
+    "append",
+    "extend",
+    "insert",
+    "remove",
+    "pop",
+    "clear",
+    "sort",
+    "reverse",
+    "__setitem__",
+    "__delitem__",
+    "__iadd__",
+    "__imul__",
+):
+    setattr(RWSSubjects, _name, _invalidating(_name))
+
+
+class RWSSubjectsStream(object):
+    """
+    The subjects of a subject list read from the ODM as they are iterated over, in constant memory.
+
+    Each ClinicalData element is converted to an :class:`RWSSubjectListItem` and discarded as soon as it has been read,
+    so a list of any size can be walked without holding its tree or its items. A stream can be iterated over once.
+    Alternatively :meth:`materialise`, before iterating, reads the subjects into a list which is kept for ``len()``,
+    indexing and further iteration. A stream is true if it has any subjects, which only reads ahead to the first.
+
+    The FileType, CreationDateTime, FileOID, ODMVersion and Granularity of the ODM are read on creation.
+    """
+
+    def __init__(self, xml, chunk_size=64 * 1024):
+        """
+        :param xml: Subject list ODM as bytes, a string or a binary file-like object (e.g. rwslib.RWSResponseStream)
+        :param int chunk_size: Number of bytes to pass to the parser at a time
+        """
+        if isinstance(xml, str):
+            xml = xml.encode("utf-8")
+        if not hasattr(xml, "read"):
+            xml = io.BytesIO(xml)
+        self.source = xml
+        self.chunk_size = chunk_size
+        self._parser = etree.XMLPullParser(
+            events=("start", "end"),
+            tag=(ODM_NS + "ODM", ODM_NS + "ClinicalData"),
+            ns_clean=True,
+            collect_ids=False,
+            huge_tree=True,
+        )
+        self._events = self._read_events()
+        self._elements = self._iter_elements()
+        # Element read ahead by bool(), not yet handed on
+        self._peeked = None
+        self._subjects = (RWSSubjectListItem.fromElement(elem) for elem in self._pending_elements())
+        # Count of subjects read so far
+        self._read = 0
+        self._iterating = False
+        self._items = None
+
+        self.filetype = None
+        self.creationdatetime = None
+        self.fileoid = None
+        self.ODMVersion = None
+        self.granularity = None
+        self._root = None
+        for event, elem in self._events:
+            if event == "start" and elem.tag == ODM_NS + "ODM":
+                self._root = elem
+                self.filetype = elem.get("FileType")
+                self.creationdatetime = elem.get("CreationDateTime")
+                self.fileoid = elem.get("FileOID")
+                self.ODMVersion = elem.get("ODMVersion")
+                self.granularity = elem.get("Granularity", None)
+                break
+
+    def _read_events(self):
+        started = False
+        while True:
+            chunk = self.source.read(self.chunk_size)
+            if not chunk:
+                break
+            if not started:
+                # Remove BOM or anything else before the first element (as for parseXMLString)
+                start = chunk.find(b"<")
+                if start == -1:
+                    continue
+                chunk = chunk[start:]
+                started = True
+            self._parser.feed(chunk)
+            for event in self._parser.read_events():
+                yield event
+        if started:
+            self._parser.close()
+            for event in self._parser.read_events():
+                yield event
+        self.close()
+
+    def _iter_elements(self):
+        for event, elem in self._events:
+            if event == "end" and elem.tag == ODM_NS + "ClinicalData":
+                self._read += 1
+                yield elem
+                # Discard the element and any read before it
+                elem.clear()
+                parent = elem.getparent()
+                while elem.getprevious() is not None:
+                    del parent[0]
+
+    def _pending_elements(self):
+        if self._peeked is not None:
+            elem, self._peeked = self._peeked, None
+            yield elem
+        for elem in self._elements:
+            yield elem
+
+    def __iter__(self):
+        if self._items is not None:
+            return iter(self._items)
+        if self._iterating:
+            raise ValueError("The subjects can only be iterated over once unless they are materialised first")
+        self._iterating = True
+        return self._subjects
+
+    def __bool__(self):
+        if self._items is not None:
+            return bool(self._items)
+        if not self._read:
+            # Read ahead to the first subject, it is handed on when the subjects are read
+            self._peeked = next(self._elements, None)
+        return self._read > 0
+
+    def materialise(self):
+        """
+        Read the subjects into a list, kept for len(), indexing and further iteration
+
+        :rtype: list(RWSSubjectListItem)
+        """
+        if self._items is None:
+            if self._iterating:
+                raise ValueError("The subjects are being read one at a time, they can no longer be materialised")
+            self._items = list(self._subjects)
+        return self._items
+
+    def to_columns(self):
+        """
+        Read the subjects into columns, see :func:`subject_columns`. The columns are filled straight from the ODM
+        without creating an RWSSubjectListItem for each subject, so this counts as iterating over the stream.
+
+        :rtype: dict
+        """
+        if self._items is not None:
+            return subject_columns(self._items)
+        if self._iterating:
+            raise ValueError("The subjects can only be iterated over once unless they are materialised first")
+        self._iterating = True
+        columns = _empty_columns(SUBJECT_COLUMNS, SUBJECT_FLAG_COLUMNS)
+        read = _subject_row_reader(columns)
+        for elem in self._pending_elements():
+            read(elem)
+        return columns
+
+    def to_numpy(self):
+        """
+        Read the subjects into a NumPy structured array, see :func:`columns_to_numpy`
+
+        :rtype: numpy.ndarray
+        """
+        return columns_to_numpy(self.to_columns())
+
+    def close(self):
+        """Stop reading, releasing the source (e.g. the connection of a streamed response)"""
+        close = getattr(self.source, "close", None)
+        if close is not None:
+            close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
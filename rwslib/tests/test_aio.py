@@ -0,0 +1,366 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+import gzip
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import rwslib
+from rwslib.aio import AsyncRWSConnection
+from rwslib.rws_requests import (
+    ClinicalStudiesRequest,
+    PostDataRequest,
+    RWSGetRequest,
+    VersionRequest,
+)
+from rwslib.rwsobjects import RWSPostResponse, RWSStudies
+
+STUDIES = b"""<ODM FileType="Snapshot" FileOID="767a1f8b-7b72-4d12-adbe-37d4d62ba75e"
+     CreationDateTime="2013-04-08T10:02:17.781-00:00"
+     ODMVersion="1.3"
+     xmlns:mdsol="http://www.mdsol.com/ns/odm/metadata"
+     xmlns:xlink="http://www.w3.org/1999/xlink"
+     xmlns="http://www.cdisc.org/ns/odm/v1.3">
+     <Study OID="Lab Test">
+        <GlobalVariables>
+              <StudyName>Lab Test</StudyName>
+              <StudyDescription/>
+              <ProtocolName>Lab Test</ProtocolName>
+        </GlobalVariables>
+     </Study>
+</ODM>"""
+
+POST_RESPONSE = b"""<Response ReferenceNumber="82e942b0-48e8-4cf4-b299-51e2b6a89a1b"
+    InboundODMFileOID=""
+    IsTransactionSuccessful="1"
+    SuccessStatistics="Rave objects touched: Subjects=1; Folders=0; Forms=0; Fields=0; LogLines=0" NewRecords="">
+</Response>"""
+
+ERROR_RESPONSE = b"""<Response
+    ReferenceNumber="0b47fe86-542f-4070-9e7d-16396a5ef08a"
+    InboundODMFileOID="Not Supplied"
+    IsTransactionSuccessful="0"
+    ReasonCode="RWS00092"
+    ErrorClientResponseMessage="CRF version not found">
+</Response>"""
+
+
+class PathRequest(RWSGetRequest):
+    """Request for an arbitrary path on the test server"""
+
+    def __init__(self, path):
+        self.path = path
+
+    def url_path(self):
+        return self.path
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """Imitates the handful of RWS endpoints used by the tests"""
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def setup(self):
+        BaseHTTPRequestHandler.setup(self)
+        self.server.connections += 1
+
+    def send_body(self, status, body, content_type="text/plain", headers=None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def drop(self):
+        """Close the connection without responding, as a server closing an idle connection would"""
+        self.server.drop_next = False
+        self.close_connection = True
+
+    def truncate(self):
+        """Close the connection part way through the body"""
+        self.server.truncate_next = False
+        self.send_response(200)
+        self.send_header("Content-Length", "100")
+        self.end_headers()
+        self.wfile.write(b"1.0")
+        self.close_connection = True
+
+    def do_GET(self):
+        if self.server.drop_next:
+            return self.drop()
+        if self.server.truncate_next:
+            return self.truncate()
+        path = self.path[len("/RaveWebServices/"):]
+        if path == "version":
+            self.send_body(200, b"1.0.0", headers={"Link": '<http://x/version?page=2>; rel="next"'})
+        elif path == "studies":
+            if "Authorization" not in self.headers:
+                self.send_body(401, b"Authorization Header not provided")
+            else:
+                self.send_body(200, STUDIES, content_type="text/xml; charset=utf-8")
+        elif path == "gzipped":
+            self.send_body(200, gzip.compress(b"1.0.0"), headers={"Content-Encoding": "gzip"})
+        elif path == "chunked":
+            self.send_response(200)
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            for chunk in (b"1.0", b".0"):
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(chunk), chunk))
+            self.wfile.write(b"0\r\n\r\n")
+        elif path == "badchunk":
+            self.send_response(200)
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            self.wfile.write(b"zz\r\n1.0\r\n0\r\n\r\n")
+        elif path == "missing":
+            self.send_body(404, ERROR_RESPONSE, content_type="text/xml")
+        elif path == "busy":
+            self.send_body(503, b"HTTP 503 Service Temporarily Unavailable")
+        elif path == "slow":
+            with self.server.lock:
+                self.server.in_flight += 1
+                self.server.max_in_flight = max(self.server.max_in_flight, self.server.in_flight)
+            time.sleep(0.05)
+            with self.server.lock:
+                self.server.in_flight -= 1
+            self.send_body(200, b"slow")
+        else:
+            self.send_body(404, b"<html>Not found</html>", content_type="text/html")
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        self.server.posted.append(body)
+        if self.server.drop_next:
+            return self.drop()
+        self.send_body(200, POST_RESPONSE, content_type="text/xml")
+
+
+class TestAsyncRWSConnection(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), StandInHandler)
+        cls.server.daemon_threads = True
+        cls.server.lock = threading.Lock()
+        cls.thread = threading.Thread(target=cls.server.serve_forever)
+        cls.thread.daemon = True
+        cls.thread.start()
+        cls.url = "http://127.0.0.1:%d" % cls.server.server_address[1]
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        self.server.connections = 0
+        self.server.in_flight = 0
+        self.server.max_in_flight = 0
+        self.server.posted = []
+        self.server.drop_next = False
+        self.server.truncate_next = False
+
+    def run_with_connection(self, coro_fn, **kwargs):
+        async def runner():
+            async with AsyncRWSConnection(self.url, **kwargs) as rave:
+                return await coro_fn(rave)
+
+        return asyncio.run(runner())
+
+    def test_domain(self):
+        """Domains are expanded as for RWSConnection"""
+        rave = AsyncRWSConnection("innovate", "user", "pass")
+        self.assertEqual("https://innovate.mdsol.com/RaveWebServices", rave.base_url)
+        self.assertEqual(("user", "pass"), rave.auth)
+
+    def test_send_request(self):
+        """Results are processed by the request object"""
+
+        async def go(rave):
+            return await rave.send_request(VersionRequest())
+
+        self.assertEqual("1.0.0", self.run_with_connection(go))
+
+    def test_execute(self):
+        """execute returns the envelope for the call"""
+
+        async def go(rave):
+            return await rave.execute(VersionRequest())
+
+        call = self.run_with_connection(go)
+        self.assertIsInstance(call, rwslib.RWSCall)
+        self.assertEqual(200, call.status_code)
+        self.assertEqual("http://x/version?page=2", call.links["next"]["url"])
+        self.assertIs(type(call.request_time), float)
+
+    def test_xml_result(self):
+        """XML results are parsed with the request class result()"""
+
+        async def go(rave):
+            return await rave.send_request(ClinicalStudiesRequest())
+
+        studies = self.run_with_connection(go, username="user", password="pass")
+        self.assertIsInstance(studies, RWSStudies)
+        self.assertEqual("Lab Test", studies[0].oid)
+
+    def test_post(self):
+        """Request bodies are sent"""
+
+        async def go(rave):
+            return await rave.send_request(PostDataRequest("<ODM/>"))
+
+        result = self.run_with_connection(go, username="user", password="pass")
+        self.assertIsInstance(result, RWSPostResponse)
+        self.assertEqual(1, result.subjects_touched)
+        self.assertEqual([b"<ODM/>"], self.server.posted)
+
+    def test_content_encodings(self):
+        """Gzipped and chunked responses are decoded"""
+
+        async def go(rave):
+            return (
+                await rave.send_request(PathRequest("gzipped")),
+                await rave.send_request(PathRequest("chunked")),
+            )
+
+        self.assertEqual(("1.0.0", "1.0.0"), self.run_with_connection(go))
+
+    def test_authorization_exception(self):
+        """Missing authorization is classified as for RWSConnection"""
+
+        async def go(rave):
+            return await rave.send_request(ClinicalStudiesRequest())
+
+        with self.assertRaises(rwslib.AuthorizationException):
+            self.run_with_connection(go)
+
+    def test_error_responses(self):
+        """Error responses are classified as for RWSConnection"""
+
+        async def missing(rave):
+            return await rave.send_request(PathRequest("missing"))
+
+        with self.assertRaises(rwslib.RWSException) as exc:
+            self.run_with_connection(missing)
+        self.assertEqual("CRF version not found", str(exc.exception))
+        self.assertIsInstance(exc.exception.rws_error, rwslib.RWSErrorResponse)
+
+        async def busy(rave):
+            return await rave.send_request(PathRequest("busy"))
+
+        with self.assertRaises(rwslib.RWSException) as exc:
+            self.run_with_connection(busy)
+        self.assertEqual("Unexpected Status Code (503)", str(exc.exception))
+
+    def test_keep_alive(self):
+        """Sequential requests reuse a connection"""
+
+        async def go(rave):
+            for _ in range(5):
+                await rave.send_request(VersionRequest())
+
+        self.run_with_connection(go)
+        self.assertEqual(1, self.server.connections)
+
+    def test_dropped_connection(self):
+        """A GET on a kept-alive connection that is dropped is sent again on a new connection"""
+
+        async def go(rave):
+            await rave.send_request(VersionRequest())
+            self.server.drop_next = True
+            return await rave.send_request(VersionRequest())
+
+        self.assertEqual("1.0.0", self.run_with_connection(go))
+        self.assertEqual(2, self.server.connections)
+
+    def test_dropped_post_not_repeated(self):
+        """A POST on a kept-alive connection that is dropped is not sent again, it may have been processed"""
+
+        async def go(rave):
+            await rave.send_request(VersionRequest())
+            self.server.drop_next = True
+            return await rave.send_request(PostDataRequest("<ODM/>"))
+
+        with self.assertRaises(rwslib.RWSException) as exc:
+            self.run_with_connection(go)
+        self.assertEqual("Server Connection Error", str(exc.exception))
+        self.assertEqual(1, len(self.server.posted))
+        self.assertEqual(1, self.server.connections)
+
+    def test_truncated_body_retried(self):
+        """A GET on a kept-alive connection closed part way through the body is sent again on a new connection"""
+
+        async def go(rave):
+            await rave.send_request(VersionRequest())
+            self.server.truncate_next = True
+            return await rave.send_request(VersionRequest())
+
+        self.assertEqual("1.0.0", self.run_with_connection(go))
+        self.assertEqual(2, self.server.connections)
+
+    def test_truncated_body(self):
+        """A body cut short on a new connection is raised as an RWSException"""
+
+        async def go(rave):
+            self.server.truncate_next = True
+            return await rave.send_request(VersionRequest())
+
+        with self.assertRaises(rwslib.RWSException) as exc:
+            self.run_with_connection(go)
+        self.assertEqual("Server Connection Error", str(exc.exception))
+
+    def test_malformed_chunks(self):
+        """A malformed chunked body is raised as an RWSException"""
+        with self.assertRaises(rwslib.RWSException) as exc:
+            self.run_with_connection(lambda rave: rave.send_request(PathRequest("badchunk")))
+        self.assertIn("malformed", exc.exception.rws_error)
+
+    def test_concurrency_limit(self):
+        """No more than max_concurrency requests are in flight at once"""
+
+        async def go(rave):
+            return [
+                call async for call in rave.send_requests([PathRequest("slow") for _ in range(8)])
+            ]
+
+        calls = self.run_with_connection(go, max_concurrency=3)
+        self.assertEqual(["slow"] * 8, [c.result for c in calls])
+        self.assertLessEqual(self.server.max_in_flight, 3)
+        self.assertGreater(self.server.max_in_flight, 1)
+
+    def test_send_requests_captures_exceptions(self):
+        """Exceptions are captured per call"""
+
+        async def go(rave):
+            return [
+                call
+                async for call in rave.send_requests(
+                    [PathRequest("busy"), VersionRequest()], ordered=False
+                )
+            ]
+
+        calls = self.run_with_connection(go)
+        self.assertEqual(2, len(calls))
+        results = dict((c.url.rsplit("/", 1)[-1], c) for c in calls)
+        self.assertEqual("1.0.0", results["version"].result)
+        self.assertIsInstance(results["busy"].exception, rwslib.RWSException)
+
+    def test_read_timeout(self):
+        """Timeouts are reported as for RWSConnection"""
+
+        async def go(rave):
+            return await rave.send_request(PathRequest("slow"), timeout=0.01)
+
+        with self.assertRaises(rwslib.RWSException) as exc:
+            self.run_with_connection(go)
+        self.assertEqual("Server Read Timeout", str(exc.exception))
+
+
+if __name__ == "__main__":
+    unittest.main()
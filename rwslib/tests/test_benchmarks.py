@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+
+import contextlib
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+from rwslib.benchmarks import (
+    BENCHMARKS,
+    BenchmarkResult,
+    compare,
+    load_results,
+    main,
+    run_benchmarks,
+    save_results,
+)
+
+
+def result(name, throughput):
+    return BenchmarkResult(name, "items", 1000, [1000.0 / throughput, 2000.0 / throughput])
+
+
+class TestSuite(unittest.TestCase):
+    def test_run_all(self):
+        """Every benchmark of the suite runs at a small scale"""
+        results = run_benchmarks(scale=0.01, repeat=1)
+        self.assertEqual(list(BENCHMARKS), list(results))
+        self.assertIn("send_request", results)
+        for name, bench in results.items():
+            self.assertGreater(bench.items, 0, name)
+            self.assertEqual(1, len(bench.timings))
+            self.assertGreater(bench.throughput, 0, name)
+
+    def test_unknown(self):
+        with self.assertRaises(ValueError):
+            run_benchmarks(["parse_xml_string", "no_such_benchmark"])
+
+
+class TestResults(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, "baseline.json")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_result(self):
+        bench = result("parse", 500.0)
+        self.assertEqual(2.0, bench.best)
+        self.assertEqual(3.0, bench.median)
+        self.assertEqual(500.0, bench.throughput)
+
+    def test_save_load(self):
+        """Results round trip through JSON"""
+        results = dict(parse=result("parse", 500.0))
+        save_results(self.path, results, scale=0.5)
+        loaded, scale = load_results(self.path)
+        self.assertEqual(0.5, scale)
+        self.assertEqual(["parse"], list(loaded))
+        self.assertEqual(500.0, loaded["parse"].throughput)
+        self.assertEqual("items", loaded["parse"].units)
+
+    def test_compare(self):
+        """Falls in throughput beyond the threshold are regressions"""
+        baseline = dict(a=result("a", 1000.0), b=result("b", 1000.0), c=result("c", 1000.0))
+        results = dict(a=result("a", 850.0), b=result("b", 700.0), c=result("c", 2000.0), d=result("d", 1.0))
+        regressions = compare(results, baseline, threshold=0.2)
+        self.assertEqual(["b"], [r.name for r in regressions])
+        self.assertAlmostEqual(-0.3, regressions[0].change)
+        self.assertEqual(["a", "b"], sorted(r.name for r in compare(results, baseline, threshold=0.1)))
+
+    def test_main(self):
+        """The command line fails when a benchmark regresses against the baseline"""
+        args = ["parse_xml_string", "--scale", "0.01", "--repeat", "1"]
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.assertEqual(0, main(args + ["--save", self.path]))
+        saved, scale = load_results(self.path)
+        self.assertEqual(["parse_xml_string"], list(saved))
+        self.assertEqual(0.01, scale)
+        save_results(self.path, dict(parse_xml_string=result("parse_xml_string", 1e15)), scale=0.01)
+        stderr = io.StringIO()
+        with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(stderr):
+            self.assertEqual(1, main(args + ["--compare", self.path]))
+        self.assertIn("REGRESSION parse_xml_string", stderr.getvalue())
+
+    def test_main_scale(self):
+        """The command line refuses to compare with a baseline run at a different scale"""
+        save_results(self.path, dict(parse_xml_string=result("parse_xml_string", 1.0)), scale=1.0)
+        stderr = io.StringIO()
+        with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(stderr):
+            with self.assertRaises(SystemExit) as exc:
+                main(["parse_xml_string", "--scale", "0.01", "--repeat", "1", "--compare", self.path])
+        self.assertEqual(2, exc.exception.code)
+        self.assertIn("--scale 1.0", stderr.getvalue())
+
+
+if __name__ == "__main__":
+    unittest.main()
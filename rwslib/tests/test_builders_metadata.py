@@ -157,6 +157,13 @@ class TestStudyEventRef(unittest.TestCase):
         doc = obj_to_doc(ser)
         self.assertEqual("0", str(doc.get('OrderNumber')))
 
+    def test_order_number(self):
+        """Integer order numbers are written as strings"""
+        ser = StudyEventRef("OID", 2, True)
+        doc = obj_to_doc(ser)
+        self.assertEqual("2", doc.get('OrderNumber'))
+        self.assertIn('OrderNumber="2"', str(ser))
+
     def test_mandatory_study_event_ref(self):
         ser = StudyEventRef("OID", mandatory=True)
         doc = obj_to_doc(ser)
@@ -0,0 +1,271 @@
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+import httpretty
+import requests
+
+import rwslib
+from rwslib.cache import (
+    CACHE_BYPASS,
+    CACHE_REFRESH,
+    CachedResponse,
+    CachePolicy,
+    DiskCache,
+    MemoryCache,
+)
+from rwslib.rws_requests import (
+    ClinicalStudiesRequest,
+    MetadataStudiesRequest,
+    PostDataRequest,
+    StudyVersionRequest,
+    StudyVersionsRequest,
+)
+
+
+def make_entry(content=b"<ODM/>", expires=None):
+    return CachedResponse(
+        "https://innovate.mdsol.com/RaveWebServices/version",
+        200,
+        {"Content-Type": "text/xml; charset=utf-8"},
+        content,
+        "utf-8",
+        expires,
+    )
+
+
+class TestCachePolicy(unittest.TestCase):
+    def test_default_policy(self):
+        """Versions never expire, lists of studies and versions expire"""
+        policy = CachePolicy()
+        self.assertTrue(policy.is_cacheable(StudyVersionRequest("Mediflex", 1)))
+        self.assertIsNone(policy.ttl(StudyVersionRequest("Mediflex", 1)))
+        self.assertEqual(3600, policy.ttl(StudyVersionsRequest("Mediflex")))
+        self.assertEqual(3600, policy.ttl(MetadataStudiesRequest()))
+        self.assertFalse(policy.is_cacheable(ClinicalStudiesRequest()))
+
+    def test_posts_not_cacheable(self):
+        """POST requests are never cached, whatever the policy says"""
+        policy = CachePolicy({PostDataRequest: None})
+        self.assertFalse(policy.is_cacheable(PostDataRequest("<ODM/>")))
+
+    def test_subclasses(self):
+        """Subclasses of a listed class share its time to live"""
+
+        class MyVersionRequest(StudyVersionsRequest):
+            pass
+
+        policy = CachePolicy({StudyVersionsRequest: 10})
+        self.assertEqual(10, policy.ttl(MyVersionRequest("Mediflex")))
+        with self.assertRaises(KeyError):
+            policy.ttl(MetadataStudiesRequest())
+
+
+class TestCachedResponse(unittest.TestCase):
+    def test_round_trip(self):
+        """A cached response can be rebuilt for result()"""
+        response = make_entry("<ODM>é</ODM>".encode("utf-8")).to_response()
+        self.assertIsInstance(response, requests.models.Response)
+        self.assertEqual(200, response.status_code)
+        self.assertEqual("<ODM>é</ODM>", response.text)
+        self.assertEqual("text/xml; charset=utf-8", response.headers["content-type"])
+
+    def test_expiry(self):
+        """Entries expire after their time to live"""
+        self.assertFalse(make_entry().is_expired())
+        self.assertTrue(make_entry(expires=time.time() - 1).is_expired())
+        self.assertFalse(make_entry(expires=time.time() + 60).is_expired())
+
+
+class TestMemoryCache(unittest.TestCase):
+    def test_hits_and_misses(self):
+        """Hits and misses are counted"""
+        cache = MemoryCache()
+        self.assertIsNone(cache.get("a"))
+        cache.set("a", make_entry())
+        self.assertEqual(b"<ODM/>", cache.get("a").content)
+        self.assertEqual(dict(hits=1, misses=1), cache.stats())
+
+    def test_expired_entries_removed(self):
+        """Expired entries are misses and are dropped"""
+        cache = MemoryCache()
+        cache.set("a", make_entry(expires=time.time() - 1))
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(0, len(cache))
+
+    def test_lru_entries(self):
+        """The least recently used entry is evicted"""
+        cache = MemoryCache(max_entries=2)
+        cache.set("a", make_entry())
+        cache.set("b", make_entry())
+        cache.get("a")
+        cache.set("c", make_entry())
+        self.assertIsNone(cache.get("b"))
+        self.assertIsNotNone(cache.get("a"))
+        self.assertIsNotNone(cache.get("c"))
+
+    def test_lru_bytes(self):
+        """Entries are evicted to keep within max_bytes, oversized entries are not kept"""
+        cache = MemoryCache(max_bytes=10)
+        cache.set("a", make_entry(b"12345"))
+        cache.set("b", make_entry(b"12345"))
+        cache.set("c", make_entry(b"123"))
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(2, len(cache))
+        cache.set("d", make_entry(b"12345678901"))
+        self.assertIsNone(cache.get("d"))
+        cache.clear()
+        self.assertEqual(0, len(cache))
+
+
+class TestDiskCache(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_round_trip(self):
+        """Entries survive being written to disk and can be shared between cache instances"""
+        expires = time.time() + 60
+        DiskCache(self.tmpdir).set("a", make_entry(expires=expires))
+        entry = DiskCache(self.tmpdir).get("a")
+        self.assertEqual(b"<ODM/>", entry.content)
+        self.assertEqual(200, entry.status_code)
+        self.assertEqual("utf-8", entry.encoding)
+        self.assertEqual(expires, entry.expires)
+        self.assertEqual("text/xml; charset=utf-8", entry.headers["Content-Type"])
+
+    def test_delete_and_clear(self):
+        """Entries can be removed"""
+        cache = DiskCache(self.tmpdir)
+        cache.set("a", make_entry())
+        cache.set("b", make_entry())
+        cache.delete("a")
+        self.assertIsNone(cache.get("a"))
+        cache.clear()
+        self.assertIsNone(cache.get("b"))
+
+    def test_eviction(self):
+        """Least recently used files are removed to keep within max_bytes"""
+        cache = DiskCache(self.tmpdir, max_bytes=1)
+        cache.set("a", make_entry())
+        self.assertIsNone(cache.get("a"))
+
+    def test_running_total(self):
+        """The directory is only listed when the cache may have grown past max_bytes"""
+        DiskCache(self.tmpdir).set("a", make_entry())
+        size = os.path.getsize(os.path.join(self.tmpdir, "a" + DiskCache.SUFFIX))
+        cache = DiskCache(self.tmpdir, max_bytes=size * 2)
+        self.assertEqual(size, cache._bytes)
+        with mock.patch("os.listdir", side_effect=os.listdir) as listdir:
+            cache.set("a", make_entry())
+            cache.set("b", make_entry())
+            cache.delete("b")
+            cache.set("b", make_entry())
+            self.assertEqual(0, listdir.call_count)
+            self.assertEqual(size * 2, cache._bytes)
+            cache.set("c", make_entry())
+            self.assertEqual(1, listdir.call_count)
+        self.assertEqual(size * 2, cache._bytes)
+        self.assertEqual(2, len([n for n in os.listdir(self.tmpdir) if n.endswith(DiskCache.SUFFIX)]))
+
+
+class TestConnectionCache(unittest.TestCase):
+    URL = "https://innovate.mdsol.com/RaveWebServices/metadata/studies/Mediflex/versions/1"
+
+    def setUp(self):
+        httpretty.enable()
+        httpretty.register_uri(httpretty.GET, self.URL, status=200, body="<ODM/>")
+        self.cache = MemoryCache()
+        self.rave = rwslib.RWSConnection(
+            "https://innovate.mdsol.com", "user", "pass", cache=self.cache
+        )
+
+    def tearDown(self):
+        httpretty.disable()
+        httpretty.reset()
+
+    def test_hit(self):
+        """The second request is served from the cache"""
+        first = self.rave.execute(StudyVersionRequest("Mediflex", 1))
+        second = self.rave.execute(StudyVersionRequest("Mediflex", 1))
+        self.assertFalse(first.from_cache)
+        self.assertTrue(second.from_cache)
+        self.assertEqual("<ODM/>", second.result)
+        self.assertEqual(200, second.status_code)
+        self.assertEqual(1, len(httpretty.latest_requests()))
+        self.assertEqual(dict(hits=1, misses=1), self.cache.stats())
+
+    def test_bypass(self):
+        """Bypassed requests neither use nor fill the cache"""
+        self.rave.send_request(StudyVersionRequest("Mediflex", 1), cache_control=CACHE_BYPASS)
+        self.assertEqual(0, len(self.cache))
+        self.rave.send_request(StudyVersionRequest("Mediflex", 1))
+        call = self.rave.execute(StudyVersionRequest("Mediflex", 1), cache_control=CACHE_BYPASS)
+        self.assertFalse(call.from_cache)
+        self.assertEqual(3, len(httpretty.latest_requests()))
+
+    def test_refresh(self):
+        """Refreshed requests go to RWS and replace the cached response"""
+        self.rave.send_request(StudyVersionRequest("Mediflex", 1))
+        httpretty.register_uri(httpretty.GET, self.URL, status=200, body="<ODM>2</ODM>")
+        call = self.rave.execute(StudyVersionRequest("Mediflex", 1), cache_control=CACHE_REFRESH)
+        self.assertFalse(call.from_cache)
+        self.assertEqual("<ODM>2</ODM>", self.rave.send_request(StudyVersionRequest("Mediflex", 1)))
+        self.assertEqual(2, len(httpretty.latest_requests()))
+
+    def test_users_not_shared(self):
+        """Responses are not shared between users"""
+        self.rave.send_request(StudyVersionRequest("Mediflex", 1))
+        other = rwslib.RWSConnection(
+            "https://innovate.mdsol.com", "other", "pass", cache=self.cache
+        )
+        self.assertFalse(other.execute(StudyVersionRequest("Mediflex", 1)).from_cache)
+
+    def test_passwords_not_shared(self):
+        """Responses are not given to the same user with a different password"""
+        self.rave.send_request(StudyVersionRequest("Mediflex", 1))
+        other = rwslib.RWSConnection(
+            "https://innovate.mdsol.com", "user", "wrong", cache=self.cache
+        )
+        self.assertFalse(other.execute(StudyVersionRequest("Mediflex", 1)).from_cache)
+        same = rwslib.RWSConnection(
+            "https://innovate.mdsol.com", auth=requests.auth.HTTPBasicAuth("user", "pass"), cache=self.cache
+        )
+        self.assertTrue(same.execute(StudyVersionRequest("Mediflex", 1)).from_cache)
+
+    def test_unknown_auth_not_cached(self):
+        """Responses are not cached for auth objects whose credentials cannot be fingerprinted"""
+
+        class OpaqueAuth(requests.auth.AuthBase):
+            def __call__(self, r):
+                return r
+
+        rave = rwslib.RWSConnection("https://innovate.mdsol.com", auth=OpaqueAuth(), cache=self.cache)
+        rave.send_request(StudyVersionRequest("Mediflex", 1))
+        self.assertFalse(rave.execute(StudyVersionRequest("Mediflex", 1)).from_cache)
+        self.assertEqual(0, len(self.cache))
+
+        class IdentifiedAuth(OpaqueAuth):
+            cache_identity = "app-1"
+
+        rave = rwslib.RWSConnection("https://innovate.mdsol.com", auth=IdentifiedAuth(), cache=self.cache)
+        rave.send_request(StudyVersionRequest("Mediflex", 1))
+        self.assertTrue(rave.execute(StudyVersionRequest("Mediflex", 1)).from_cache)
+
+    def test_errors_not_cached(self):
+        """Error responses are not kept"""
+        httpretty.register_uri(httpretty.GET, self.URL, status=500, body="Oops")
+        with self.assertRaises(rwslib.RWSException):
+            self.rave.send_request(StudyVersionRequest("Mediflex", 1))
+        self.assertEqual(0, len(self.cache))
+
+
+if __name__ == "__main__":
+    unittest.main()
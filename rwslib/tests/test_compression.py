@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+
+import gzip
+import unittest
+
+import httpretty
+
+import rwslib
+from rwslib.builders import ClinicalData, ODM, SubjectData
+from rwslib.compression import CompressionStats, compress_body
+from rwslib.rws_requests import (
+    PostDataRequest,
+    PostMetadataRequest,
+    StudyDatasetRequest,
+)
+from rwslib.timing import TimingLog
+
+POST_RESPONSE = """<Response ReferenceNumber="82e942b0-48e8-4cf4-b299-51e2b6a89a1b"
+    InboundODMFileOID=""
+    IsTransactionSuccessful="1"
+    SuccessStatistics="Rave objects touched: Subjects=1; Folders=0; Forms=0; Fields=0; LogLines=0" NewRecords="">
+</Response>"""
+
+
+def make_odm():
+    odm = ODM("Test User", fileoid="1234", creationdatetime="2020-01-01T00:00:00")
+    for subject in range(50):
+        odm << ClinicalData("Mediflex", "Prod")(SubjectData("Site 1", "%03d" % subject))
+    return odm
+
+
+class TestCompressBody(unittest.TestCase):
+    def test_text(self):
+        """Text bodies are gzipped and sizes are recorded"""
+        body = "<ODM>" + "<ClinicalData/>" * 1000 + "</ODM>"
+        compressed, stats = compress_body(body)
+        self.assertEqual(body.encode("utf-8"), gzip.decompress(compressed))
+        self.assertEqual(len(body), stats.uncompressed_bytes)
+        self.assertEqual(len(compressed), stats.compressed_bytes)
+        self.assertLess(stats.ratio, 0.1)
+        self.assertEqual(len(body) - len(compressed), stats.bytes_saved)
+
+    def test_builder(self):
+        """Builder output is compressed as it is serialised, matching str()"""
+        odm = make_odm()
+        compressed, stats = compress_body(odm)
+        self.assertEqual(str(odm), gzip.decompress(compressed).decode("utf-8"))
+        self.assertEqual(len(str(odm).encode("utf-8")), stats.uncompressed_bytes)
+
+    def test_empty_stats(self):
+        self.assertEqual(1.0, CompressionStats().ratio)
+
+
+class TestCompressedRequests(unittest.TestCase):
+    def test_uncompressed(self):
+        """By default bodies are sent as given"""
+        request = PostDataRequest("<ODM/>")
+        self.assertEqual({"data": "<ODM/>", "headers": {"Content-type": "text/xml"}}, request.args())
+        self.assertIsNone(request.compression)
+
+    def test_compressed(self):
+        """Compressed bodies are gzipped and marked with Content-Encoding"""
+        request = PostMetadataRequest("Mediflex", "<ODM/>", compress=True)
+        args = request.args()
+        self.assertEqual(b"<ODM/>", gzip.decompress(args["data"]))
+        self.assertEqual({"Content-type": "text/xml", "Content-Encoding": "gzip"}, args["headers"])
+        self.assertEqual(6, request.compression.uncompressed_bytes)
+        # The body is compressed once and reused, e.g. when the request is retried
+        stats = request.compression
+        self.assertIs(args["data"], request.args()["data"])
+        self.assertIs(stats, request.compression)
+        request.data = "<ODM></ODM>"
+        self.assertEqual(b"<ODM></ODM>", gzip.decompress(request.args()["data"]))
+        self.assertEqual(11, request.compression.uncompressed_bytes)
+        # The default headers are not changed
+        self.assertEqual({"Content-type": "text/xml"}, PostDataRequest("<ODM/>").headers)
+
+    def test_builder_data(self):
+        """Builder objects can be posted directly"""
+        odm = make_odm()
+        self.assertEqual(str(odm), PostDataRequest(odm).args()["data"])
+
+
+class TestCompressedTransfer(unittest.TestCase):
+    POST_URL = "https://innovate.mdsol.com/RaveWebServices/webservice.aspx?PostODMClinicalData"
+    DATASET_URL = "https://innovate.mdsol.com/RaveWebServices/studies/Mediflex(Prod)/datasets/regular"
+    DATASET = b"<ODM>" + b"<ClinicalData/>" * 10000 + b"</ODM>"
+
+    def setUp(self):
+        httpretty.enable()
+        self.log = TimingLog()
+        self.rave = rwslib.RWSConnection(
+            "https://innovate.mdsol.com", "user", "pass", observers=[self.log]
+        )
+
+    def tearDown(self):
+        httpretty.disable()
+        httpretty.reset()
+
+    def test_post(self):
+        """Compressed posts are sent gzipped and the savings recorded"""
+        received = []
+
+        def respond(request, uri, headers):
+            received.append((request.headers.get("Content-Encoding"), gzip.decompress(request.body)))
+            return [200, headers, POST_RESPONSE]
+
+        httpretty.register_uri(httpretty.POST, self.POST_URL, body=respond)
+        odm = make_odm()
+        result = self.rave.send_request(PostDataRequest(odm, compress=True))
+        self.assertEqual(1, result.subjects_touched)
+        self.assertEqual("gzip", received[0][0])
+        self.assertEqual(str(odm).encode("utf-8"), received[0][1])
+        timing = self.log.timings[0]
+        self.assertEqual(len(str(odm).encode("utf-8")), timing.bytes_sent_uncompressed)
+        self.assertLess(timing.bytes_sent, timing.bytes_sent_uncompressed / 5)
+
+    def test_streamed_gzip_download(self):
+        """Gzipped datasets are decoded as they are streamed, counting the bytes on the wire"""
+        httpretty.register_uri(
+            httpretty.GET,
+            self.DATASET_URL,
+            body=gzip.compress(self.DATASET),
+            adding_headers={"Content-Encoding": "gzip"},
+        )
+        stream = self.rave.send_request(StudyDatasetRequest("Mediflex", "Prod"), stream=True)
+        with stream:
+            self.assertEqual("gzip", stream.content_encoding)
+            self.assertEqual(self.DATASET, b"".join(stream.iter_chunks(1024)))
+            self.assertEqual(len(self.DATASET), stream.bytes_read)
+            self.assertLess(stream.bytes_received, len(self.DATASET) / 10)
+        self.assertEqual("gzip, deflate", httpretty.last_request().headers["Accept-Encoding"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+
+import datetime
+import io
+import sqlite3
+import unittest
+
+import rwslib
+from rwslib.extras.dataset_sync import DatasetMirror, DatasetSync, HighWaterMarks, parse_mark, response_time
+from rwslib.extras.rws_simulator import RWSSimulator, SimulatorConfig
+
+ODM_OPEN = (
+    b'<?xml version="1.0" encoding="utf-8"?>\n'
+    b'<ODM xmlns="http://www.cdisc.org/ns/odm/v1.3" xmlns:mdsol="http://www.mdsol.com/ns/odm/metadata" '
+    b'FileType="Snapshot" FileOID="1" CreationDateTime="2020-01-01T00:00:00" ODMVersion="1.3">'
+)
+
+
+def clinical_data(subject, body, subject_attrs=b""):
+    return (
+        b'<ClinicalData StudyOID="Mediflex(Prod)" MetaDataVersionOID="1">'
+        b'<SubjectData SubjectKey="%s" mdsol:SubjectName="%s"%s><SiteRef LocationOID="SITE01"/>%s</SubjectData>'
+        b"</ClinicalData>" % (subject, subject, subject_attrs, body)
+    )
+
+
+def vitals(pulse, repeat_key=b"1", attrs=b""):
+    return (
+        b'<StudyEventData StudyEventOID="SCREENING"><FormData FormOID="VS" FormRepeatKey="1">'
+        b'<ItemGroupData ItemGroupOID="VS" ItemGroupRepeatKey="%s"%s>'
+        b'<ItemData ItemOID="VS.PULSE" Value="%s"/><ItemData ItemOID="VS.TEMP" IsNull="Yes"/>'
+        b"</ItemGroupData></FormData></StudyEventData>" % (repeat_key, attrs, pulse)
+    )
+
+
+def odm(*clinical_datas):
+    return io.BytesIO(ODM_OPEN + b"".join(clinical_datas) + b"</ODM>")
+
+
+class TestDatasetMirror(unittest.TestCase):
+    def setUp(self):
+        self.db = sqlite3.connect(":memory:")
+        self.mirror = DatasetMirror(self.db, batch_size=2)
+
+    def test_merge(self):
+        """Values are keyed on the repeat keys down to the item"""
+        dataset = odm(clinical_data(b"001", vitals(b"60") + vitals(b"61", b"2")), clinical_data(b"002", vitals(b"70")))
+        self.assertEqual((6, 0), self.mirror.merge(dataset))
+        items = self.mirror.items()
+        self.assertEqual(6, len(items))
+        self.assertEqual(
+            ("Mediflex(Prod)", "001", "SCREENING", "", "VS", "1", "VS", "1", "VS.PULSE", "60", "001", "SITE01"),
+            items[0][:12],
+        )
+        self.assertIsNone(items[1].value)
+        self.assertEqual(["60", "61"], [item.value for item in self.mirror.items(subjectkey="001") if item.value])
+        self.assertEqual([], self.mirror.items(formoid="AE"))
+
+    def test_update(self):
+        """Values pulled again are written over"""
+        self.mirror.merge(odm(clinical_data(b"001", vitals(b"60"))), datetime.datetime(2020, 1, 1))
+        updated = self.mirror.merge(odm(clinical_data(b"001", vitals(b"65"))), datetime.datetime(2020, 1, 2))
+        self.assertEqual((2, 0), updated)
+        items = self.mirror.items()
+        self.assertEqual(2, len(items))
+        self.assertEqual("65", items[0].value)
+        self.assertEqual("2020-01-02T00:00:00", items[0].updated)
+
+    def test_remove(self):
+        """Elements with a TransactionType of Remove are removed with everything below them"""
+        self.mirror.merge(
+            odm(clinical_data(b"001", vitals(b"60") + vitals(b"61", b"2")), clinical_data(b"002", vitals(b"70")))
+        )
+        self.assertEqual(
+            (0, 2), self.mirror.merge(odm(clinical_data(b"001", vitals(b"61", b"2", b' TransactionType="Remove"'))))
+        )
+        self.assertEqual(["1"], sorted(set(item.itemgrouprepeatkey for item in self.mirror.items(subjectkey="001"))))
+        self.assertEqual((0, 2), self.mirror.merge(odm(clinical_data(b"002", b"", b' TransactionType="Remove"'))))
+        self.assertEqual(["001"], sorted(set(item.subjectkey for item in self.mirror.items())))
+
+
+class TestHighWaterMarks(unittest.TestCase):
+    def test_marks(self):
+        marks = HighWaterMarks(sqlite3.connect(":memory:"))
+        mark = datetime.datetime(2020, 1, 2, 3, 4, 5, 678)
+        self.assertIsNone(marks.get("Mediflex", "Prod", "study/regular"))
+        marks.set("Mediflex", "Prod", "study/regular", None, mark)
+        marks.set("Mediflex", "Prod", "study/regular", "VS", mark)
+        self.assertEqual(mark.replace(microsecond=0), marks.get("Mediflex", "Prod", "study/regular"))
+        marks.reset("Mediflex", "Prod", formoid="VS")
+        self.assertIsNone(marks.get("Mediflex", "Prod", "study/regular", "VS"))
+        self.assertIsNotNone(marks.get("Mediflex", "Prod", "study/regular"))
+        marks.reset("Mediflex", "Prod")
+        self.assertIsNone(marks.get("Mediflex", "Prod", "study/regular"))
+
+    def test_response_time(self):
+        """Marks are taken from the Date of the response"""
+
+        class Response(object):
+            headers = {"Date": "Wed, 01 Jan 2020 10:20:30 GMT"}
+
+        self.assertEqual(datetime.datetime(2020, 1, 1, 10, 20, 30), response_time(Response()))
+        Response.headers = {}
+        self.assertLess(datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None) - response_time(Response()),
+                        datetime.timedelta(seconds=5))
+
+
+class TestDatasetSync(unittest.TestCase):
+    def setUp(self):
+        self.simulator = RWSSimulator(SimulatorConfig(subjects=10, records=2)).start()
+        self.rave = rwslib.RWSConnection(self.simulator.url, "user", "pass")
+        self.sync = DatasetSync(self.rave, ":memory:", overlap=datetime.timedelta(minutes=10))
+
+    def tearDown(self):
+        self.sync.close()
+        self.rave.close()
+        self.simulator.stop()
+
+    def test_sync(self):
+        """The first pull is a full pull, later pulls start from the mark less the overlap"""
+        first = self.sync.sync_study("Mediflex", "Prod")
+        self.assertIsNone(first.start)
+        # 10 subjects x 3 forms x 2 records x 5 fields
+        self.assertEqual(300, first.upserted)
+        self.assertEqual(first.mark, self.sync.marks.get("Mediflex", "Prod", "study/regular"))
+        second = self.sync.sync_study("Mediflex", "Prod")
+        self.assertEqual(first.mark - datetime.timedelta(minutes=10), parse_mark(second.start))
+        self.assertIn("start=", self.rave.last_result.url)
+        self.assertEqual(300, len(self.sync.mirror.items()))
+        self.assertIsNone(self.sync.sync_study("Mediflex", "Prod", full=True).start)
+
+    def test_forms(self):
+        """Pulls of a form have their own mark"""
+        result = self.sync.sync_study("Mediflex", "Prod", formoid="VS")
+        self.assertEqual(100, result.upserted)
+        self.assertIsNotNone(self.sync.marks.get("Mediflex", "Prod", "study/regular", "VS"))
+        self.assertIsNone(self.sync.marks.get("Mediflex", "Prod", "study/regular"))
+        self.assertEqual(["VS"], sorted(set(item.formoid for item in self.sync.mirror.items())))
+
+    def test_failure(self):
+        """A pull that fails leaves the mark where it was"""
+        with self.assertRaises(rwslib.RWSException):
+            self.sync.sync_study("Unknown", "Prod")
+        self.assertIsNone(self.sync.marks.get("Unknown", "Prod", "study/regular"))
+
+    def test_form_data(self):
+        """Clinical View changes are returned, the mark is moved on once they have been loaded"""
+        data, result = self.sync.pull_form_data("Mediflex", "Prod", "VS")
+        self.assertIsNone(result.start)
+        self.assertTrue(data.endswith("EOF"))
+        self.assertIsNone(self.sync.marks.get("Mediflex", "Prod", "views/regular/csv", "VS"))
+        self.sync.commit_mark("Mediflex", "Prod", result)
+        self.assertEqual(result.mark, self.sync.marks.get("Mediflex", "Prod", "views/regular/csv", "VS"))
+        data, result = self.sync.pull_form_data("Mediflex", "Prod", "VS")
+        self.assertIsNotNone(result.start)
+
+    def test_form_data_load(self):
+        """The mark is only moved on if the changes are loaded"""
+        loaded = []
+        data, result = self.sync.pull_form_data("Mediflex", "Prod", "VS", load=loaded.append)
+        self.assertEqual([data], loaded)
+        self.assertEqual(result.mark, self.sync.marks.get("Mediflex", "Prod", "views/regular/csv", "VS"))
+
+        def fail(data):
+            raise IOError("Disk full")
+
+        self.sync.marks.reset("Mediflex", "Prod")
+        with self.assertRaises(IOError):
+            self.sync.pull_form_data("Mediflex", "Prod", "VS", load=fail)
+        self.assertIsNone(self.sync.marks.get("Mediflex", "Prod", "views/regular/csv", "VS"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+
+import concurrent.futures
+import threading
+import unittest
+
+import httpretty
+
+import rwslib
+from rwslib.metrics import Histogram, MetricsRegistry
+from rwslib.rws_requests import PostDataRequest, VersionRequest
+from rwslib.timing import RequestTiming
+
+
+def make_timing(request_object, total, exception=None, from_cache=False):
+    timing = RequestTiming(request_object)
+    timing.total = total
+    timing.ttfb = total / 2
+    timing.bytes_received = 100
+    timing.exception = exception
+    timing.from_cache = from_cache
+    return timing
+
+
+class TestHistogram(unittest.TestCase):
+    def test_observe(self):
+        """Values are counted in the first bucket they fit in"""
+        histogram = Histogram((1, 2, float("inf")))
+        for value in (0.5, 1, 1.5, 3, 100):
+            histogram.observe(value)
+        self.assertEqual([2, 1, 2], histogram.counts)
+        self.assertEqual([2, 3, 5], histogram.cumulative_counts())
+        self.assertEqual(5, histogram.count)
+        self.assertEqual(106, histogram.sum)
+
+    def test_quantiles(self):
+        """Quantiles are interpolated within buckets"""
+        histogram = Histogram((1, 2, 4, float("inf")))
+        self.assertIsNone(histogram.quantile(0.5))
+        for value in [0.5] * 50 + [3] * 50:
+            histogram.observe(value)
+        self.assertEqual(1.0, histogram.quantile(0.5))
+        self.assertEqual(3.8, histogram.quantile(0.95))
+        histogram.observe(1000)
+        self.assertEqual(4, histogram.quantile(1.0))
+
+    def test_merge(self):
+        first, second = Histogram((1, float("inf"))), Histogram((1, float("inf")))
+        first.observe(0.5)
+        second.observe(5)
+        first.merge(second)
+        self.assertEqual([1, 1], first.counts)
+        self.assertEqual(5.5, first.sum)
+
+
+class TestMetricsRegistry(unittest.TestCase):
+    def test_snapshot(self):
+        """Calls are grouped by request class and outcome"""
+        registry = MetricsRegistry()
+        for total in (0.02, 0.03, 0.04):
+            registry.on_request(make_timing(VersionRequest(), total))
+        registry.on_request(make_timing(VersionRequest(), 0.001, from_cache=True))
+        registry.on_request(make_timing(PostDataRequest("<ODM/>"), 1.5, exception=ValueError()))
+        snapshot = registry.snapshot()
+        self.assertEqual({"success", "cached"}, set(snapshot["VersionRequest"]))
+        success = snapshot["VersionRequest"]["success"]
+        self.assertEqual(3, success["calls"])
+        self.assertEqual(300, success["bytes_received"])
+        self.assertAlmostEqual(0.045, success["phases"]["ttfb"])
+        self.assertEqual(3, success["latency"]["count"])
+        self.assertEqual(3, success["latency"]["buckets"]["0.05"])
+        self.assertTrue(0.025 <= success["latency"]["p50"] <= 0.05)
+        self.assertIn("p95", success["latency"])
+        self.assertIn("p99", success["latency"])
+        self.assertEqual(1, snapshot["PostDataRequest"]["error"]["calls"])
+
+    def test_threads(self):
+        """Calls recorded on several threads are merged, including threads that have finished"""
+        registry = MetricsRegistry()
+
+        def worker():
+            for _ in range(100):
+                registry.on_request(make_timing(VersionRequest(), 0.01))
+
+        threads = [threading.Thread(target=worker) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(400, registry.snapshot()["VersionRequest"]["success"]["calls"])
+        registry.reset()
+        self.assertEqual({}, registry.snapshot())
+
+    def test_ended_threads(self):
+        """The series of threads that have ended are folded together, so pools that come and go do not accumulate"""
+        registry = MetricsRegistry()
+        for _ in range(10):
+            with concurrent.futures.ThreadPoolExecutor(max_workers=4) as executor:
+                list(executor.map(lambda total: registry.on_request(make_timing(VersionRequest(), total)), [0.01] * 8))
+        registry.on_request(make_timing(VersionRequest(), 0.01))
+        self.assertLessEqual(len(registry._stores), 5)
+        self.assertEqual(81, registry.snapshot()["VersionRequest"]["success"]["calls"])
+        registry.reset()
+        self.assertEqual({}, registry.snapshot())
+
+    def test_prometheus(self):
+        """Metrics can be exported in the Prometheus text format"""
+        registry = MetricsRegistry(buckets=(0.1, 1))
+        registry.on_request(make_timing(VersionRequest(), 0.5))
+        text = registry.to_prometheus()
+        self.assertIn("# TYPE rwslib_requests_total counter", text)
+        self.assertIn('rwslib_requests_total{request="VersionRequest",outcome="success"} 1', text)
+        self.assertIn(
+            'rwslib_request_duration_seconds_bucket{request="VersionRequest",outcome="success",le="0.1"} 0',
+            text,
+        )
+        self.assertIn(
+            'rwslib_request_duration_seconds_bucket{request="VersionRequest",outcome="success",le="+Inf"} 1',
+            text,
+        )
+        self.assertIn(
+            'rwslib_request_phase_seconds_total{request="VersionRequest",outcome="success",phase="ttfb"} 0.25',
+            text,
+        )
+        self.assertIn('rwslib_request_duration_seconds_count{request="VersionRequest",outcome="success"} 1', text)
+        self.assertTrue(text.endswith("\n"))
+
+    @httpretty.activate
+    def test_connection(self):
+        """The registry can observe a connection"""
+        httpretty.register_uri(
+            httpretty.GET, "https://innovate.mdsol.com/RaveWebServices/version", status=200, body="1.0.0"
+        )
+        registry = MetricsRegistry()
+        rave = rwslib.RWSConnection("https://innovate.mdsol.com", observers=[registry])
+        rave.send_request(VersionRequest())
+        rave.send_request(VersionRequest())
+        snapshot = registry.snapshot()
+        self.assertEqual(2, snapshot["VersionRequest"]["success"]["calls"])
+        self.assertEqual(10, snapshot["VersionRequest"]["success"]["content_bytes"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+from lxml import etree
+
+from rwslib.extras.audit_event import parser
+from rwslib.extras.odm_corpus import CorpusConfig, ODMCorpus
+
+ODM_NS = "{http://www.cdisc.org/ns/odm/v1.3}"
+
+CONFIG = CorpusConfig(subjects=12, sites=4, events=2, forms=3, item_groups=2, items=5, query_rate=0.1)
+
+
+def write(method):
+    out = io.BytesIO()
+    written = method(out)
+    return written, out.getvalue()
+
+
+class TestODMCorpus(unittest.TestCase):
+    def setUp(self):
+        self.corpus = ODMCorpus(CONFIG)
+
+    def test_subjects(self):
+        """Subjects are spread over the sites"""
+        subjects = list(self.corpus.subjects())
+        self.assertEqual(12, len(subjects))
+        self.assertEqual("001-000001", subjects[0].name)
+        self.assertEqual("SITE002", subjects[5].site)
+        self.assertEqual(12, len(set(subject.key for subject in subjects)))
+        self.assertEqual(60, self.corpus.values_per_subject)
+
+    def test_clinical_data(self):
+        """Clinical data has every value of every subject"""
+        written, data = write(self.corpus.write_clinical_data)
+        self.assertEqual(len(data), written)
+        doc = etree.fromstring(data)
+        self.assertEqual("Snapshot", doc.get("FileType"))
+        self.assertEqual(12, len(doc.findall(ODM_NS + "ClinicalData")))
+        self.assertEqual(12 * 2 * 3, len(doc.findall(".//" + ODM_NS + "FormData")))
+        self.assertEqual(12 * 2 * 3 * 2, len(doc.findall(".//" + ODM_NS + "ItemGroupData")))
+        self.assertEqual(12 * 60, len(doc.findall(".//" + ODM_NS + "ItemData")))
+        self.assertEqual(12 * 60, len(doc.findall(".//" + ODM_NS + "AuditRecord")))
+
+    def test_metadata(self):
+        """Metadata defines everything in the clinical data"""
+        _, data = write(self.corpus.write_metadata)
+        doc = etree.fromstring(data)
+        self.assertEqual("Metadata", doc.get("Granularity"))
+        self.assertEqual(2, len(doc.findall(".//" + ODM_NS + "StudyEventDef")))
+        self.assertEqual(3, len(doc.findall(".//" + ODM_NS + "FormDef")))
+        self.assertEqual("Yes", doc.find(".//" + ODM_NS + "ItemGroupDef").get("Repeating"))
+        item_oids = set(item.get("OID") for item in doc.findall(".//" + ODM_NS + "ItemDef"))
+        _, clinical = write(self.corpus.write_clinical_data)
+        used = set(item.get("ItemOID") for item in etree.fromstring(clinical).iter(ODM_NS + "ItemData"))
+        self.assertEqual(item_oids, used)
+
+    def test_audit_trail(self):
+        """The audit trail is read by the audit event parser"""
+
+        class Collector(object):
+            def __init__(self):
+                self.events = []
+
+            def default(self, context):
+                self.events.append(context)
+
+        _, data = write(self.corpus.write_audit_trail)
+        collector = Collector()
+        parser.parse(data, collector)
+        queries = sum(
+            1 for subject in self.corpus.subjects() for value in self.corpus.values(subject) if value.query
+        )
+        self.assertGreater(queries, 0)
+        self.assertEqual(12 * (1 + 60) + queries, len(collector.events))
+        first = collector.events[0]
+        self.assertEqual("SubjectCreated", first.subcategory)
+        self.assertEqual("001-000001", first.subject.name)
+        self.assertEqual(
+            ["QueryOpen"] * queries, [e.subcategory for e in collector.events if e.subcategory == "QueryOpen"]
+        )
+        # Audit ids are unique and in order
+        ids = [int(e.audit_record.source_id) for e in collector.events]
+        self.assertEqual(sorted(set(ids)), ids)
+
+    def test_reproducible(self):
+        """The same seed gives the same documents, another seed different ones"""
+        _, data = write(self.corpus.write_clinical_data)
+        self.assertEqual(data, write(ODMCorpus(CONFIG).write_clinical_data)[1])
+        other = CorpusConfig(subjects=12, sites=4, events=2, forms=3, item_groups=2, items=5, seed=1)
+        self.assertNotEqual(data, write(ODMCorpus(other).write_clinical_data)[1])
+
+    def test_write_path(self):
+        """Documents can be written to a path"""
+        tmpdir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmpdir, "audit.xml")
+            written = self.corpus.write_audit_trail(path)
+            self.assertEqual(os.path.getsize(path), written)
+        finally:
+            shutil.rmtree(tmpdir)
+
+
+if __name__ == "__main__":
+    unittest.main()
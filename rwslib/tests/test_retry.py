@@ -0,0 +1,221 @@
+# -*- coding: utf-8 -*-
+
+import email.utils
+import socket
+import threading
+import time
+import unittest
+
+import httpretty
+import requests
+
+import rwslib
+from rwslib.retry import RetryPolicy, is_idempotent, parse_retry_after
+from rwslib.rws_requests import PostDataRequest, VersionRequest
+
+
+def make_response(status, headers=None):
+    response = requests.models.Response()
+    response.status_code = status
+    response.headers = requests.structures.CaseInsensitiveDict(headers or {})
+    return response
+
+
+class TestIdempotency(unittest.TestCase):
+    def test_by_method(self):
+        """GETs are idempotent, POSTs are not"""
+        self.assertTrue(is_idempotent(VersionRequest()))
+        self.assertFalse(is_idempotent(PostDataRequest("<ODM/>")))
+
+    def test_override(self):
+        """Request classes can declare themselves idempotent"""
+
+        class IdempotentPost(PostDataRequest):
+            idempotent = True
+
+        self.assertTrue(is_idempotent(IdempotentPost("<ODM/>")))
+
+
+class TestParseRetryAfter(unittest.TestCase):
+    def test_seconds(self):
+        self.assertEqual(120.0, parse_retry_after("120"))
+
+    def test_date(self):
+        now = time.time()
+        value = email.utils.formatdate(now + 30, usegmt=True)
+        self.assertAlmostEqual(30, parse_retry_after(value, now=now), delta=1)
+
+    def test_past_and_invalid(self):
+        self.assertEqual(0.0, parse_retry_after(email.utils.formatdate(0, usegmt=True)))
+        self.assertIsNone(parse_retry_after("soon"))
+        self.assertIsNone(parse_retry_after(None))
+
+
+class TestRetryPolicy(unittest.TestCase):
+    def test_statuses(self):
+        """Only overload statuses are retried"""
+        policy = RetryPolicy()
+        for status in (429, 502, 503, 504):
+            self.assertTrue(policy.should_retry(VersionRequest(), make_response(status), 0))
+        for status in (200, 400, 404, 500):
+            self.assertFalse(policy.should_retry(VersionRequest(), make_response(status), 0))
+
+    def test_max_retries(self):
+        """Requests are given up on after max_retries"""
+        policy = RetryPolicy(max_retries=2)
+        self.assertTrue(policy.should_retry(VersionRequest(), make_response(503), 1))
+        self.assertFalse(policy.should_retry(VersionRequest(), make_response(503), 2))
+        self.assertEqual(1, policy.stats()["gave_up"])
+
+    def test_non_idempotent(self):
+        """POSTs are only retried when the server refused them outright"""
+        policy = RetryPolicy()
+        post = PostDataRequest("<ODM/>")
+        self.assertFalse(policy.should_retry(post, make_response(503), 0))
+        self.assertTrue(policy.should_retry(post, make_response(429), 0))
+        self.assertEqual(1, policy.stats()["refused_non_idempotent"])
+
+    def test_backoff(self):
+        """Backoff doubles up to the maximum"""
+        policy = RetryPolicy(backoff_factor=1, max_backoff=5, jitter=False)
+        self.assertEqual([1, 2, 4, 5], [policy.backoff(n) for n in range(4)])
+
+    def test_jitter(self):
+        """Jittered backoff is between zero and the backoff"""
+        policy = RetryPolicy(backoff_factor=1)
+        for _ in range(50):
+            self.assertTrue(0 <= policy.backoff(2) <= 4)
+
+    def test_retry_after(self):
+        """Retry-After is respected, within max_backoff"""
+        policy = RetryPolicy(backoff_factor=1, max_backoff=30, jitter=False)
+        self.assertEqual(10, policy.backoff(0, make_response(503, {"Retry-After": "10"})))
+        self.assertEqual(30, policy.backoff(0, make_response(503, {"Retry-After": "3600"})))
+        policy.respect_retry_after = False
+        self.assertEqual(1, policy.backoff(0, make_response(503, {"Retry-After": "10"})))
+
+    def test_wait(self):
+        """Waits are counted and made with the sleep function"""
+        waits = []
+        policy = RetryPolicy(backoff_factor=1, jitter=False, sleep=waits.append)
+        policy.wait(0, make_response(503))
+        policy.wait(1, make_response(429))
+        self.assertEqual([1, 2], waits)
+        stats = policy.stats()
+        self.assertEqual(2, stats["retries"])
+        self.assertEqual({503: 1, 429: 1}, stats["retries_by_status"])
+        self.assertEqual(3, stats["time_waited"])
+
+
+class TestConnectionRetries(unittest.TestCase):
+    URL = "https://innovate.mdsol.com/RaveWebServices/version"
+    POST_URL = "https://innovate.mdsol.com/RaveWebServices/webservice.aspx?PostODMClinicalData"
+
+    def setUp(self):
+        httpretty.enable()
+        self.waits = []
+        self.policy = RetryPolicy(sleep=self.waits.append)
+        self.rave = rwslib.RWSConnection(
+            "https://innovate.mdsol.com", "user", "pass", retry_policy=self.policy
+        )
+
+    def tearDown(self):
+        httpretty.disable()
+        httpretty.reset()
+
+    def test_recovers(self):
+        """Transient overload is retried until the request succeeds"""
+        httpretty.register_uri(
+            httpretty.GET,
+            self.URL,
+            responses=[
+                httpretty.Response(body="HTTP 503 Service Temporarily Unavailable", status=503),
+                httpretty.Response(body="Slow down", status=429, adding_headers={"Retry-After": "2"}),
+                httpretty.Response(body="1.0.0", status=200),
+            ],
+        )
+        call = self.rave.execute(VersionRequest())
+        self.assertEqual("1.0.0", call.result)
+        self.assertEqual(2, call.retries)
+        self.assertEqual(2, len(self.waits))
+        self.assertEqual(2, self.waits[1])
+        self.assertEqual({503: 1, 429: 1}, self.policy.stats()["retries_by_status"])
+
+    def test_gives_up(self):
+        """The last error is raised once retries are exhausted"""
+        httpretty.register_uri(
+            httpretty.GET, self.URL, status=503, body="HTTP 503 Service Temporarily Unavailable"
+        )
+        with self.assertRaises(rwslib.RWSException) as exc:
+            self.rave.send_request(VersionRequest())
+        self.assertEqual("Unexpected Status Code (503)", str(exc.exception))
+        self.assertEqual(4, len(httpretty.latest_requests()))
+        self.assertEqual(1, self.policy.stats()["gave_up"])
+
+    def test_post_not_replayed(self):
+        """POSTs are not retried when they may have been processed"""
+        posts = []
+
+        def respond(request, uri, headers):
+            posts.append(request.body)
+            return [503, headers, "HTTP 503 Service Temporarily Unavailable"]
+
+        httpretty.register_uri(httpretty.POST, self.POST_URL, body=respond)
+        with self.assertRaises(rwslib.RWSException):
+            self.rave.send_request(PostDataRequest("<ODM/>"))
+        self.assertEqual([b"<ODM/>"], posts)
+        self.assertEqual([], self.waits)
+
+
+class TestReadRetries(unittest.TestCase):
+    """Connections dropped before the response are retried with or without a retry policy"""
+
+    def setUp(self):
+        self.server = socket.socket()
+        self.server.bind(("127.0.0.1", 0))
+        self.server.listen(5)
+        self.url = "http://127.0.0.1:%d" % self.server.getsockname()[1]
+        self.requests = 0
+
+    def tearDown(self):
+        self.server.close()
+
+    def serve(self):
+        """Drop the first connection after reading the request, answer the next"""
+        for response in (None, b"HTTP/1.1 200 OK\r\nContent-Length: 5\r\nConnection: close\r\n\r\n1.0.0"):
+            conn, _ = self.server.accept()
+            with conn:
+                conn.recv(65536)
+                self.requests += 1
+                if response is not None:
+                    conn.sendall(response)
+
+    def get_version(self, retry_policy):
+        thread = threading.Thread(target=self.serve)
+        thread.daemon = True
+        thread.start()
+        rave = rwslib.RWSConnection(self.url, retry_policy=retry_policy)
+        version = rave.send_request(VersionRequest())
+        thread.join(5)
+        rave.close()
+        return version
+
+    def test_read_retried(self):
+        self.assertEqual("1.0.0", self.get_version(None))
+        self.assertEqual(2, self.requests)
+
+    def test_read_retried_with_policy(self):
+        self.assertEqual("1.0.0", self.get_version(RetryPolicy(sleep=lambda seconds: None)))
+        self.assertEqual(2, self.requests)
+
+    def test_adapter_retries(self):
+        """A retry policy only takes over status retries from the adapter"""
+        plain = rwslib.RWSConnection(self.url)._get_session(3).get_adapter(self.url).max_retries
+        policy = rwslib.RWSConnection(self.url, retry_policy=RetryPolicy())
+        retries = policy._get_session(3).get_adapter(self.url).max_retries
+        self.assertEqual((plain.total, plain.connect, plain.read), (retries.total, retries.connect, retries.read))
+        self.assertFalse(retries.respect_retry_after_header)
+
+
+if __name__ == "__main__":
+    unittest.main()
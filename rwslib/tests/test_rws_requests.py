@@ -1,5 +1,6 @@
 # -*- coding: utf-8 -*-
 import datetime
+import io
 
 from httpretty import httpretty
 
@@ -52,6 +53,22 @@ class TestRWSRequest(unittest.TestCase):
         request2 = TestRWSRequest.FooRWSRequest('project2')
         self.assertNotEqual(request1, request2)
 
+    def test_result_class(self):
+        """Results are parsed into the result_class of the request, keeping its tree if asked"""
+        class ReferenceRequest(RWSRequest):
+            result_class = RWSResponse
+            retain_tree = False
+
+        response = requests.models.Response()
+        response._content = b'<Response ReferenceNumber="1"/>'
+        result = ReferenceRequest().result(response)
+        self.assertIsInstance(result, RWSResponse)
+        self.assertEqual("1", result.referencenumber)
+        self.assertIsNone(result._root)
+        stream = io.BytesIO(b'<Response ReferenceNumber="2"/>')
+        self.assertEqual("2", ReferenceRequest().stream_result(stream).referencenumber)
+        self.assertIs(stream, RWSRequest().stream_result(stream))
+
 
 class TestStudySubjectsRequest(unittest.TestCase):
     def setUp(self):
@@ -132,7 +149,7 @@ class TestStudySubjectsRequest(unittest.TestCase):
 """
         request = StudySubjectsRequest("Fixitol",
                                        "Dev")
-        req = mock.Mock(requests.Request, text=response_content)
+        req = mock.Mock(requests.Request, text=response_content, content=response_content.encode("utf-8"))
         response = request.result(req)
         self.assertTrue(isinstance(response, RWSSubjects))
         for subject in response:
@@ -394,7 +411,7 @@ class TestPostDataRequest(unittest.TestCase):
               SubjectNumberInStudy="1103" SubjectNumberInStudySite="55">
         </Response>"""
         t = PostDataRequest("""some data""")
-        req = mock.Mock(requests.Request, text=response_content)
+        req = mock.Mock(requests.Request, text=response_content, content=response_content.encode("utf-8"))
         response = t.result(req)
         self.assertTrue(isinstance(response, RWSPostResponse))
         self.assertTrue(55, response.subjects_in_study_site)
@@ -415,7 +432,7 @@ class TestPostMetadataRequest(unittest.TestCase):
         self.assertEqual('metadata/studies/Fixitol(Dev)/drafts', t.url_path())
         self.assertEqual({'Content-type': 'text/xml'}, t.args().get('headers'))
         self.assertEqual('Some Data', t.args().get('data'))
-        req = mock.Mock(requests.Request, text=response_content)
+        req = mock.Mock(requests.Request, text=response_content, content=response_content.encode("utf-8"))
         response = t.result(req)
         self.assertTrue(isinstance(response, RWSPostResponse))
         self.assertTrue(55, response.subjects_in_study_site)
@@ -466,7 +483,7 @@ class TestGlobalLibraryVersionsRequest(unittest.TestCase):
         t = self.create_request_object()
         self.assertEqual("Fixitol(Dev)", t.project_name)
         self.assertEqual('metadata/libraries/Fixitol(Dev)/versions', t.url_path())
-        req = mock.Mock(requests.Request, text=response_content)
+        req = mock.Mock(requests.Request, text=response_content, content=response_content.encode("utf-8"))
         response = t.result(req)
         self.assertTrue(isinstance(response, RWSStudyMetadataVersions))
         for mdv in response:
@@ -501,7 +518,7 @@ class TestGlobalLibraryDraftsRequest(unittest.TestCase):
         t = self.create_request_object()
         self.assertEqual("Fixitol(Dev)", t.project_name)
         self.assertEqual('metadata/libraries/Fixitol(Dev)/drafts', t.url_path())
-        req = mock.Mock(requests.Request, text=response_content)
+        req = mock.Mock(requests.Request, text=response_content, content=response_content.encode("utf-8"))
         response = t.result(req)
         self.assertTrue(isinstance(response, RWSStudyMetadataVersions))
         for mdv in response:
@@ -545,7 +562,7 @@ class TestGlobalLibrariesRequest(unittest.TestCase):
         """
         t = self.create_request_object()
         self.assertEqual('metadata/libraries', t.url_path())
-        req = mock.Mock(requests.Request, text=response_content)
+        req = mock.Mock(requests.Request, text=response_content, content=response_content.encode("utf-8"))
         response = t.result(req)
         self.assertTrue(isinstance(response, RWSStudies))
         for study in response:
@@ -590,7 +607,7 @@ class TestStudyVersionRequest(unittest.TestCase):
     </ODM>
         """
         t = self.create_request_object()
-        req = mock.Mock(requests.Request, text=response_content)
+        req = mock.Mock(requests.Request, text=response_content, content=response_content.encode("utf-8"))
         response = t.result(req)
         self.assertEqual(response_content, response)
 
@@ -622,7 +639,7 @@ class TestStudyVersionsRequest(unittest.TestCase):
         t = self.create_request_object()
         self.assertEqual("Fixitol(Dev)", t.project_name)
         self.assertEqual('metadata/studies/Fixitol(Dev)/versions', t.url_path())
-        req = mock.Mock(requests.Request, text=response_content)
+        req = mock.Mock(requests.Request, text=response_content, content=response_content.encode("utf-8"))
         response = t.result(req)
         self.assertTrue(isinstance(response, RWSStudyMetadataVersions))
         for mdv in response:
@@ -657,7 +674,7 @@ class TestStudyDraftsRequest(unittest.TestCase):
         t = self.create_request_object()
         self.assertEqual("Fixitol(Dev)", t.project_name)
         self.assertEqual('metadata/studies/Fixitol(Dev)/drafts', t.url_path())
-        req = mock.Mock(requests.Request, text=response_content)
+        req = mock.Mock(requests.Request, text=response_content, content=response_content.encode("utf-8"))
         response = t.result(req)
         self.assertTrue(isinstance(response, RWSStudyMetadataVersions))
         for mdv in response:
@@ -701,7 +718,7 @@ class TestMetadataStudiesRequest(unittest.TestCase):
         """
         t = self.create_request_object()
         self.assertEqual('metadata/studies', t.url_path())
-        req = mock.Mock(requests.Request, text=response_content)
+        req = mock.Mock(requests.Request, text=response_content, content=response_content.encode("utf-8"))
         response = t.result(req)
         self.assertTrue(isinstance(response, RWSStudies))
         for study in response:
@@ -741,7 +758,7 @@ xmlns:mdsol="http://www.mdsol.com/ns/odm/metadata" xmlns="http://www.cdisc.org/n
    </GlobalVariables>
  </Study>
 </ODM>"""
-        req = mock.Mock(requests.Request, text=response_content)
+        req = mock.Mock(requests.Request, text=response_content, content=response_content.encode("utf-8"))
         response = t.result(req)
         self.assertTrue(isinstance(response, RWSStudies))
         for study in response:
@@ -767,7 +784,7 @@ class TestCacheFlushRequest(unittest.TestCase):
         SuccessStatistics="Rave objects touched: Subjects=0; Folders=0; Forms=0; Fields=0; LogLines=0" NewRecords="">
     </Response>
     """
-        req = mock.Mock(requests.Request, text=response_content)
+        req = mock.Mock(requests.Request, text=response_content, content=response_content.encode("utf-8"))
         response = t.result(req)
         self.assertTrue(isinstance(response, RWSResponse))
 
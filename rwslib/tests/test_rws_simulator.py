@@ -0,0 +1,320 @@
+# -*- coding: utf-8 -*-
+
+import gzip
+import sqlite3
+import time
+import unittest
+
+import rwslib
+from rwslib.extras.audit_event.main import ODMAdapter
+from rwslib.extras.local_cv import LocalCVBuilder, SQLLiteDBAdapter
+from rwslib.extras.rws_simulator import RWSSimulator, SimulatorConfig, iter_gzip
+from rwslib.retry import RetryPolicy
+from rwslib.rwsobjects import RWSSubjectsStream
+from rwslib.rws_requests import (
+    ClinicalStudiesRequest,
+    PostDataRequest,
+    StudyDatasetRequest,
+    StudySubjectsRequest,
+    StudyVersionsRequest,
+    SubjectDatasetRequest,
+    VersionRequest,
+)
+from rwslib.rws_requests.biostats_gateway import FormDataRequest
+from rwslib.rws_requests.odm_adapter import AuditRecordPages, AuditRecordsRequest
+
+
+class TestIterGzip(unittest.TestCase):
+    def test_iter_gzip(self):
+        """Chunks are compressed incrementally"""
+        chunks = list(iter_gzip(["<ODM>", b"<ClinicalData/>" * 100, "</ODM>"]))
+        self.assertEqual(
+            b"<ODM>" + b"<ClinicalData/>" * 100 + b"</ODM>", gzip.decompress(b"".join(chunks))
+        )
+
+
+class SimulatorTestCase(unittest.TestCase):
+    config = SimulatorConfig(subjects=20, audit_records=45)
+
+    def setUp(self):
+        self.simulator = RWSSimulator(self.config).start()
+        self.rave = rwslib.RWSConnection(self.simulator.url, "user", "pass")
+
+    def tearDown(self):
+        self.rave.close()
+        self.simulator.stop()
+
+
+class TestSimulatedRequests(SimulatorTestCase):
+    def test_version(self):
+        self.assertEqual("1.15.0", self.rave.send_request(VersionRequest()))
+
+    def test_studies(self):
+        """Configured studies are listed"""
+        studies = self.rave.send_request(ClinicalStudiesRequest())
+        self.assertEqual(["Mediflex(Prod)", "Mediflex(Dev)"], [study.oid for study in studies])
+        versions = self.rave.send_request(StudyVersionsRequest("Mediflex"))
+        self.assertEqual("1", versions[0].oid)
+
+    def test_subjects(self):
+        """Subjects are listed with status and UUIDs when asked for"""
+        subjects = self.rave.send_request(
+            StudySubjectsRequest("Mediflex", "Prod", status=True, subject_key_type="SubjectUUID")
+        )
+        self.assertEqual(20, len(subjects))
+        self.assertEqual("01-0001", subjects[0].subject_name)
+        self.assertEqual("SITE02", subjects[1].locationoid)
+        self.assertIn(subjects[0].incomplete, (True, False))
+        plain = self.rave.send_request(StudySubjectsRequest("Mediflex", "Prod"))
+        self.assertEqual("01-0001", plain[0].subjectkey)
+        self.assertIsNone(plain[0].incomplete)
+
+    def test_lazy_subjects(self):
+        """Subjects can be read straight from the connection as they are iterated over"""
+        subjects = self.rave.send_request(
+            StudySubjectsRequest("Mediflex", "Prod", status=True, lazy=True), stream=True
+        )
+        self.assertIsInstance(subjects, RWSSubjectsStream)
+        self.assertFalse(subjects.source.closed)
+        self.assertEqual("Snapshot", subjects.filetype)
+        names = [subject.subject_name for subject in subjects]
+        self.assertEqual(20, len(names))
+        self.assertEqual("01-0001", names[0])
+        # The connection is released once the subjects have been read
+        self.assertTrue(subjects.source.closed)
+        lazy = self.rave.send_request(StudySubjectsRequest("Mediflex", "Prod", lazy=True))
+        self.assertEqual(20, len(lazy.materialise()))
+
+    def test_release_tree(self):
+        """Requests can have their results release their trees"""
+        request = StudySubjectsRequest("Mediflex", "Prod")
+        request.retain_tree = False
+        subjects = self.rave.send_request(request)
+        self.assertEqual(20, len(subjects))
+        self.assertIsNone(subjects._root)
+        self.assertEqual(20, len(subjects.root))
+
+    def test_datasets(self):
+        """Datasets are served for a study or a subject, for all forms or one"""
+        dataset = self.rave.send_request(StudyDatasetRequest("Mediflex", "Prod"))
+        self.assertEqual(20, dataset.count("<SubjectData "))
+        self.assertEqual(60, dataset.count("<FormData "))
+        form = self.rave.send_request(StudyDatasetRequest("Mediflex", "Prod", formoid="VS"))
+        self.assertEqual(20, form.count('<FormData FormOID="VS"'))
+        self.assertNotIn('FormOID="DM"', form)
+        subject = self.rave.send_request(SubjectDatasetRequest("Mediflex", "Prod", "03-0003", formoid="VS"))
+        self.assertEqual(1, subject.count("<SubjectData "))
+        # A form's values are the same whichever way it is asked for
+        self.assertIn(subject.split("<FormData ")[1].split("</FormData>")[0], form)
+
+    def test_reproducible(self):
+        """The same seed gives the same data, another seed different data"""
+        dataset = self.rave.send_request(StudyDatasetRequest("Mediflex", "Prod"))
+        with RWSSimulator(SimulatorConfig(subjects=20, audit_records=45)) as other:
+            rave = rwslib.RWSConnection(other.url, "user", "pass")
+            self.assertEqual(dataset, rave.send_request(StudyDatasetRequest("Mediflex", "Prod")))
+        with RWSSimulator(SimulatorConfig(subjects=20, seed=1)) as other:
+            rave = rwslib.RWSConnection(other.url, "user", "pass")
+            self.assertNotEqual(dataset, rave.send_request(StudyDatasetRequest("Mediflex", "Prod")))
+
+    def test_errors(self):
+        """Unknown studies and resources are RWS errors"""
+        with self.assertRaises(rwslib.RWSException) as exc:
+            self.rave.send_request(StudySubjectsRequest("Fixitol", "Prod"))
+        self.assertEqual("Study Fixitol(Prod) not found", str(exc.exception))
+        with self.assertRaises(rwslib.RWSException):
+            self.rave.send_request(FormDataRequest("Mediflex", "Prod", "regular", "LB"))
+
+    def test_authorization(self):
+        """Authorized requests need credentials"""
+        rave = rwslib.RWSConnection(self.simulator.url)
+        self.assertEqual("1.15.0", rave.send_request(VersionRequest()))
+        with self.assertRaises(rwslib.AuthorizationException):
+            rave.send_request(ClinicalStudiesRequest())
+
+    def test_post(self):
+        """Posts are counted and kept, decompressed"""
+        odm = "<ODM><ClinicalData><SubjectData/></ClinicalData><ClinicalData><SubjectData/></ClinicalData></ODM>"
+        result = self.rave.send_request(PostDataRequest(odm, compress=True))
+        self.assertEqual(2, result.subjects_touched)
+        self.assertEqual([odm.encode("utf-8")], self.simulator.posts)
+        self.assertEqual(1, self.simulator.requests["post_clinical_data"])
+
+    def test_post_chunked(self):
+        """Bodies posted from a generator are sent chunked and read whole"""
+        parts = ["<ODM>", "<ClinicalData><SubjectData/></ClinicalData>" * 3, "</ODM>"]
+        result = self.rave.send_request(PostDataRequest(part.encode("utf-8") for part in parts))
+        self.assertEqual(3, result.subjects_touched)
+        self.assertEqual(["".join(parts).encode("utf-8")], self.simulator.posts)
+
+
+class TestSimulatedAuditRecords(SimulatorTestCase):
+    def test_pages(self):
+        """Audit records are paged with Link headers"""
+        call = self.rave.execute(AuditRecordsRequest("Mediflex", "Prod", startid=1, per_page=20))
+        self.assertEqual(20, call.result.count("<AuditRecord>"))
+        self.assertIn("startid=21", call.response.links["next"]["url"])
+        last = self.rave.execute(AuditRecordsRequest("Mediflex", "Prod", startid=41, per_page=20))
+        self.assertEqual(5, last.result.count("<AuditRecord>"))
+        self.assertNotIn("next", last.response.links)
+
+    def test_odm_adapter(self):
+        """The ODM adapter follows the pages to the end"""
+
+        class Counter(object):
+            def __init__(self):
+                self.subcategories = []
+
+            def default(self, context):
+                self.subcategories.append(context.subcategory)
+
+        counter = Counter()
+        ODMAdapter(self.rave, "Mediflex", "Prod", counter).run(per_page=10)
+        self.assertEqual(45, len(counter.subcategories))
+        self.assertEqual(["SubjectCreated"] * 20, counter.subcategories[:20])
+        self.assertEqual(5, self.simulator.requests["get_audit_records"])
+
+    def test_paginator(self):
+        """All the pages are fetched with the page size and mode asked for"""
+        for prefetch in (0, 1, 3):
+            pages = AuditRecordPages(self.rave, "Mediflex", "Prod", per_page=10, mode="all", prefetch=prefetch)
+            calls = list(pages.calls())
+            self.assertEqual([10, 10, 10, 10, 5], [call.result.count("<AuditRecord>") for call in calls])
+            for call in calls:
+                self.assertIn("per_page=10", call.url)
+                self.assertIn("mode=all", call.url)
+            self.assertEqual(5, pages.pages)
+            self.assertIsNone(pages.startid)
+            with self.assertRaises(ValueError):
+                pages.calls()
+
+    def test_records(self):
+        records = list(AuditRecordPages(self.rave, "Mediflex", "Prod", per_page=20).records())
+        self.assertEqual(45, len(records))
+        self.assertEqual("45", records[-1].findtext(".//{http://www.cdisc.org/ns/odm/v1.3}SourceID"))
+
+    def test_prefetch(self):
+        """Pages are fetched ahead of the one being handled, no further than the look-ahead allows"""
+        with AuditRecordPages(self.rave, "Mediflex", "Prod", per_page=5, prefetch=2) as pages:
+            iterator = iter(pages)
+            next(iterator)
+            time.sleep(0.2)
+            # The page handed out, those queued and one waiting to be queued
+            self.assertEqual(4, self.simulator.requests["get_audit_records"])
+        self.assertEqual(6, pages.startid)
+
+    def test_resume(self):
+        """A paginator closed early, or stopped at max_pages, can be carried on from its startid"""
+        pages = AuditRecordPages(self.rave, "Mediflex", "Prod", per_page=10, max_pages=2)
+        self.assertEqual(2, len(list(pages)))
+        self.assertEqual(21, pages.startid)
+        rest = AuditRecordPages(self.rave, "Mediflex", "Prod", startid=pages.startid, per_page=10)
+        self.assertEqual(3, len(list(rest)))
+
+    def test_close_in_flight(self):
+        """Closing does not wait long for a page being fetched in the background"""
+        with RWSSimulator(SimulatorConfig(subjects=20, latency=0.5)) as simulator:
+            rave = rwslib.RWSConnection(simulator.url, "user", "pass")
+            pages = AuditRecordPages(rave, "Mediflex", "Prod", per_page=5)
+            iterator = iter(pages)
+            next(iterator)
+            started = time.time()
+            pages.close(timeout=0.05)
+            self.assertLess(time.time() - started, 0.3)
+            self.assertEqual(6, pages.startid)
+            rave.close()
+
+    def test_adapter(self):
+        """ODMAdapter reads the next start id from the last page it parsed"""
+        contexts = []
+
+        class Eventer(object):
+            def default(self, context):
+                contexts.append(context)
+
+        adapter = ODMAdapter(self.rave, "Mediflex", "Prod", Eventer())
+        adapter.run(start_id=1, max_pages=2, per_page=10)
+        self.assertEqual(20, len(contexts))
+        self.assertEqual(21, adapter.start_id)
+        # The pages were fetched on another thread, this thread's last_result is not theirs
+        self.rave.send_request(VersionRequest())
+        self.assertEqual(21, adapter.get_next_start_id())
+        self.assertEqual(21, adapter.get_next_start_id(adapter.last_call.response))
+
+    def test_paginator_error(self):
+        """Errors fetching a page are raised to the caller"""
+        with self.assertRaises(rwslib.RWSException):
+            list(AuditRecordPages(self.rave, "Unknown", "Prod"))
+        with self.assertRaises(ValueError):
+            AuditRecordPages(self.rave, "Mediflex", "Prod", mode="partial")
+
+
+class TestSimulatedClinicalViews(SimulatorTestCase):
+    def test_form_data(self):
+        """Form data is served as CSV ending with EOF"""
+        data = self.rave.send_request(FormDataRequest("Mediflex", "Prod", "regular", "DM"))
+        lines = data.split("\n")
+        self.assertEqual("subjectId,Subject,siteid,SiteNumber,RecordPosition", lines[0][:50])
+        self.assertEqual(22, len(lines))
+        self.assertEqual("EOF", lines[-1])
+
+    def test_local_cv(self):
+        """Clinical views can be pulled into a local database"""
+        db = sqlite3.connect(":memory:")
+        LocalCVBuilder(self.rave, "Mediflex", "Prod", SQLLiteDBAdapter(db)).execute()
+        self.assertEqual(20, db.execute("select count(*) from V_Mediflex_VS").fetchone()[0])
+        self.assertEqual(20, db.execute("select count(*) from V_Mediflex_AE_RAW").fetchone()[0])
+
+
+class TestSimulatedConditions(unittest.TestCase):
+    def test_latency(self):
+        with RWSSimulator(SimulatorConfig(latency=0.05)) as simulator:
+            rave = rwslib.RWSConnection(simulator.url)
+            rave.send_request(VersionRequest())
+        self.assertGreaterEqual(rave.request_time, 0.05)
+
+    def test_injected_errors(self):
+        """Errors are injected at the configured rate and recovered from by a retry policy"""
+        config = SimulatorConfig(error_rate=0.5, retry_after=0, seed=3)
+        with RWSSimulator(config) as simulator:
+            rave = rwslib.RWSConnection(
+                simulator.url, retry_policy=RetryPolicy(max_retries=20, backoff_factor=0)
+            )
+            for _ in range(10):
+                self.assertEqual("1.15.0", rave.send_request(VersionRequest()))
+        self.assertGreater(simulator.errors_injected, 0)
+        self.assertEqual(10 + simulator.errors_injected, simulator.requests["get_version"])
+
+    def test_all_errors(self):
+        with RWSSimulator(SimulatorConfig(error_rate=1.0, error_statuses=(502,))) as simulator:
+            rave = rwslib.RWSConnection(simulator.url)
+            with self.assertRaises(rwslib.RWSException):
+                rave.send_request(VersionRequest())
+            self.assertEqual(502, rave.last_result.status_code)
+
+    def test_streaming(self):
+        """Large datasets are sent compressed and in chunks, and can be streamed"""
+        with RWSSimulator(SimulatorConfig(subjects=500, fields=20, records=3)) as simulator:
+            rave = rwslib.RWSConnection(simulator.url, "user", "pass")
+            stream = rave.send_request(StudyDatasetRequest("Mediflex", "Prod"), stream=True)
+            with stream:
+                self.assertEqual("gzip", stream.content_encoding)
+                self.assertEqual("chunked", stream.response.headers["Transfer-Encoding"])
+                body = b"".join(stream.iter_chunks(65536))
+                self.assertLess(stream.bytes_received, len(body) / 2)
+        self.assertEqual(500, body.count(b"<SubjectData "))
+        self.assertTrue(body.endswith(b"</ODM>"))
+
+    def test_bandwidth(self):
+        """Bodies are sent no faster than the configured rate"""
+        config = SimulatorConfig(subjects=10, compress=False, bytes_per_second=100000)
+        with RWSSimulator(config) as simulator:
+            rave = rwslib.RWSConnection(simulator.url, "user", "pass")
+            start = time.time()
+            dataset = rave.send_request(StudyDatasetRequest("Mediflex", "Prod"))
+            elapsed = time.time() - start
+        self.assertGreaterEqual(elapsed, len(dataset) / 100000.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
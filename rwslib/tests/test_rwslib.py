@@ -1,4 +1,10 @@
+import hashlib
+import io
 import os
+import shutil
+import tempfile
+import threading
+import time
 import unittest
 
 import httpretty
@@ -118,6 +124,429 @@ class TestRequestTime(unittest.TestCase):
         self.assertIs(type(request_time), float)
 
 
+class TestConnectionPooling(unittest.TestCase):
+    """Test that the HTTP session is kept for the life of the connection"""
+
+    @httpretty.activate
+    def test_session_is_reused(self):
+        """Consecutive requests share a session"""
+        httpretty.register_uri(
+            httpretty.GET,
+            "https://innovate.mdsol.com/RaveWebServices/version",
+            status=200,
+            body="1.0.0",
+        )
+
+        rave = rwslib.RWSConnection("https://innovate.mdsol.com")
+        rave.send_request(rwslib.rws_requests.VersionRequest())
+        session = rave._get_session(1)
+        rave.send_request(rwslib.rws_requests.VersionRequest())
+        self.assertIs(session, rave._get_session(1))
+        self.assertEqual(1, len(rave._sessions))
+
+    @httpretty.activate
+    def test_retries_keep_existing_pool(self):
+        """A call with different retries does not discard the existing session"""
+        httpretty.register_uri(
+            httpretty.GET,
+            "https://innovate.mdsol.com/RaveWebServices/version",
+            status=200,
+            body="1.0.0",
+        )
+
+        rave = rwslib.RWSConnection("https://innovate.mdsol.com")
+        rave.send_request(rwslib.rws_requests.VersionRequest())
+        session = rave._get_session(1)
+        rave.send_request(rwslib.rws_requests.VersionRequest(), retries=3)
+        self.assertIs(session, rave._get_session(1))
+        adapter = rave._get_session(3).get_adapter("https://innovate.mdsol.com")
+        self.assertEqual(3, adapter.max_retries.total)
+
+    def test_pool_size(self):
+        """Pool sizes are passed to the mounted adapters"""
+        rave = rwslib.RWSConnection(
+            "https://innovate.mdsol.com", pool_connections=4, pool_maxsize=20
+        )
+        adapter = rave._get_session(1).get_adapter("https://innovate.mdsol.com")
+        self.assertEqual(4, adapter._pool_connections)
+        self.assertEqual(20, adapter._pool_maxsize)
+
+    def test_close_and_context_manager(self):
+        """Closing the connection releases the sessions"""
+        with rwslib.RWSConnection("https://innovate.mdsol.com") as rave:
+            rave._get_session(1)
+            self.assertEqual(1, len(rave._sessions))
+        self.assertEqual({}, rave._sessions)
+
+        rave = rwslib.RWSConnection("https://innovate.mdsol.com")
+        session = rave._get_session(1)
+        with mock.patch.object(session, "close") as mock_close:
+            rave.close()
+            mock_close.assert_called_once_with()
+        self.assertEqual({}, rave._sessions)
+
+
+class TestExecute(unittest.TestCase):
+    """Test the per-call result envelope"""
+
+    @httpretty.activate
+    def test_execute(self):
+        """execute returns the result along with the response details"""
+        httpretty.register_uri(
+            httpretty.GET,
+            "https://innovate.mdsol.com/RaveWebServices/version",
+            status=200,
+            body="1.0.0",
+            adding_headers={
+                "Link": '<https://innovate.mdsol.com/RaveWebServices/version?page=2>; rel="next"'
+            },
+        )
+
+        rave = rwslib.RWSConnection("https://innovate.mdsol.com")
+        req = rwslib.rws_requests.VersionRequest()
+        call = rave.execute(req)
+        self.assertIsInstance(call, rwslib.RWSCall)
+        self.assertEqual("1.0.0", call.result)
+        self.assertEqual(200, call.status_code)
+        self.assertIs(req, call.request)
+        self.assertEqual("https://innovate.mdsol.com/RaveWebServices/version", call.url)
+        self.assertIs(type(call.request_time), float)
+        self.assertEqual(
+            "https://innovate.mdsol.com/RaveWebServices/version?page=2",
+            call.links["next"]["url"],
+        )
+        # Legacy attributes are still maintained
+        self.assertIs(call.response, rave.last_result)
+        self.assertEqual(call.request_time, rave.request_time)
+
+    def test_unsent_call(self):
+        """A call without a response has no status or links"""
+        call = rwslib.RWSCall(rwslib.rws_requests.VersionRequest(), "http://localhost")
+        self.assertIsNone(call.status_code)
+        self.assertEqual({}, call.links)
+
+    def test_last_result_is_per_thread(self):
+        """last_result and request_time are not shared between threads"""
+        rave = rwslib.RWSConnection("https://innovate.mdsol.com")
+        rave.last_result = "main"
+        rave.request_time = 1.0
+        seen = []
+
+        def worker():
+            seen.append((rave.last_result, rave.request_time))
+            rave.last_result = "worker"
+
+        t = threading.Thread(target=worker)
+        t.start()
+        t.join()
+        self.assertEqual([(None, None)], seen)
+        self.assertEqual("main", rave.last_result)
+        self.assertEqual(1.0, rave.request_time)
+
+
+class TestSendRequests(unittest.TestCase):
+    """Test sending a batch of requests concurrently"""
+
+    def setUp(self):
+        httpretty.enable()
+        for name in ["version", "codename", "build"]:
+            httpretty.register_uri(
+                httpretty.GET,
+                "https://innovate.mdsol.com/RaveWebServices/version/%s" % name,
+                status=200,
+                body=name,
+            )
+        httpretty.register_uri(
+            httpretty.GET,
+            "https://innovate.mdsol.com/RaveWebServices/version",
+            status=503,
+            body="HTTP 503 Service Temporarily Unavailable",
+        )
+
+    def tearDown(self):
+        httpretty.disable()
+        httpretty.reset()
+
+    def make_requests(self):
+        class NamedVersionRequest(rwslib.rws_requests.RWSGetRequest):
+            def __init__(self, name):
+                self.name = name
+
+            def url_path(self):
+                return self.make_url("version", self.name)
+
+        return [
+            NamedVersionRequest("build"),
+            rwslib.rws_requests.VersionRequest(),
+            NamedVersionRequest("codename"),
+            NamedVersionRequest("version"),
+        ]
+
+    def test_ordered(self):
+        """Results come back in the order requested, exceptions are captured"""
+        rave = rwslib.RWSConnection("https://innovate.mdsol.com")
+        calls = list(rave.send_requests(self.make_requests(), max_workers=3))
+        self.assertEqual(["build", None, "codename", "version"], [c.result for c in calls])
+        self.assertEqual([200, 503, 200, 200], [c.status_code for c in calls])
+        self.assertIsNone(calls[0].exception)
+        self.assertIsInstance(calls[1].exception, rwslib.RWSException)
+        self.assertEqual("Unexpected Status Code (503)", str(calls[1].exception))
+
+    def test_unordered(self):
+        """All results are yielded when returned as completed"""
+        rave = rwslib.RWSConnection("https://innovate.mdsol.com")
+        calls = list(rave.send_requests(self.make_requests(), max_workers=2, ordered=False))
+        self.assertEqual(
+            ["build", "codename", "version"],
+            sorted(c.result for c in calls if c.exception is None),
+        )
+        self.assertEqual(4, len(calls))
+
+    def test_invalid_request_is_captured(self):
+        """A bad request object does not stop the batch"""
+        rave = rwslib.RWSConnection("https://innovate.mdsol.com")
+        calls = list(rave.send_requests([object()] + self.make_requests()[:1]))
+        self.assertIsInstance(calls[0].exception, ValueError)
+        self.assertEqual("build", calls[1].result)
+
+
+class TestSingleFlight(unittest.TestCase):
+    """Test sharing identical concurrent GET requests"""
+
+    URL = "https://innovate.mdsol.com/RaveWebServices/version"
+    WORKERS = 5
+
+    def setUp(self):
+        self.rave = rwslib.RWSConnection("https://innovate.mdsol.com", single_flight=True)
+        self.status = 200
+        httpretty.enable()
+        httpretty.register_uri(httpretty.GET, self.URL, body=self.respond)
+
+    def tearDown(self):
+        httpretty.disable()
+        httpretty.reset()
+
+    def respond(self, request, uri, headers):
+        # Hold the response until the other workers are waiting on this call
+        deadline = time.time() + 5
+        while self.rave.single_flight.shared < self.WORKERS - 1 and time.time() < deadline:
+            time.sleep(0.005)
+        return [self.status, headers, "1.0.0"]
+
+    def run_workers(self, request=rwslib.rws_requests.VersionRequest, consume=None, **kwargs):
+        calls, errors = [], []
+
+        def worker(n):
+            try:
+                call = self.rave.execute(request(), **{k: v(n) for k, v in kwargs.items()})
+                if consume is not None:
+                    # Results such as a lazy subject list are read on the thread that asked for them
+                    call.consumed = consume(call.result)
+                calls.append(call)
+            except Exception as exc:
+                errors.append(exc)
+
+        threads = [threading.Thread(target=worker, args=(n,)) for n in range(self.WORKERS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return calls, errors
+
+    def test_shared(self):
+        """Concurrent identical requests make one call to RWS"""
+        calls, errors = self.run_workers()
+        self.assertEqual([], errors)
+        self.assertEqual(["1.0.0"] * self.WORKERS, [c.result for c in calls])
+        self.assertEqual(self.WORKERS - 1, sum(c.shared for c in calls))
+        self.assertEqual(1, len(httpretty.latest_requests()))
+        self.assertEqual(0, len(self.rave.single_flight))
+
+    def test_shared_errors(self):
+        """Waiters get the exception raised by the shared call"""
+        self.status = 503
+        calls, errors = self.run_workers()
+        self.assertEqual([], calls)
+        self.assertEqual(self.WORKERS, len(errors))
+        for exc in errors:
+            self.assertIsInstance(exc, rwslib.RWSException)
+        self.assertEqual(1, len(httpretty.latest_requests()))
+
+    def test_results_not_shared(self):
+        """Each waiter builds its own result from the shared response"""
+        url = "https://innovate.mdsol.com/RaveWebServices/studies/Mediflex(Prod)/subjects"
+        httpretty.register_uri(httpretty.GET, url, body=self.respond_subjects)
+        calls, errors = self.run_workers(
+            lambda: rwslib.rws_requests.StudySubjectsRequest("Mediflex", "Prod", lazy=True),
+            consume=lambda subjects: [subject.subjectkey for subject in subjects],
+        )
+        self.assertEqual([], errors)
+        self.assertEqual(self.WORKERS - 1, sum(c.shared for c in calls))
+        self.assertEqual(self.WORKERS, len(set(id(c.result) for c in calls)))
+        self.assertEqual([["1", "2"]] * self.WORKERS, [c.consumed for c in calls])
+        self.assertEqual(1, len(httpretty.latest_requests()))
+
+    def respond_subjects(self, request, uri, headers):
+        self.respond(request, uri, headers)
+        subjects = "".join(
+            '<ClinicalData StudyOID="Mediflex(Prod)" MetaDataVersionOID="1"><SubjectData SubjectKey="%s">'
+            '<SiteRef LocationOID="1"/></SubjectData></ClinicalData>' % key
+            for key in ("1", "2")
+        )
+        return [
+            200,
+            headers,
+            '<ODM FileType="Snapshot" FileOID="1" CreationDateTime="2020-01-01T00:00:00" ODMVersion="1.3" '
+            'xmlns:mdsol="http://www.mdsol.com/ns/odm/metadata" xmlns="http://www.cdisc.org/ns/odm/v1.3">%s</ODM>'
+            % subjects,
+        ]
+
+    def test_different_kwargs_not_shared(self):
+        """Requests made with different keyword arguments are not shared"""
+        self.rave.single_flight.shared = self.WORKERS
+        calls, errors = self.run_workers(headers=lambda n: {"X-Worker": str(n)})
+        self.assertEqual([], errors)
+        self.assertEqual(0, sum(c.shared for c in calls))
+        self.assertEqual(self.WORKERS, len(httpretty.latest_requests()))
+
+    def test_sequential_not_shared(self):
+        """Calls that do not overlap are made separately"""
+        self.rave.single_flight.shared = self.WORKERS
+        self.rave.send_request(rwslib.rws_requests.VersionRequest())
+        call = self.rave.execute(rwslib.rws_requests.VersionRequest())
+        self.assertFalse(call.shared)
+        self.assertEqual(2, len(httpretty.latest_requests()))
+
+
+class TestStreaming(unittest.TestCase):
+    """Test streamed responses"""
+
+    @httpretty.activate
+    def test_default_stream_result(self):
+        """By default the stream is handed back to be consumed"""
+        httpretty.register_uri(
+            httpretty.GET,
+            "https://innovate.mdsol.com/RaveWebServices/version",
+            status=200,
+            body="1.0.0",
+        )
+
+        rave = rwslib.RWSConnection("https://innovate.mdsol.com")
+        stream = rave.send_request(rwslib.rws_requests.VersionRequest(), stream=True)
+        self.assertIsInstance(stream, rwslib.RWSResponseStream)
+        self.assertEqual([b"1.0", b".0"], list(stream.iter_chunks(3)))
+        self.assertEqual(5, stream.bytes_read)
+        stream.close()
+        self.assertTrue(stream.closed)
+
+    @httpretty.activate
+    def test_stream_xml_result(self):
+        """XML results are parsed from the stream"""
+        httpretty.register_uri(
+            httpretty.GET,
+            "https://innovate.mdsol.com/RaveWebServices/studies",
+            status=200,
+            body=u"""\ufeff<ODM FileType="Snapshot" FileOID="767a1f8b" CreationDateTime="2013-04-08T10:02:17.781-00:00"
+             ODMVersion="1.3" xmlns:mdsol="http://www.mdsol.com/ns/odm/metadata" xmlns="http://www.cdisc.org/ns/odm/v1.3">
+             <Study OID="Fixitol(Dev)">
+                <GlobalVariables>
+                      <StudyName>Fixitol (Dev)</StudyName>
+                      <StudyDescription/>
+                      <ProtocolName>Fixitol</ProtocolName>
+                </GlobalVariables>
+             </Study>
+        </ODM>""".encode("utf-8"),
+            content_type="text/xml",
+        )
+
+        rave = rwslib.RWSConnection("https://innovate.mdsol.com")
+        studies = rave.send_request(rwslib.rws_requests.ClinicalStudiesRequest(), stream=True)
+        self.assertEqual("Fixitol(Dev)", studies[0].oid)
+        self.assertEqual("Dev", studies[0].environment)
+
+    @httpretty.activate
+    def test_stream_error(self):
+        """Errors are detected as normal"""
+        httpretty.register_uri(
+            httpretty.GET,
+            "https://innovate.mdsol.com/RaveWebServices/version",
+            status=503,
+            body="HTTP 503 Service Temporarily Unavailable",
+        )
+
+        rave = rwslib.RWSConnection("https://innovate.mdsol.com")
+        with self.assertRaises(rwslib.RWSException) as exc:
+            rave.send_request(rwslib.rws_requests.VersionRequest(), stream=True)
+        self.assertEqual("Unexpected Status Code (503)", str(exc.exception))
+        self.assertEqual("HTTP 503 Service Temporarily Unavailable", exc.exception.rws_error)
+
+
+class TestSink(unittest.TestCase):
+    """Test streaming responses to a sink"""
+
+    BODY = b"<ODM>" + b"<ClinicalData/>" * 10000 + b"</ODM>"
+    URL = "https://innovate.mdsol.com/RaveWebServices/studies/Mediflex(Prod)/datasets/regular"
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        httpretty.enable()
+        httpretty.register_uri(httpretty.GET, self.URL, status=200, body=self.BODY)
+
+    def tearDown(self):
+        httpretty.disable()
+        httpretty.reset()
+        shutil.rmtree(self.tmpdir)
+
+    def test_path_sink(self):
+        """Body is written to the path and described"""
+        path = os.path.join(self.tmpdir, "dataset.xml")
+        rave = rwslib.RWSConnection("https://innovate.mdsol.com")
+        download = rave.send_request(StudyDatasetRequest("Mediflex", "Prod"), sink=path)
+        self.assertIsInstance(download, rwslib.RWSDownload)
+        self.assertEqual(path, download.path)
+        self.assertEqual(len(self.BODY), download.bytes_written)
+        self.assertEqual(hashlib.sha256(self.BODY).hexdigest(), download.checksum)
+        self.assertIs(type(download.elapsed), float)
+        with open(path, "rb") as fh:
+            self.assertEqual(self.BODY, fh.read())
+        self.assertEqual(["dataset.xml"], os.listdir(self.tmpdir))
+
+    def test_fileobj_sink(self):
+        """Body is written to a file-like object"""
+        sink = io.BytesIO()
+        rave = rwslib.RWSConnection("https://innovate.mdsol.com")
+        download = rave.send_request(StudyDatasetRequest("Mediflex", "Prod"), sink=sink)
+        self.assertIsNone(download.path)
+        self.assertEqual(self.BODY, sink.getvalue())
+        self.assertEqual(len(self.BODY), download.bytes_written)
+
+    def test_failed_write_leaves_existing_file(self):
+        """A failure part way through does not replace the target or leave a partial file"""
+        path = os.path.join(self.tmpdir, "dataset.xml")
+        with open(path, "wb") as fh:
+            fh.write(b"previous")
+        rave = rwslib.RWSConnection("https://innovate.mdsol.com")
+        with mock.patch.object(
+            rwslib.RWSResponseStream, "iter_chunks", side_effect=IOError("Connection lost")
+        ):
+            with self.assertRaises(IOError):
+                rave.send_request(StudyDatasetRequest("Mediflex", "Prod"), sink=path)
+        with open(path, "rb") as fh:
+            self.assertEqual(b"previous", fh.read())
+        self.assertEqual(["dataset.xml"], os.listdir(self.tmpdir))
+
+    def test_error_is_not_written(self):
+        """Error responses are raised rather than written"""
+        httpretty.register_uri(
+            httpretty.GET, self.URL, status=500, body="HTTP 500.13 Web server is too busy."
+        )
+        path = os.path.join(self.tmpdir, "dataset.xml")
+        rave = rwslib.RWSConnection("https://innovate.mdsol.com")
+        with self.assertRaises(rwslib.RWSException):
+            rave.send_request(StudyDatasetRequest("Mediflex", "Prod"), sink=path)
+        self.assertEqual([], os.listdir(self.tmpdir))
+
+
 class TestErrorResponse(unittest.TestCase):
     @httpretty.activate
     def test_503_error(self):
@@ -1,8 +1,15 @@
 # -*- coding: utf-8 -*-
 __author__ = "isparks"
 
+import io
+import threading
 import unittest
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 from rwslib import rwsobjects
 
 
@@ -21,6 +28,44 @@ class TestParse(unittest.TestCase):
         text = u""
         self.assertEqual(u"", rwsobjects.parseXMLString(text))
 
+    def test_parse_bytes(self):
+        """Bytes are parsed as they are, after any BOMs, and decoded by lxml"""
+        content = u"""\ufeff\ufeff<?xml version="1.0" encoding="utf-8"?><ODM Name="Caf\xe9"/>""".encode("utf-8")
+        root = rwsobjects.parseXMLString(content)
+        self.assertEqual("ODM", root.tag)
+        self.assertEqual(u"Caf\xe9", root.get("Name"))
+        latin = u"""<?xml version="1.0" encoding="iso-8859-1"?><ODM Name="Caf\xe9"/>""".encode("iso-8859-1")
+        self.assertEqual(u"Caf\xe9", rwsobjects.parseXMLString(latin).get("Name"))
+        self.assertEqual(u"", rwsobjects.parseXMLString(b"\xef\xbb\xbf"))
+        self.assertEqual(u"Caf\xe9", rwsobjects.XMLRepr(content).root.get("Name"))
+
+    def test_parse_error(self):
+        with self.assertRaises(Exception):
+            rwsobjects.parseXMLString(b"<ODM>")
+        # The parser can be used again after an error
+        self.assertEqual("ODM", rwsobjects.parseXMLString(b"<ODM/>").tag)
+
+    def test_parser_per_thread(self):
+        """Each thread reuses its own parser"""
+        parsers = []
+        thread = threading.Thread(target=lambda: parsers.append(rwsobjects._xml_parser()))
+        thread.start()
+        thread.join()
+        self.assertIs(rwsobjects._xml_parser(), rwsobjects._xml_parser())
+        self.assertIsNot(parsers[0], rwsobjects._xml_parser())
+
+    def test_parse_stream(self):
+        """File-like objects are parsed incrementally, skipping any BOM"""
+        stream = io.BytesIO(b"""\xef\xbb\xbf\xef\xbb\xbf<?xml version="1.0" encoding="utf-8"?><ODM><A/></ODM>""")
+        root = rwsobjects.parseXMLStream(stream, chunk_size=4)
+        self.assertEqual("ODM", root.tag)
+        self.assertEqual("A", root[0].tag)
+        self.assertEqual("ODM", rwsobjects.parseXMLString(io.BytesIO(b"<ODM/>")).tag)
+
+    def test_parse_empty_stream(self):
+        self.assertEqual(u"", rwsobjects.parseXMLStream(io.BytesIO(b"")))
+        self.assertEqual(u"", rwsobjects.parseXMLStream(io.BytesIO(b"\xef\xbb\xbf")))
+
 
 class TestParseEnvironment(unittest.TestCase):
     """Test for extraction of environment"""
@@ -309,6 +354,309 @@ class TestRWSSubjects(unittest.TestCase):
             self.assertEqual(meta[0], subject.locationoid)
 
 
+def make_subject_list(count):
+    subjects = "".join(
+        u"""<ClinicalData StudyOID="Mediflex(Prod)" MetaDataVersionOID="1">
+    <SubjectData SubjectKey="%04d" mdsol:Incomplete="%s">
+      <SiteRef LocationOID="SITE%d"/>
+    </SubjectData>
+  </ClinicalData>
+  """
+        % (i, "Yes" if i % 2 else "No", i % 3)
+        for i in range(count)
+    )
+    return (
+        u"""\ufeff<?xml version="1.0" encoding="utf-8"?>
+<ODM xmlns:mdsol="http://www.mdsol.com/ns/odm/metadata" xmlns="http://www.cdisc.org/ns/odm/v1.3" FileType="Snapshot" FileOID="d4b8d9a6" CreationDateTime="2013-09-10T09:33:07.808-00:00" ODMVersion="1.3">
+  %s</ODM>"""
+        % subjects
+    ).encode("utf-8")
+
+
+class TestRWSSubjectsStream(unittest.TestCase):
+    def test_iterate(self):
+        """Subjects are read as they are iterated over, the same as RWSSubjects"""
+        content = make_subject_list(1000)
+        subjects = rwsobjects.RWSSubjectsStream(content, chunk_size=512)
+        self.assertEqual("d4b8d9a6", subjects.fileoid)
+        self.assertEqual("Snapshot", subjects.filetype)
+        expected = rwsobjects.RWSSubjects(content)
+        count = 0
+        for subject, other in zip(subjects, expected):
+            self.assertEqual(other.subjectkey, subject.subjectkey)
+            self.assertEqual(other.locationoid, subject.locationoid)
+            self.assertEqual(other.incomplete, subject.incomplete)
+            # Subjects already read are discarded, leaving those in the last chunk read
+            self.assertLessEqual(len(subjects._root), 5)
+            count += 1
+        self.assertEqual(1000, count)
+        self.assertTrue(subjects.source.closed)
+
+    def test_single_pass(self):
+        """A stream can only be iterated over once unless materialised"""
+        subjects = rwsobjects.RWSSubjectsStream(make_subject_list(10))
+        keys = [subject.subjectkey for subject in subjects]
+        self.assertEqual(10, len(keys))
+        with self.assertRaises(ValueError):
+            iter(subjects)
+        with self.assertRaises(ValueError):
+            subjects.materialise()
+
+    def test_materialise(self):
+        """The subjects can be read into a list to be used more than once"""
+        subjects = rwsobjects.RWSSubjectsStream(make_subject_list(10).decode("utf-8"))
+        items = subjects.materialise()
+        self.assertEqual(10, len(items))
+        self.assertEqual("0003", items[3].subjectkey)
+        self.assertEqual(10, len(list(subjects)))
+        self.assertEqual(10, len(list(subjects)))
+        self.assertTrue(subjects)
+        self.assertFalse(hasattr(subjects, "__len__"))
+        self.assertEqual(10, len(list(rwsobjects.RWSSubjectsStream(make_subject_list(10)))))
+
+    def test_bool(self):
+        """Truth only reads ahead to the first subject, which is still handed on"""
+        subjects = rwsobjects.RWSSubjectsStream(make_subject_list(1000), chunk_size=512)
+        self.assertTrue(subjects)
+        self.assertTrue(subjects)
+        self.assertFalse(subjects.source.closed)
+        self.assertLessEqual(len(subjects._root), 5)
+        self.assertEqual(["%04d" % n for n in range(1000)], [subject.subjectkey for subject in subjects])
+        # Truth once some have been read
+        subjects = rwsobjects.RWSSubjectsStream(make_subject_list(10))
+        it = iter(subjects)
+        next(it)
+        self.assertTrue(subjects)
+        self.assertEqual(9, len(list(it)))
+        # Columns include the subject read ahead
+        subjects = rwsobjects.RWSSubjectsStream(make_subject_list(10))
+        self.assertTrue(subjects)
+        self.assertEqual(10, len(subjects.to_columns()["subjectkey"]))
+
+    def test_empty(self):
+        subjects = rwsobjects.RWSSubjectsStream(b"")
+        self.assertIsNone(subjects.fileoid)
+        self.assertFalse(subjects)
+        self.assertEqual([], list(subjects))
+        subjects = rwsobjects.RWSSubjectsStream(make_subject_list(0))
+        self.assertFalse(subjects)
+        self.assertEqual([], subjects.materialise())
+
+
+class TestSubjectStatus(unittest.TestCase):
+    """Status flags of RWSSubjectListItem"""
+
+    def setUp(self):
+        content = make_subject_list(10).replace(
+            b'mdsol:Incomplete="No"', b'mdsol:Incomplete="No" mdsol:RequiresSignature="Yes" mdsol:Locked="No"'
+        )
+        self.subjects = rwsobjects.RWSSubjects(content)
+
+    def test_flags(self):
+        """Flags read as True, False or None when not reported"""
+        subject = self.subjects[0]
+        self.assertEqual(False, subject.incomplete)
+        self.assertEqual(True, subject.requiressignature)
+        self.assertEqual(False, subject.locked)
+        self.assertIsNone(subject.overdue)
+        self.assertIsNone(self.subjects[1].requiressignature)
+        self.assertFalse(hasattr(subject, "__dict__"))
+
+    def test_set_flags(self):
+        subject = rwsobjects.RWSSubjectListItem()
+        self.assertIsNone(subject.frozen)
+        subject.frozen = True
+        subject.locked = False
+        self.assertEqual(True, subject.frozen)
+        self.assertEqual(False, subject.locked)
+        subject.frozen = None
+        self.assertIsNone(subject.frozen)
+        subject.frozen = "maybe"
+        self.assertEqual("maybe", subject.frozen)
+        self.assertFalse(subject.has_status(frozen=True))
+
+    def test_with_status(self):
+        """Subjects are filtered by status flags, unreported flags never match"""
+        self.assertEqual(
+            ["0000", "0002", "0004", "0006", "0008"],
+            [s.subjectkey for s in self.subjects.with_status(requiressignature=True, locked=False)],
+        )
+        self.assertEqual([], self.subjects.with_status(requiressignature=True, locked=True))
+        self.assertEqual(5, len(self.subjects.with_status(incomplete=True)))
+        stream = rwsobjects.RWSSubjectsStream(make_subject_list(10))
+        self.assertEqual(5, len(rwsobjects.subjects_with_status(stream, incomplete=False)))
+        self.assertTrue(self.subjects[0].has_status(requiressignature=True))
+        with self.assertRaises(ValueError):
+            self.subjects.with_status(subjectname=True)
+
+
+class TestSubjectIndexes(unittest.TestCase):
+    """Lookups on RWSSubjects"""
+
+    def setUp(self):
+        self.subjects = rwsobjects.RWSSubjects(make_subject_list(9))
+
+    def test_lookup(self):
+        self.assertEqual("SITE1", self.subjects.subject_by_key("0004").locationoid)
+        self.assertEqual("0004", self.subjects.subject_by_name("0004").subjectkey)
+        self.assertIsNone(self.subjects.subject_by_key("9999"))
+        self.assertEqual(["0002", "0005", "0008"], [s.subjectkey for s in self.subjects.subjects_at_site("SITE2")])
+        self.assertEqual([], self.subjects.subjects_at_site("SITE9"))
+        self.assertEqual(9, len(self.subjects.subjects_at_site_number(None)))
+
+    def test_group_by_site(self):
+        groups = self.subjects.group_by_site()
+        self.assertEqual(["SITE0", "SITE1", "SITE2"], sorted(groups))
+        self.assertEqual(["0000", "0003", "0006"], [s.subjectkey for s in groups["SITE0"]])
+        # Changing the groups does not change the index
+        groups["SITE0"].pop()
+        self.assertEqual(3, len(self.subjects.subjects_at_site("SITE0")))
+
+    def test_mutation(self):
+        """Indexes follow changes to the list"""
+        subjects = self.subjects
+        self.assertIsNotNone(subjects.subject_by_key("0001"))
+        first = subjects.pop(1)
+        self.assertIsNone(subjects.subject_by_key("0001"))
+        subjects.append(first)
+        self.assertIs(first, subjects.subject_by_key("0001"))
+        del subjects[-1]
+        self.assertIsNone(subjects.subject_by_key("0001"))
+        subjects[0] = first
+        self.assertIsNone(subjects.subject_by_key("0000"))
+        self.assertIs(first, subjects.subject_by_key("0001"))
+        subjects += [rwsobjects.RWSSubjectListItem()]
+        self.assertEqual(1, len(subjects.subjects_at_site(None)))
+        subjects.clear()
+        self.assertEqual({}, subjects.group_by_site())
+
+
+class TestReleaseTree(unittest.TestCase):
+    """Objects built with retain_tree=False"""
+
+    def test_subjects(self):
+        """Fields are kept and the tree is parsed again when needed"""
+        content = make_subject_list(5)
+        subjects = rwsobjects.RWSSubjects(content, retain_tree=False)
+        self.assertIsNone(subjects._root)
+        self.assertIs(content, subjects._xml)
+        self.assertEqual(5, len(subjects))
+        self.assertEqual("d4b8d9a6", subjects.fileoid)
+        self.assertEqual(5, len(subjects.root))
+        self.assertIsNone(subjects._root)
+        self.assertEqual(str(rwsobjects.RWSSubjects(content)), str(subjects))
+
+    def test_derived(self):
+        """Derived classes read their own fields before the tree is released"""
+        text = u"""<Response ReferenceNumber="82e942b0" InboundODMFileOID="" IsTransactionSuccessful="1"
+        SuccessStatistics="Rave objects touched: Subjects=1; Folders=0; Forms=0; Fields=0; LogLines=0"
+        NewRecords="" SubjectNumberInStudy="1103" SubjectNumberInStudySite="55"/>"""
+        response = rwsobjects.RWSPostResponse(text, retain_tree=False)
+        self.assertEqual(1103, response.subjects_in_study)
+        self.assertEqual(1, response.subjects_touched)
+        self.assertIsNone(response._root)
+        self.assertEqual("55", response.root.get("SubjectNumberInStudySite"))
+
+    def test_subclass(self):
+        """Subclasses only read their fields, the tree is released for them"""
+
+        class Reference(rwsobjects.XMLRepr):
+            def __init__(self, xml):
+                rwsobjects.XMLRepr.__init__(self, xml)
+                self.reference = self.root.get("ReferenceNumber")
+
+        reference = Reference(b'<Response ReferenceNumber="1"/>', retain_tree=False)
+        self.assertEqual("1", reference.reference)
+        self.assertIsNone(reference._root)
+        self.assertIsNotNone(Reference(b'<Response ReferenceNumber="1"/>')._root)
+
+    def test_stream(self):
+        """Trees read from a stream are serialised to be kept"""
+        response = rwsobjects.RWSResponse(io.BytesIO(b'<Response ReferenceNumber="1"/>'), retain_tree=False)
+        self.assertEqual(b'<Response ReferenceNumber="1"/>', response._xml)
+        self.assertEqual('<Response ReferenceNumber="1"/>', str(response))
+
+    def test_release(self):
+        response = rwsobjects.RWSResponse(b'<Response ReferenceNumber="1"/>')
+        response.release_tree()
+        self.assertIsNone(response._root)
+        self.assertEqual("1", response.root.get("ReferenceNumber"))
+
+
+class TestColumns(unittest.TestCase):
+    """Subject lists as columns"""
+
+    def test_subjects(self):
+        """One column per attribute and status flag"""
+        columns = rwsobjects.RWSSubjects(make_subject_list(6)).to_columns()
+        self.assertEqual(list(rwsobjects.SUBJECT_COLUMNS), list(columns))
+        self.assertEqual(["0000", "0001", "0002", "0003", "0004", "0005"], columns["subjectkey"])
+        self.assertEqual(["SITE0", "SITE1", "SITE2"] * 2, columns["locationoid"])
+        self.assertEqual([None] * 6, columns["subjectname"])
+        self.assertEqual("b", columns["incomplete"].typecode)
+        self.assertEqual([0, 1, 0, 1, 0, 1], list(columns["incomplete"]))
+        # Not reported
+        self.assertEqual([-1] * 6, list(columns["locked"]))
+        self.assertEqual([1] * 6, list(columns["active"]))
+        self.assertEqual([0] * 6, list(columns["deleted"]))
+
+    def test_stream(self):
+        """Columns read from a stream are the same as those of the parsed list"""
+        content = make_subject_list(100)
+        expected = rwsobjects.RWSSubjects(content).to_columns()
+        subjects = rwsobjects.RWSSubjectsStream(content, chunk_size=512)
+        self.assertEqual(expected, subjects.to_columns())
+        with self.assertRaises(ValueError):
+            subjects.to_columns()
+        # Materialised subjects can be read again
+        subjects = rwsobjects.RWSSubjectsStream(content)
+        subjects.materialise()
+        self.assertEqual(expected, subjects.to_columns())
+        self.assertEqual(expected, subjects.to_columns())
+
+    def test_studies(self):
+        text = u"""<ODM FileType="Snapshot" ODMVersion="1.3" xmlns="http://www.cdisc.org/ns/odm/v1.3">
+         <Study OID="IANTEST">
+            <GlobalVariables>
+                <StudyName>IANTEST</StudyName>
+                <StudyDescription/>
+                <ProtocolName>IANTEST</ProtocolName>
+            </GlobalVariables>
+            <MetaDataVersion OID="1203" Name="Webservice Outbound" />
+            <MetaDataVersion OID="1165" Name="Initial" />
+         </Study>
+    </ODM>"""
+        self.assertEqual(
+            dict(
+                oid=["IANTEST"],
+                studyname=["IANTEST"],
+                protocolname=["IANTEST"],
+                environment=[""],
+                projecttype=["Project"],
+            ),
+            rwsobjects.RWSStudies(text).to_columns(),
+        )
+        self.assertEqual(
+            dict(oid=["1203", "1165"], name=["Webservice Outbound", "Initial"]),
+            rwsobjects.RWSStudyMetadataVersions(text).to_columns(),
+        )
+
+    @unittest.skipUnless(numpy is not None, "NumPy is not installed")
+    def test_numpy(self):
+        array = rwsobjects.RWSSubjects(make_subject_list(6)).to_numpy()
+        self.assertEqual(6, len(array))
+        self.assertEqual(numpy.int8, array.dtype["incomplete"])
+        self.assertEqual([0, 1, 0, 1, 0, 1], array["incomplete"].tolist())
+        self.assertEqual("0003", array["subjectkey"][3])
+        self.assertEqual("", array["subjectname"][0])
+        self.assertEqual(0, len(rwsobjects.RWSSubjects(make_subject_list(0)).to_numpy()))
+
+    @unittest.skipIf(numpy is not None, "NumPy is installed")
+    def test_no_numpy(self):
+        with self.assertRaises(ImportError):
+            rwsobjects.RWSSubjects(make_subject_list(6)).to_numpy()
+
+
 class TestMetaDataVersions(unittest.TestCase):
     """Test MetaDataVersions"""
 
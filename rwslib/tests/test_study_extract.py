@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+from lxml import etree
+
+import rwslib
+from rwslib.extras.rws_simulator import RWSSimulator, SimulatorConfig
+from rwslib.extras.study_extract import StudyExtraction, form_filename, metadata_form_oids
+from rwslib.retry import RetryPolicy
+from rwslib.rwsobjects import ODM_NS
+
+
+class TestStudyExtraction(unittest.TestCase):
+    config = SimulatorConfig(subjects=20)
+
+    def setUp(self):
+        self.simulator = RWSSimulator(self.config).start()
+        self.rave = rwslib.RWSConnection(self.simulator.url, "user", "pass")
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+        self.rave.close()
+        self.simulator.stop()
+
+    def test_plan(self):
+        """The forms are read from the metadata of the study versions"""
+        extraction = StudyExtraction(self.rave, "Mediflex", "Prod", rawsuffix="_RAW")
+        self.assertEqual(["DM", "VS", "AE"], extraction.form_oids())
+        requests = extraction.plan()
+        self.assertEqual(["DM", "VS", "AE"], [request.formoid for request in requests])
+        self.assertEqual("_RAW", requests[0].rawsuffix)
+        self.assertEqual(1, self.simulator.requests["get_metadata"])
+        extraction = StudyExtraction(self.rave, "Mediflex", "Prod", forms=["VS"])
+        self.assertEqual(["VS"], extraction.form_oids())
+        self.assertEqual(1, self.simulator.requests["get_metadata"])
+
+    def test_write_forms(self):
+        """Each form is written to its own file"""
+        extraction = StudyExtraction(self.rave, "Mediflex", "Prod", max_workers=2)
+        extracts = extraction.write_forms(self.tmpdir)
+        self.assertEqual(["DM", "VS", "AE"], list(extracts))
+        self.assertEqual(["AE.xml", "DM.xml", "VS.xml"], sorted(os.listdir(self.tmpdir)))
+        for form_oid, extract in extracts.items():
+            self.assertTrue(extract.ok)
+            self.assertEqual(1, extract.attempts)
+            doc = etree.parse(extract.path)
+            self.assertEqual(20, len(doc.findall(ODM_NS + "ClinicalData")))
+            self.assertEqual({form_oid}, set(form.get("FormOID") for form in doc.iter(ODM_NS + "FormData")))
+        # Redo some forms only
+        self.assertEqual(["VS"], list(extraction.write_forms(self.tmpdir, forms=["VS"])))
+        self.assertEqual(4, self.simulator.requests["get_dataset"])
+
+    def test_clinical_data(self):
+        """The ClinicalData of every form, form by form"""
+        extraction = StudyExtraction(self.rave, "Mediflex", "Prod")
+        forms = [
+            clinical_data.find(".//" + ODM_NS + "FormData").get("FormOID")
+            for clinical_data in extraction.clinical_data()
+        ]
+        self.assertEqual(["DM"] * 20 + ["VS"] * 20 + ["AE"] * 20, forms)
+        out = io.BytesIO()
+        self.assertEqual(60, extraction.write_clinical_data(out))
+        doc = etree.fromstring(out.getvalue())
+        self.assertEqual(60, len(doc.findall(ODM_NS + "ClinicalData")))
+
+    def test_utils(self):
+        self.assertEqual("AE_LOG.xml", form_filename("AE/LOG"))
+        metadata = self.rave.send_request(rwslib.rws_requests.StudyVersionRequest("Mediflex", 1))
+        self.assertEqual(["DM", "VS", "AE"], metadata_form_oids(metadata))
+
+
+class TestStudyExtractionErrors(unittest.TestCase):
+    def test_attempts(self):
+        """Forms that fail are tried again on their own"""
+        with RWSSimulator(SimulatorConfig(subjects=5, error_rate=0.5, seed=3)) as simulator:
+            rave = rwslib.RWSConnection(simulator.url, "user", "pass")
+            policy = RetryPolicy(backoff_factor=0.001)
+            extraction = StudyExtraction(
+                rave, "Mediflex", "Prod", forms=["DM", "VS", "AE"], attempts=20, retry_policy=policy
+            )
+            forms = list(extraction.clinical_data())
+            rave.close()
+        self.assertEqual(15, len(forms))
+        self.assertGreater(simulator.errors_injected, 0)
+        # Each failure of a form that was then tried again waited first
+        self.assertGreater(policy.stats()["retries"], 0)
+
+    def test_backoff(self):
+        """Forms are tried again after the backoff of the retry policy"""
+        waits = []
+        policy = RetryPolicy(backoff_factor=1, jitter=False, sleep=waits.append)
+        with RWSSimulator(SimulatorConfig(subjects=5, error_rate=1.0, error_statuses=(503,), retry_after=0)) as sim:
+            rave = rwslib.RWSConnection(sim.url, "user", "pass")
+            extraction = StudyExtraction(rave, "Mediflex", "Prod", forms=["DM"], attempts=3, retry_policy=policy)
+            tmpdir = tempfile.mkdtemp()
+            try:
+                extracts = extraction.write_forms(tmpdir)
+            finally:
+                shutil.rmtree(tmpdir)
+            rave.close()
+        self.assertEqual(3, extracts["DM"].attempts)
+        self.assertEqual([1, 2], waits)
+        self.assertEqual({503: 2}, policy.stats()["retries_by_status"])
+
+    def test_failed(self):
+        """Forms that cannot be downloaded are reported, and raised when their data is reached"""
+        with RWSSimulator(SimulatorConfig(subjects=5, error_rate=1.0)) as simulator:
+            rave = rwslib.RWSConnection(simulator.url, "user", "pass")
+            extraction = StudyExtraction(
+                rave, "Mediflex", "Prod", forms=["DM", "VS"], attempts=2, retry_policy=RetryPolicy(backoff_factor=0)
+            )
+            tmpdir = tempfile.mkdtemp()
+            try:
+                extracts = extraction.write_forms(tmpdir)
+                self.assertEqual([], os.listdir(tmpdir))
+            finally:
+                shutil.rmtree(tmpdir)
+            self.assertEqual([False, False], [extract.ok for extract in extracts.values()])
+            self.assertEqual([2, 2], [extract.attempts for extract in extracts.values()])
+            self.assertIsInstance(extracts["DM"].exception, rwslib.RWSException)
+            with self.assertRaises(rwslib.RWSException):
+                list(extraction.clinical_data())
+            rave.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,209 @@
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+import httpretty
+
+import rwslib
+from rwslib.retry import RetryPolicy
+from rwslib.rws_requests import VersionRequest
+from rwslib.throttle import AIMDController, FileTokenBucket, TokenBucket
+
+
+class FakeClock(object):
+    """A clock that only moves when slept on"""
+
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class TestTokenBucket(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+
+    def test_burst_then_rate(self):
+        """A full bucket allows a burst, then requests are spaced at the rate"""
+        bucket = TokenBucket(2, capacity=3, clock=self.clock, sleep=self.clock.sleep)
+        for _ in range(3):
+            self.assertEqual(0, bucket.acquire())
+        self.assertEqual(0.5, bucket.acquire())
+        self.assertEqual(0.5, bucket.acquire())
+        self.assertEqual([0.5, 0.5], self.clock.sleeps)
+        self.assertEqual(1.0, bucket.time_waited)
+
+    def test_refill(self):
+        """Tokens are added over time, up to the capacity"""
+        bucket = TokenBucket(1, capacity=2, clock=self.clock, sleep=self.clock.sleep)
+        self.assertTrue(bucket.try_acquire(2))
+        self.assertFalse(bucket.try_acquire())
+        self.clock.now += 10
+        self.assertTrue(bucket.try_acquire(2))
+        self.assertFalse(bucket.try_acquire())
+
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            TokenBucket(0)
+        with self.assertRaises(ValueError):
+            TokenBucket(1, capacity=1).acquire(2)
+
+
+class TestFileTokenBucket(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, "bucket")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_shared(self):
+        """Buckets using the same file share their tokens"""
+        first = FileTokenBucket(self.path, 0.001, capacity=3)
+        second = FileTokenBucket(self.path, 0.001, capacity=3)
+        self.assertTrue(first.try_acquire())
+        self.assertTrue(second.try_acquire(2))
+        self.assertFalse(first.try_acquire())
+        self.assertFalse(second.try_acquire())
+
+    def test_unreadable_state(self):
+        """A corrupt file is treated as a full bucket"""
+        with open(self.path, "w") as fh:
+            fh.write("not json")
+        bucket = FileTokenBucket(self.path, 0.001, capacity=1)
+        self.assertTrue(bucket.try_acquire())
+        self.assertFalse(bucket.try_acquire())
+
+
+class TestAIMDController(unittest.TestCase):
+    def complete(self, controller, count, latency=0.1, failed=False):
+        for _ in range(count):
+            token = controller.acquire()
+            controller.release(latency, failed, token)
+
+    def test_additive_increase(self):
+        """The limit grows by one after each window of stable responses"""
+        controller = AIMDController(initial=2, maximum=4)
+        self.complete(controller, 2)
+        self.assertEqual(3, controller.limit)
+        self.complete(controller, 3)
+        self.assertEqual(4, controller.limit)
+        self.complete(controller, 10)
+        self.assertEqual(4, controller.limit)
+
+    def test_multiplicative_decrease(self):
+        """Failures halve the limit, down to the minimum"""
+        controller = AIMDController(initial=8, minimum=2)
+        self.complete(controller, 1, failed=True)
+        self.assertEqual(4, controller.limit)
+        self.complete(controller, 1, failed=True)
+        self.complete(controller, 1, failed=True)
+        self.assertEqual(2, controller.limit)
+        self.assertEqual(3, controller.decreases)
+
+    def test_burst_counted_once(self):
+        """Failures of requests already in flight at a decrease do not decrease again"""
+        controller = AIMDController(initial=8)
+        tokens = [controller.acquire() for _ in range(4)]
+        for token in tokens:
+            controller.release(1.0, True, token)
+        self.assertEqual(4, controller.limit)
+        self.assertEqual(1, controller.decreases)
+
+    def test_slow_responses_hold_growth(self):
+        """Responses much slower than the baseline stop the limit growing"""
+        controller = AIMDController(initial=2)
+        self.complete(controller, 1, latency=0.1)
+        self.complete(controller, 1, latency=1.0)
+        self.complete(controller, 1, latency=0.1)
+        self.assertEqual(2, controller.limit)
+        self.complete(controller, 1, latency=0.1)
+        self.assertEqual(3, controller.limit)
+
+    def test_limits_in_flight(self):
+        """No more than the limit are in flight at once"""
+        controller = AIMDController(initial=2, maximum=2)
+        in_flight = []
+        lock = threading.Lock()
+        running = [0]
+
+        def worker():
+            token = controller.acquire()
+            with lock:
+                running[0] += 1
+                in_flight.append(running[0])
+            time.sleep(0.01)
+            with lock:
+                running[0] -= 1
+            controller.release(0.01, False, token)
+
+        threads = [threading.Thread(target=worker) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertLessEqual(max(in_flight), 2)
+        self.assertEqual(0, controller.stats()["in_flight"])
+
+
+class TestConnectionThrottling(unittest.TestCase):
+    URL = "https://innovate.mdsol.com/RaveWebServices/version"
+
+    def setUp(self):
+        httpretty.enable()
+
+    def tearDown(self):
+        httpretty.disable()
+        httpretty.reset()
+
+    def test_rate_limited_retries(self):
+        """Every attempt takes a token and feeds the concurrency controller"""
+        httpretty.register_uri(
+            httpretty.GET,
+            self.URL,
+            responses=[
+                httpretty.Response(body="HTTP 503 Service Temporarily Unavailable", status=503),
+                httpretty.Response(body="1.0.0", status=200),
+            ],
+        )
+        clock = FakeClock()
+        limiter = TokenBucket(1, capacity=1, clock=clock, sleep=clock.sleep)
+        controller = AIMDController(initial=4)
+        rave = rwslib.RWSConnection(
+            "https://innovate.mdsol.com",
+            retry_policy=RetryPolicy(sleep=lambda seconds: None),
+            rate_limiter=limiter,
+            concurrency=controller,
+        )
+        self.assertEqual("1.0.0", rave.send_request(VersionRequest()))
+        self.assertEqual([1.0], clock.sleeps)
+        stats = controller.stats()
+        self.assertEqual(2, stats["limit"])
+        self.assertEqual(0, stats["in_flight"])
+
+    def test_released_on_error(self):
+        """Requests that raise still release their place"""
+        httpretty.register_uri(
+            httpretty.GET, self.URL, status=503, body="HTTP 503 Service Temporarily Unavailable"
+        )
+        controller = AIMDController(initial=1)
+        rave = rwslib.RWSConnection("https://innovate.mdsol.com", concurrency=controller)
+        for _ in range(2):
+            with self.assertRaises(rwslib.RWSException):
+                rave.send_request(VersionRequest())
+        self.assertEqual(0, controller.in_flight)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+
+import io
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpretty
+
+import rwslib
+from rwslib.cache import MemoryCache
+from rwslib.rws_requests import ClinicalStudiesRequest, RWSGetRequest, StudyVersionRequest, VersionRequest
+from rwslib.timing import RequestObserver, RequestTiming, TimingLog
+
+
+class SlowResultRequest(RWSGetRequest):
+    """A request whose result takes a while to build"""
+
+    def url_path(self):
+        return self.make_url("version")
+
+    def result(self, response):
+        text = response.text
+        time.sleep(0.05)
+        return text
+
+
+class TestRequestTiming(unittest.TestCase):
+    def test_as_dict(self):
+        """Timings can be exported as a dict"""
+        timing = RequestTiming(VersionRequest(), url="https://innovate.mdsol.com/RaveWebServices/version")
+        timing.status_code = 200
+        timing.finish(ValueError("bad"))
+        values = timing.as_dict()
+        self.assertEqual("VersionRequest", values["request_name"])
+        self.assertEqual("GET", values["method"])
+        self.assertEqual(200, values["status_code"])
+        self.assertEqual("ValueError", values["exception"])
+        for phase in RequestTiming.PHASES:
+            self.assertEqual(0.0, values[phase])
+        self.assertIs(type(values["total"]), float)
+
+    def test_observer_must_override(self):
+        with self.assertRaises(NotImplementedError):
+            RequestObserver().on_request(None)
+
+
+class TestConnectionTiming(unittest.TestCase):
+    URL = "https://innovate.mdsol.com/RaveWebServices/version"
+
+    def setUp(self):
+        httpretty.enable()
+        httpretty.register_uri(httpretty.GET, self.URL, status=200, body="1.0.0")
+        self.log = TimingLog()
+        self.rave = rwslib.RWSConnection("https://innovate.mdsol.com", observers=[self.log])
+
+    def tearDown(self):
+        httpretty.disable()
+        httpretty.reset()
+
+    def test_phases(self):
+        """Observers are given the phases, sizes and outcome of each call"""
+        call = self.rave.execute(SlowResultRequest())
+        self.assertEqual([call.timing], self.log.timings)
+        timing = call.timing
+        self.assertEqual("SlowResultRequest", timing.request_name)
+        self.assertEqual(self.URL, timing.url)
+        self.assertEqual(200, timing.status_code)
+        self.assertEqual(5, timing.content_bytes)
+        self.assertGreaterEqual(timing.result, 0.05)
+        self.assertGreater(timing.decode, 0)
+        for phase in RequestTiming.PHASES:
+            self.assertGreaterEqual(getattr(timing, phase), 0)
+        self.assertGreaterEqual(timing.total, sum(getattr(timing, p) for p in RequestTiming.PHASES) - 0.001)
+        self.assertIsNone(timing.exception)
+
+    def test_xml_decode(self):
+        """Parsing an XML body counts as decoding"""
+        url = "https://innovate.mdsol.com/RaveWebServices/studies"
+        study = (
+            '<Study OID="Mediflex(Dev)"><GlobalVariables><StudyName>Mediflex (Dev)</StudyName>'
+            "<StudyDescription/><ProtocolName>Mediflex</ProtocolName></GlobalVariables></Study>"
+        )
+        body = '<ODM FileType="Snapshot" xmlns="http://www.cdisc.org/ns/odm/v1.3">%s</ODM>' % (study * 5000)
+        httpretty.register_uri(httpretty.GET, url, status=200, body=body)
+        timing = self.rave.execute(ClinicalStudiesRequest()).timing
+        self.assertGreater(timing.decode, 0)
+        self.assertGreaterEqual(timing.result, 0)
+
+    def test_no_observers(self):
+        """Timings are only recorded when there are observers"""
+        rave = rwslib.RWSConnection("https://innovate.mdsol.com")
+        self.assertIsNone(rave.execute(VersionRequest()).timing)
+
+    def test_errors(self):
+        """Observers are told about calls that raise"""
+        httpretty.register_uri(
+            httpretty.GET, self.URL, status=503, body="HTTP 503 Service Temporarily Unavailable"
+        )
+        with self.assertRaises(rwslib.RWSException) as exc:
+            self.rave.send_request(VersionRequest())
+        timing = self.log.timings[0]
+        self.assertIs(exc.exception, timing.exception)
+        self.assertEqual(503, timing.status_code)
+
+    def test_cache_hits(self):
+        """Calls served from the cache are marked"""
+        url = "https://innovate.mdsol.com/RaveWebServices/metadata/studies/Mediflex/versions/1"
+        httpretty.register_uri(httpretty.GET, url, status=200, body="<ODM/>")
+        rave = rwslib.RWSConnection(
+            "https://innovate.mdsol.com", "user", "pass", cache=MemoryCache(), observers=[self.log]
+        )
+        rave.send_request(StudyVersionRequest("Mediflex", 1))
+        rave.send_request(StudyVersionRequest("Mediflex", 1))
+        self.assertEqual([False, True], [t.from_cache for t in self.log.timings])
+        self.assertEqual(6, self.log.timings[1].content_bytes)
+
+    def test_queue_wait(self):
+        """Time waiting for a worker in send_requests is counted"""
+        calls = list(self.rave.send_requests([SlowResultRequest(), SlowResultRequest()], max_workers=1))
+        self.assertGreaterEqual(calls[1].timing.queue_wait, 0.05)
+
+    def test_sink(self):
+        """Writing to a sink counts as downloading"""
+        sink = io.BytesIO()
+        call = self.rave.execute(VersionRequest(), sink=sink)
+        self.assertEqual(5, call.timing.content_bytes)
+        self.assertEqual(5, call.timing.bytes_received)
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header("Content-Length", "5")
+        self.end_headers()
+        self.wfile.write(b"1.0.0")
+
+
+class TestConnectTiming(unittest.TestCase):
+    def test_connect(self):
+        """Connecting is timed, and is not repeated when a pooled connection is reused"""
+        server = ThreadingHTTPServer(("127.0.0.1", 0), StandInHandler)
+        server.daemon_threads = True
+        thread = threading.Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        try:
+            log = TimingLog()
+            with rwslib.RWSConnection(
+                "http://127.0.0.1:%d" % server.server_address[1], observers=[log]
+            ) as rave:
+                rave.send_request(VersionRequest())
+                rave.send_request(VersionRequest())
+        finally:
+            server.shutdown()
+            server.server_close()
+        first, second = log.timings
+        self.assertGreater(first.connect, 0)
+        self.assertEqual(0, second.connect)
+        self.assertGreater(second.ttfb, 0)
+        self.assertEqual(5, second.bytes_received)
+
+
+if __name__ == "__main__":
+    unittest.main()
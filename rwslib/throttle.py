@@ -0,0 +1,239 @@
+"""
+Client-side throttling for RWSConnection.
+
+Rave throttles clients that send requests too quickly, and many processes each sending requests at full speed can
+overload it. Two controls can be passed to RWSConnection:
+
+* A rate limiter (:class:`TokenBucket`, or :class:`FileTokenBucket` to share one limit between processes on a machine)
+  caps the number of requests sent per second.
+* An :class:`AIMDController` limits the number of requests in flight at once, growing the limit additively while
+  response times are stable and cutting it multiplicatively on timeouts, 5xx and 429 responses, so that throughput
+  settles at the highest level Rave can sustain without tuning.
+"""
+import json
+import os
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None
+
+
+class TokenBucket(object):
+    """A token bucket rate limiter, shared by the threads of a process"""
+
+    def __init__(self, rate, capacity=None, clock=time.monotonic, sleep=time.sleep):
+        """
+        :param float rate: Tokens (requests) added per second
+        :param float capacity: Maximum tokens held, the largest burst allowed. Defaults to `rate` (one second's worth)
+        :param clock: Function returning the current time in seconds
+        :param sleep: Function used to wait, takes a number of seconds
+        """
+        if rate <= 0:
+            raise ValueError("rate must be greater than zero")
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else max(1.0, rate))
+        self.clock = clock
+        self.sleep = sleep
+        self._tokens = self.capacity
+        self._updated = clock()
+        self._lock = threading.Lock()
+        # Total time spent waiting for tokens
+        self.time_waited = 0.0
+
+    def _take(self, tokens, now):
+        """
+        Refill the bucket and take tokens if there are enough
+
+        :return: Seconds to wait until there will be enough tokens, 0 if they were taken
+        """
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        if self._tokens >= tokens:
+            self._tokens -= tokens
+            return 0.0
+        return (tokens - self._tokens) / self.rate
+
+    def try_acquire(self, tokens=1):
+        """
+        Take tokens without waiting
+
+        :param float tokens: Tokens to take
+        :return: True if the tokens were taken
+        :rtype: bool
+        """
+        with self._lock:
+            return self._take(tokens, self.clock()) == 0
+
+    def acquire(self, tokens=1):
+        """
+        Take tokens, waiting until they are available
+
+        :param float tokens: Tokens to take
+        :return: Seconds waited
+        """
+        if tokens > self.capacity:
+            raise ValueError("Cannot acquire more tokens than the bucket capacity")
+        waited = 0.0
+        while True:
+            with self._lock:
+                wait = self._take(tokens, self.clock())
+                if wait == 0:
+                    self.time_waited += waited
+                    return waited
+            self.sleep(wait)
+            waited += wait
+
+
+class FileTokenBucket(TokenBucket):
+    """
+    A token bucket kept in a local file so that one rate limit is shared by all the processes using the file.
+
+    The file is locked while tokens are taken. Requires a platform with `fcntl` (Linux, macOS).
+    """
+
+    def __init__(self, path, rate, capacity=None, sleep=time.sleep):
+        """
+        :param str path: File holding the bucket state (created if it does not exist)
+        :param float rate: Tokens (requests) added per second, across all processes
+        :param float capacity: Maximum tokens held, the largest burst allowed. Defaults to `rate`
+        :param sleep: Function used to wait, takes a number of seconds
+        """
+        if fcntl is None:  # pragma: no cover
+            raise RuntimeError("FileTokenBucket requires fcntl file locking")
+        # Wall clock time, since a monotonic clock is not comparable between processes
+        TokenBucket.__init__(self, rate, capacity, clock=time.time, sleep=sleep)
+        self.path = path
+
+    def _take(self, tokens, now):
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            with os.fdopen(os.dup(fd), "r+") as fh:
+                try:
+                    state = json.loads(fh.read())
+                    self._tokens, self._updated = state["tokens"], state["updated"]
+                except (ValueError, KeyError, TypeError):
+                    # New or unreadable file, start with a full bucket
+                    self._tokens, self._updated = self.capacity, now
+                wait = TokenBucket._take(self, tokens, max(now, self._updated))
+                fh.seek(0)
+                fh.truncate()
+                fh.write(json.dumps(dict(tokens=self._tokens, updated=self._updated)))
+            return wait
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+            os.close(fd)
+
+
+class AIMDController(object):
+    """
+    Limits requests in flight with additive-increase/multiplicative-decrease (AIMD).
+
+    Each time a full window of requests (as many as the current limit) completes with stable response times the limit
+    is raised by `increase`; a response much slower than the baseline starts the window again. A timeout, 5xx or 429
+    response multiplies the limit by `decrease`, once for the requests in flight at the time so that a burst of
+    failures is only counted once.
+    """
+
+    def __init__(
+        self,
+        initial=4,
+        minimum=1,
+        maximum=32,
+        increase=1,
+        decrease=0.5,
+        latency_tolerance=2.0,
+    ):
+        """
+        :param int initial: Starting number of requests allowed in flight
+        :param int minimum: Lowest the limit can fall to
+        :param int maximum: Highest the limit can grow to
+        :param int increase: Amount the limit grows after a window of good responses
+        :param float decrease: Factor the limit is multiplied by after a failure
+        :param float latency_tolerance: Responses slower than this multiple of the baseline response time hold back
+            growth of the limit
+        """
+        if not 0 < decrease < 1:
+            raise ValueError("decrease must be between 0 and 1")
+        self.minimum = minimum
+        self.maximum = maximum
+        self.increase = increase
+        self.decrease = decrease
+        self.latency_tolerance = latency_tolerance
+        self.limit = max(minimum, min(maximum, initial))
+        self.in_flight = 0
+        # Smoothed lowest response time, the response time of an unloaded server
+        self.baseline = None
+        self.increases = 0
+        self.decreases = 0
+        self._successes = 0
+        self._window_start = 0
+        self._completed = 0
+        self._condition = threading.Condition()
+
+    def acquire(self):
+        """
+        Wait until another request can be put in flight
+
+        :return: Token to pass to release()
+        """
+        with self._condition:
+            while self.in_flight >= self.limit:
+                self._condition.wait()
+            self.in_flight += 1
+            return self._completed
+
+    def release(self, latency, failed=False, started=None):
+        """
+        Record the outcome of a request started with acquire()
+
+        :param float latency: Response time of the request in seconds
+        :param bool failed: Did the request time out or get an overload response (5xx or 429)?
+        :param int started: Value returned by acquire(), used to ignore failures of requests started before the
+            last decrease
+        """
+        with self._condition:
+            self.in_flight -= 1
+            self._completed += 1
+            stable = True
+            if latency is not None and not failed:
+                if self.baseline is None or latency < self.baseline:
+                    self.baseline = latency
+                else:
+                    # Let the baseline drift up slowly so one lucky response doesn't set it forever
+                    self.baseline += (latency - self.baseline) * 0.01
+                stable = latency <= self.baseline * self.latency_tolerance
+
+            if failed:
+                if started is None or started >= self._window_start:
+                    self.limit = max(self.minimum, int(self.limit * self.decrease))
+                    self.decreases += 1
+                    self._window_start = self._completed
+                self._successes = 0
+            elif not stable:
+                self._successes = 0
+            else:
+                self._successes += 1
+                if self._successes >= self.limit and self.limit < self.maximum:
+                    self.limit = min(self.maximum, self.limit + self.increase)
+                    self.increases += 1
+                    self._successes = 0
+            self._condition.notify_all()
+
+    def stats(self):
+        """
+        Current limit and counts of changes to it
+
+        :rtype: dict
+        """
+        with self._condition:
+            return dict(
+                limit=self.limit,
+                in_flight=self.in_flight,
+                baseline=self.baseline,
+                increases=self.increases,
+                decreases=self.decreases,
+            )
@@ -0,0 +1,260 @@
+"""
+Per-phase timing of calls made by RWSConnection.
+
+``RWSConnection.request_time`` is a single wall-clock figure covering connecting, waiting for Rave, downloading and
+building the result. Observers added to a connection are instead given a :class:`RequestTiming` for every call that
+breaks the time down into phases, so that slow calls can be attributed to Rave or to local processing:
+
+* ``queue_wait`` - from the call being made (or queued by send_requests) to its first HTTP attempt, including time
+  waiting on the connection's rate limiter and concurrency controller
+* ``connect`` - opening TCP/TLS connections (zero when a pooled connection is reused)
+* ``ttfb`` - from sending the request to receiving the response headers, less connecting
+* ``download`` - reading the response body (or writing it to a sink)
+* ``retry_wait`` - waiting between attempts made by a retry policy
+* ``decode`` - decoding the body: to text (``Response.text``) or, for XML results, parsing it into a tree with
+  :func:`rwslib.rwsobjects.parseXMLString` (lxml decodes the bytes as it parses them, so the two are one step)
+* ``result`` - building the result object from the text or tree, less decoding. A streamed body is read and parsed
+  as the result is built, so all of that counts as ``result``
+
+All times are in seconds.
+"""
+import contextlib
+import threading
+import time
+
+import requests
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+# Time spent connecting by the current thread, requests makes its connections in the calling thread
+_local = threading.local()
+
+
+def reset_connect_time():
+    """Start counting connection time for the current thread"""
+    _local.connect_time = 0.0
+
+
+def get_connect_time():
+    """Time spent connecting by the current thread since reset_connect_time"""
+    return getattr(_local, "connect_time", 0.0)
+
+
+def _record_connect(start):
+    _local.connect_time = get_connect_time() + time.time() - start
+
+
+class TimedHTTPConnection(HTTPConnection):
+    """An HTTP connection that records the time taken to connect"""
+
+    def connect(self):
+        start = time.time()
+        try:
+            return super(TimedHTTPConnection, self).connect()
+        finally:
+            _record_connect(start)
+
+
+class TimedHTTPSConnection(HTTPSConnection):
+    """An HTTPS connection that records the time taken to connect, including the TLS handshake"""
+
+    def connect(self):
+        start = time.time()
+        try:
+            return super(TimedHTTPSConnection, self).connect()
+        finally:
+            _record_connect(start)
+
+
+class TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = TimedHTTPConnection
+
+
+class TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = TimedHTTPSConnection
+
+
+class TimedHTTPAdapter(requests.adapters.HTTPAdapter):
+    """An HTTPAdapter whose connections record the time taken to connect"""
+
+    def init_poolmanager(self, *args, **kwargs):
+        super(TimedHTTPAdapter, self).init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": TimedHTTPConnectionPool,
+            "https": TimedHTTPSConnectionPool,
+        }
+
+
+def reset_decode_time():
+    """Start counting decoding time for the current thread"""
+    _local.decode_time = 0.0
+
+
+def get_decode_time():
+    """Time spent decoding by the current thread since reset_decode_time"""
+    return getattr(_local, "decode_time", 0.0)
+
+
+@contextlib.contextmanager
+def timed_decode():
+    """Count the time spent in the block as decoding by the current thread"""
+    start = time.time()
+    try:
+        yield
+    finally:
+        _local.decode_time = get_decode_time() + time.time() - start
+
+
+class TimedResponse(requests.models.Response):
+    """A Response that counts the time spent decoding its body to text"""
+
+    @property
+    def text(self):
+        with timed_decode():
+            return requests.models.Response.text.fget(self)
+
+
+def time_decoding(response):
+    """
+    Count the time spent decoding a response to text, see timed_decode
+
+    :param requests.models.Response response: Response to time
+    """
+    if type(response) is requests.models.Response:
+        response.__class__ = TimedResponse
+    return response
+
+
+class RequestTiming(object):
+    """Timings and sizes for one call to RWS"""
+
+    PHASES = ("queue_wait", "connect", "ttfb", "download", "retry_wait", "decode", "result")
+
+    def __init__(self, request_object, method=None, url=None, started=None):
+        """
+        :param rwslib.rws_requests.RWSRequest request_object: Request being made
+        :param str method: HTTP method
+        :param str url: Full URL called
+        :param float started: Time (as from time.time()) the call was made or queued, defaults to now
+        """
+        self.request_name = type(request_object).__name__
+        self.method = method or request_object.method
+        self.url = url
+        self.status_code = None
+        self.from_cache = False
+        self.shared = False
+        self.retries = 0
+        for phase in self.PHASES:
+            setattr(self, phase, 0.0)
+        self.total = None
+        self.bytes_sent = 0
+        # Size of request bodies before compression (the same as bytes_sent if they were not compressed)
+        self.bytes_sent_uncompressed = 0
+        # rwslib.compression.CompressionStats for a compressed request body
+        self.compression = None
+        # Bytes read from the network (compressed size if the response was compressed)
+        self.bytes_received = 0
+        # Size of the decoded response body
+        self.content_bytes = 0
+        self.exception = None
+        self.started = started or time.time()
+        self._attempts = 0
+
+    def __repr__(self):
+        return "<RequestTiming %s %s status=%s total=%s>" % (
+            self.request_name,
+            self.url,
+            self.status_code,
+            "%.3f" % self.total if self.total is not None else None,
+        )
+
+    def add_attempt(self, start, end, response, connect_time):
+        """
+        Record the network phases of an HTTP attempt
+
+        :param float start: Time the request was sent
+        :param float end: Time the response was returned by requests
+        :param requests.models.Response response: Response received
+        :param float connect_time: Time spent connecting during the attempt
+        """
+        if self._attempts == 0:
+            self.queue_wait = max(0.0, start - self.started)
+        self._attempts += 1
+        headers_time = response.elapsed.total_seconds()
+        self.connect += connect_time
+        self.ttfb += max(0.0, headers_time - connect_time)
+        self.download += max(0.0, (end - start) - headers_time)
+        self.status_code = response.status_code
+        body = getattr(response.request, "body", None)
+        if isinstance(body, (bytes, str)):
+            self.bytes_sent += len(body)
+            if self.compression is not None:
+                self.bytes_sent_uncompressed += self.compression.uncompressed_bytes
+            else:
+                self.bytes_sent_uncompressed += len(body)
+
+    def add_sizes(self, response):
+        """
+        Record the bytes received for a response whose body has been read
+
+        :param requests.models.Response response: Response
+        """
+        self.content_bytes = len(response.content)
+        try:
+            self.bytes_received = response.raw.tell()
+        except AttributeError:
+            self.bytes_received = self.content_bytes
+
+    def finish(self, exception=None):
+        """Mark the call as complete"""
+        self.total = time.time() - self.started
+        self.exception = exception
+
+    def as_dict(self):
+        """
+        Timings and sizes as a dict, e.g. for export to a metrics system
+
+        :rtype: dict
+        """
+        values = dict(
+            request_name=self.request_name,
+            method=self.method,
+            url=self.url,
+            status_code=self.status_code,
+            from_cache=self.from_cache,
+            shared=self.shared,
+            retries=self.retries,
+            total=self.total,
+            bytes_sent=self.bytes_sent,
+            bytes_sent_uncompressed=self.bytes_sent_uncompressed,
+            bytes_received=self.bytes_received,
+            content_bytes=self.content_bytes,
+            exception=type(self.exception).__name__ if self.exception is not None else None,
+        )
+        for phase in self.PHASES:
+            values[phase] = getattr(self, phase)
+        return values
+
+
+class RequestObserver(object):
+    """Base class for observers of the calls made by an RWSConnection"""
+
+    def on_request(self, timing):
+        """
+        Called when a call completes, whether it succeeded or raised
+
+        :param RequestTiming timing: Timings for the call
+        """
+        raise NotImplementedError("Override on_request in descendants of RequestObserver")
+
+
+class TimingLog(RequestObserver):
+    """An observer that keeps the timings of the calls it sees"""
+
+    def __init__(self):
+        self.timings = []
+        self._lock = threading.Lock()
+
+    def on_request(self, timing):
+        with self._lock:
+            self.timings.append(timing)